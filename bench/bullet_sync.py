@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Bytes per second of bullet data in multiplayer update packets: the old scheme (every bullet's position in every packet) versus bullet events
+# (src/bulletsync.py), for different numbers of bullets in flight. The shooter keeps N bullets alive by firing a new one whenever one dies; packets
+# travel through a simulated link with LATENCY frames of delay each way and LOSS packet loss. We also check how far the receiver's copies of the
+# bullets are from the real ones.
+# Run from anywhere: python3 bench/bullet_sync.py
+
+import sys, os, math, random, collections
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import src.mplib as mplib
+from settings import settings
+from src.body import Body
+from src.bullet_swarm import BulletSwarm
+from src.bulletsync import BulletSender, BulletReceiver
+
+SCREENSIZE = (1900, 980)
+FRAMES = 1200
+LATENCY = 4  # frames, one way
+LOSS = 0.05
+FPS = settings['Game.FPS'].val
+
+
+class Link:
+    # Delivers packets LATENCY frames later, losing some
+    def __init__(self, rng):
+        self.rng = rng
+        self.queue = collections.deque()
+
+    def send(self, frame, msg):
+        if self.rng.random() >= LOSS:
+            self.queue.append((frame + LATENCY, msg))
+
+    def receive(self, frame):
+        while len(self.queue) > 0 and self.queue[0][0] <= frame:
+            yield self.queue.popleft()[1]
+
+
+def fire(swarm, sender, frame, rng):
+    # Somewhere on a ring around the gravity well, at about orbital speed, so bullets live for a while like in a real game
+    radius = rng.uniform(150, 400)
+    angle = rng.uniform(0, 2 * math.pi)
+    speed = math.sqrt(Body.GRAVITATIONAL_CONSTANT * settings['GW.mass'].val / radius) * rng.uniform(0.8, 1.2)
+    x, y = radius * math.cos(angle), radius * math.sin(angle)
+    xspeed, yspeed = -speed * math.sin(angle), speed * math.cos(angle)
+    bulletid = swarm.add(x, y, xspeed, yspeed)
+    sender.spawned(bulletid, frame, x, y, xspeed, yspeed)
+
+
+def bench(numbullets):
+    rng = random.Random(numbullets)
+    swarm = BulletSwarm()
+    sender = BulletSender(swarm)
+    receiver = BulletReceiver()
+    theirsender = BulletSender(BulletSwarm())  # the other side shoots nothing but still sends packets, carrying the acks
+    ourreceiver = BulletReceiver()
+    there = Link(rng)
+    back = Link(rng)
+
+    header = 1 + mplib.updatestruct.size
+    oldbytes = 0
+    newbytes = 0
+    toobig = 0
+    errors = []
+    for frame in range(FRAMES):
+        while len(swarm) < numbullets:
+            fire(swarm, sender, frame, rng)
+        swarm.advance(SCREENSIZE)
+        receiver.advance(SCREENSIZE)
+
+        oldsize = header + len(swarm) * mplib.bulletstruct.size
+        oldbytes += oldsize
+        toobig += oldsize > mplib.maximumsize
+
+        msg = sender.pack(ourreceiver.lastseqno, frame)
+        newbytes += header + len(msg)
+        there.send(frame, msg)
+        back.send(frame, theirsender.pack(receiver.lastseqno, frame))
+
+        for msg in there.receive(frame):
+            theirsender.acked(receiver.receive(msg, SCREENSIZE))
+        for msg in back.receive(frame):
+            sender.acked(ourreceiver.receive(msg, SCREENSIZE))
+
+        # The receiver shows bullets as they were LATENCY frames ago, like it shows the remote player; compare against that
+        if frame >= FRAMES // 2:
+            errors.extend(positionErrors(receiver.swarm, swarm))
+
+    seconds = FRAMES / FPS
+    return oldbytes / seconds, newbytes / seconds, toobig / FRAMES, numpy.percentile(errors, 99) if len(errors) > 0 else 0
+
+
+def positionErrors(copy, real):
+    # Per bullet in both swarms: distance from the copy to where the real bullet is, in pixels, minus LATENCY frames of its movement
+    common, ci, ri = numpy.intersect1d(copy.ids[ : copy.count], real.ids[ : real.count] & 0xFFFF, return_indices=True)
+    distance = numpy.hypot(copy.x[ci] - real.x[ri], copy.y[ci] - real.y[ri])
+    travelled = numpy.hypot(real.xspeed[ri], real.yspeed[ri]) * settings['Game.timeStep'].val * LATENCY
+    return numpy.maximum(0, distance - travelled).tolist()
+
+
+print(f'{FRAMES} frames at {FPS} FPS, {LATENCY} frames latency each way, {LOSS * 100:g}% loss; bytes/s include the update header')
+print(f'{"bullets":>8} {"old B/s":>10} {"events B/s":>11} {"ratio":>7} {"old > max size":>15} {"p99 error px":>13}')
+for numbullets in (0, 10, 50, 100, 340, 1000):
+    old, new, toobig, error = bench(numbullets)
+    print(f'{numbullets:>8} {old:>10.0f} {new:>11.0f} {old / new:>7.1f} {toobig * 100:>14.0f}% {error:>13.1f}')
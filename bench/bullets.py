@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Frame time of the bullet simulation at various bullet counts, comparing the BulletSwarm engine with per-object Bullet instances
+# Run from anywhere: python3 bench/bullets.py
+
+import sys, os, math, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import settings
+from src.body import Body
+from src.bullet_swarm import BulletSwarm
+
+SCREENSIZE = (1900, 980)
+COUNTS = (10, 1000, 100000)
+FRAMES = 200
+LEGACY_MAX_WORK = 2000000  # bullet-steps; the per-object implementation is measured on fewer frames to keep the run short
+
+
+def orbits(n, rng):
+    # circular-ish orbits that stay on the screen, so the bullet count stays constant while measuring
+    gm = settings['GW.mass'].val * Body.GRAVITATIONAL_CONSTANT
+    for _ in range(n):
+        r = rng.uniform(100, 450)
+        a = rng.uniform(0, 2 * math.pi)
+        v = math.sqrt(gm / r)
+        yield (r * math.cos(a), r * math.sin(a), -v * math.sin(a), v * math.cos(a))
+
+
+def benchSwarm(n):
+    swarm = BulletSwarm()
+    for bullet in orbits(n, random.Random(1)):
+        swarm.add(*bullet)
+
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        swarm.advance(SCREENSIZE)
+        swarm.collide(300, 0, 20)
+    return (time.perf_counter() - start) / FRAMES, len(swarm)
+
+
+def benchLegacy(n):
+    import pygame
+
+    class LegacyBullet(pygame.sprite.Sprite, Body):
+        # the per-object approach that BulletSwarm replaced: one sprite with its own vectors and rect per bullet
+        def __init__(self, x, y, xspeed, yspeed):
+            pygame.sprite.Sprite.__init__(self)
+            Body.__init__(self, pos=pygame.math.Vector2(x, y), speed=pygame.math.Vector2(xspeed, yspeed), mass=settings['Bullet.mass'].val)
+            self.rect = pygame.rect.Rect(0, 0, settings['Bullet.size'].val, settings['Bullet.size'].val)
+
+        def advance(self, screensize):
+            separation = Body.advance(self)
+            if separation < settings['Bullet.size'].val:
+                return True
+            self.rect.center = (int(round(self.pos.x)), int(round(self.pos.y)))
+            return abs(self.pos.x) > (screensize[0] / 2) * (1 + BulletSwarm.MAX_OUT_OF_SCREEN) or abs(self.pos.y) > (screensize[1] / 2) * (1 + BulletSwarm.MAX_OUT_OF_SCREEN)
+
+    target = pygame.sprite.Sprite()
+    target.rect = pygame.rect.Rect(0, 0, 40, 40)
+    target.rect.center = (300, 0)
+
+    bullets = pygame.sprite.Group()
+    for bullet in orbits(n, random.Random(1)):
+        bullets.add(LegacyBullet(*bullet))
+
+    frames = max(1, min(FRAMES, LEGACY_MAX_WORK // n))
+    start = time.perf_counter()
+    for _ in range(frames):
+        removebullets = [bullet for bullet in bullets if bullet.advance(SCREENSIZE)]
+        for bullet in removebullets:
+            bullets.remove(bullet)
+        for bullet in pygame.sprite.spritecollide(target, bullets, False, pygame.sprite.collide_circle):
+            bullets.remove(bullet)
+    return (time.perf_counter() - start) / frames, len(bullets)
+
+
+try:
+    import pygame
+    havePygame = True
+except ImportError:
+    havePygame = False
+    print('pygame not found, only measuring BulletSwarm')
+
+print(f'{"bullets":>8} {"swarm ms/frame":>15} {"legacy ms/frame":>16} {"speedup":>8}')
+for n in COUNTS:
+    swarmtime, remaining = benchSwarm(n)
+    if havePygame:
+        legacytime, _ = benchLegacy(n)
+        print(f'{n:>8} {swarmtime * 1000:>15.3f} {legacytime * 1000:>16.3f} {legacytime / swarmtime:>7.1f}x')
+    else:
+        print(f'{n:>8} {swarmtime * 1000:>15.3f} {"-":>16} {"-":>8}')
+
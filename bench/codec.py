@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Update packets, encoded and decoded the old way (msg += per bullet when sending, slicing off one bullet at a time when receiving) versus
+# src/codec.py, for 0 to 340 bullets in a type 0 packet (340 is about what fits in mplib.maximumsize), and for type 4 packets with bullet events.
+# Before timing anything, we check that everything survives a round trip.
+# Run from anywhere: python3 bench/codec.py
+
+import sys, os, random, timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import src.mplib as mplib
+import src.codec as codec
+from src.bullet_swarm import BulletSwarm
+from src.bulletsync import BulletSender, BulletReceiver
+
+SCREENSIZE = (1900, 980)
+COUNTS = (0, 10, 50, 100, 200, 340)
+
+
+def oldEncode(fields, swarm):
+    # Game.sendUpdatePacket before the codec
+    msg = b'\x00' + mplib.updatestruct.pack(*fields)
+    for x, y in swarm.positions():
+        msg += mplib.bulletstruct.pack(x, y)
+    return msg
+
+
+def oldDecode(msg):
+    # Game.processIncomingPacket before the codec
+    fields = mplib.updatestruct.unpack(msg[1 : 1 + mplib.updatestruct.size])
+    msg = msg[1 + mplib.updatestruct.size : ]
+    remotebullets = []
+    while len(msg) > 0:
+        x, y = mplib.bulletstruct.unpack(msg[ : mplib.bulletstruct.size])
+        remotebullets.append((x, y))
+        msg = msg[mplib.bulletstruct.size : ]
+    return fields, remotebullets
+
+
+def codecDecode(msg):
+    _, fields, payload = codec.decodeUpdate(msg)
+    return fields, codec.decodePositions(payload)
+
+
+def numpyDecode(msg):
+    # The alternative that codec.decodePositions does not use: numpy is quick, until we need Python numbers out of it
+    _, fields, payload = codec.decodeUpdate(msg)
+    return fields, numpy.frombuffer(payload, dtype='>i2', count=len(payload) // mplib.bulletstruct.size * 2).reshape((-1, 2)).tolist()
+
+
+def randomFields(rng):
+    return (rng.randint(0, 2 ** 32 - 1), rng.randint(-1000, 2900), rng.randint(-1000, 1980), rng.randint(-1000, 1000), rng.randint(-1000, 1000),
+            rng.randint(0, 239), rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+
+
+def randomSwarm(rng, n):
+    swarm = BulletSwarm()
+    for _ in range(n):
+        swarm.add(rng.uniform(-950, 950), rng.uniform(-490, 490), rng.uniform(-50, 50), rng.uniform(-50, 50))
+    return swarm
+
+
+def checkRoundTrips():
+    rng = random.Random(1)
+    encoder = codec.UpdateEncoder()
+    for n in COUNTS:
+        for _ in range(20):
+            fields = randomFields(rng)
+            swarm = randomSwarm(rng, n)
+            n_ = swarm.count
+            msg = bytes(encoder.positions(fields, swarm.x[ : n_], swarm.y[ : n_]))
+            assert msg == oldEncode(fields, swarm), 'type 0 packets must be byte for byte what older clients send'
+            version, decodedfields, payload = codec.decodeUpdate(msg)
+            assert version == codec.UPDATE_POSITIONS and decodedfields == fields
+            assert oldDecode(msg) == codecDecode(msg) == (fields, list(swarm.positions()))
+            assert numpyDecode(msg)[1] == [list(position) for position in swarm.positions()]
+
+    # a partial bullet at the end is ignored rather than an error
+    assert len(codec.decodePositions(codec.decodeUpdate(msg + b'\x01')[2])) == n
+    try:
+        encoder.positions(fields, numpy.zeros(400), numpy.zeros(400))
+        raise AssertionError('400 bullets should not fit')
+    except ValueError:
+        pass
+    try:
+        codec.decodeUpdate(b'\x07' + bytes(mplib.updatestruct.size))
+        raise AssertionError('type 7 is not an update')
+    except ValueError:
+        pass
+
+    # type 4: the bullet events get every bullet to the receiver, in the same place
+    for n in COUNTS:
+        sender = BulletSender(BulletSwarm())
+        receiver = BulletReceiver()
+        for _ in range(n):
+            x, y = rng.choice((-1, 1)) * rng.uniform(100, 400), rng.choice((-1, 1)) * rng.uniform(100, 400)
+            sender.spawned(sender.swarm.add(x, y, 1, 1), 7, x, y, 1, 1)
+        sender.swarm.advance(SCREENSIZE)  # they were fired in frame 7, which also moves them, like in Game.simulate
+        fields = randomFields(rng)
+        while len(sender.pending) > 0:
+            version, decodedfields, payload = codec.decodeUpdate(bytes(encoder.events(fields, sender, 0, 7)))
+            assert version == codec.UPDATE_EVENTS and decodedfields == fields
+            receiver.receive(payload, SCREENSIZE)
+            sender.acked(receiver.lastseqno)
+        assert len(receiver.swarm) == n and numpy.allclose(receiver.swarm.getState(), sender.swarm.getState())
+    print('Round trips OK')
+
+
+def bench():
+    rng = random.Random(2)
+    encoder = codec.UpdateEncoder()
+    print(f'{"bullets":>8} {"old encode µs":>14} {"codec µs":>9} {"old decode µs":>14} {"codec µs":>9} {"numpy µs":>9}')
+    for n in COUNTS:
+        fields = randomFields(rng)
+        swarm = randomSwarm(rng, n)
+        msg = oldEncode(fields, swarm)
+        results = []
+        for statement in (
+            lambda: oldEncode(fields, swarm),
+            lambda: encoder.positions(fields, swarm.x[ : swarm.count], swarm.y[ : swarm.count]),
+            lambda: oldDecode(msg),
+            lambda: codecDecode(msg),
+            lambda: numpyDecode(msg),
+        ):
+            number, _ = timeit.Timer(statement).autorange()
+            results.append(min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6)
+        print(f'{n:>8} {results[0]:>14.1f} {results[1]:>9.1f} {results[2]:>14.1f} {results[3]:>9.1f} {results[4]:>9.1f}')
+
+
+checkRoundTrips()
+bench()
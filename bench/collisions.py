@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Cost of the collision checks per frame at various bullet counts, and of the broad phases that were considered for them.
+# 1. Bullets versus both players, with the bullets orbiting all over the screen and advanced every frame in between (not counted):
+#    every bullet:  the exact circle test for every bullet (what BulletSwarm.collide does below COLUMN_MIN)
+#    column:        first picking out the bullets in the player's column (what it does from COLUMN_MIN on)
+#    sorted sweep:  keeping the bullets sorted by x, re-sorting last frame's (nearly sorted) order every frame, and binary searching the column. The
+#                   searches are cheap, but because every bullet moves every frame, the re-sort costs more than the test it saves
+#    uniform grid:  bucketing the bullets into square cells every frame (argsort of the cell numbers, bincount for where each cell starts), then testing
+#                   only the bullets in the cells that the circle touches. Same problem: the rebuild is a sort of every bullet every frame, which costs
+#                   more than the one subtraction and comparison per bullet that the column needs
+# 2. Player versus player: collide_mask alone versus first checking whether the circles around the masks overlap. collide_mask already returns
+#    early in C when the sprites' rects do not overlap, so the extra check only adds time
+# Run from anywhere: python3 bench/collisions.py
+
+import sys, os, math, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))
+
+import client
+from settings import settings
+from src.setting import Setting
+from src.body import Body
+from src.bullet_swarm import BulletSwarm
+
+client.args = {'headless': True}
+SCREENSIZE = (1900, 980)
+COUNTS = (100, 1000, 3000, 10000, 20000, 30000, 100000)
+FRAMES = 200
+MASKCHECKS = 100000
+PLAYERRADIUS = 21.8  # about Player.collisionRadius
+
+
+def orbits(n, rng):
+    # Like in bench/bullets.py: circular-ish orbits that stay on the screen, so the bullet count stays about constant while measuring
+    gm = settings['GW.mass'].val * Body.GRAVITATIONAL_CONSTANT
+    for _ in range(n):
+        r = rng.uniform(100, 450)
+        a = rng.uniform(0, 2 * math.pi)
+        v = math.sqrt(gm / r)
+        yield (r * math.cos(a), r * math.sin(a), -v * math.sin(a), v * math.cos(a))
+
+
+class SortedSweep:
+    # The sort-and-sweep broad phase, as a stand-in for BulletSwarm.collide
+    def __init__(self, swarm):
+        self.swarm = swarm
+        self.order = None
+
+    def collide(self, x, y, radius):
+        swarm = self.swarm
+        n = swarm.count
+        if self.order is None or len(self.order) != n:
+            self.order = numpy.argsort(swarm.x[ : n], kind='stable')
+        else:
+            self.order = self.order[numpy.argsort(swarm.x[ : n][self.order], kind='stable')]
+        sortedx = swarm.x[ : n][self.order]
+        reach = radius + Setting.frozen.bulletReach
+        near = self.order[numpy.searchsorted(sortedx, x - reach - 1, 'left') : numpy.searchsorted(sortedx, x + reach + 1, 'right')]
+        dx = swarm.x[near] - x
+        dy = swarm.y[near] - y
+        near = numpy.sort(near[(dx * dx) + (dy * dy) <= reach * reach])
+        if len(near) == 0:
+            return []
+        hit = numpy.zeros(n, dtype=bool)
+        hit[near] = True
+        positions = list(zip(swarm.x[ : n][hit].tolist(), swarm.y[ : n][hit].tolist()))
+        # the remaining bullets keep their order, so only their indices shift down
+        self.order = (numpy.cumsum(~hit) - 1)[self.order[~hit[self.order]]]
+        swarm.compact(~hit)
+        return positions
+
+
+class UniformGrid:
+    # The uniform grid broad phase, as a stand-in for BulletSwarm.collide. rebuild() every frame after the bullets moved.
+    CELL = 32  # px, a bit more than a player's circle is wide, so that it touches 2x2 cells at most
+
+    def __init__(self, swarm):
+        self.swarm = swarm
+        self.columns = int(math.ceil(SCREENSIZE[0] / UniformGrid.CELL))
+        self.rows = int(math.ceil(SCREENSIZE[1] / UniformGrid.CELL))
+
+    def column(self, x):
+        return numpy.clip(numpy.floor((x + (SCREENSIZE[0] / 2)) / UniformGrid.CELL).astype(numpy.intp), 0, self.columns - 1)
+
+    def row(self, y):
+        return numpy.clip(numpy.floor((y + (SCREENSIZE[1] / 2)) / UniformGrid.CELL).astype(numpy.intp), 0, self.rows - 1)
+
+    def rebuild(self):
+        n = self.swarm.count
+        self.cells = (self.row(self.swarm.y[ : n]) * self.columns) + self.column(self.swarm.x[ : n])
+        self.order = numpy.argsort(self.cells, kind='stable')  # the bullets, cell by cell
+        self.index()
+
+    def index(self):
+        # where each cell's bullets start in self.order
+        self.starts = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(self.cells, minlength=self.rows * self.columns))))
+
+    def collide(self, x, y, radius):
+        swarm = self.swarm
+        n = swarm.count
+        reach = radius + Setting.frozen.bulletReach
+        left, right = int(self.column(x - reach - 1)), int(self.column(x + reach + 1))
+        # within a row, the cells from left to right are next to each other in self.order
+        near = numpy.concatenate([self.order[self.starts[(row * self.columns) + left] : self.starts[(row * self.columns) + right + 1]]
+                                  for row in range(int(self.row(y - reach - 1)), int(self.row(y + reach + 1)) + 1)])
+        dx = swarm.x[near] - x
+        dy = swarm.y[near] - y
+        near = numpy.sort(near[(dx * dx) + (dy * dy) <= reach * reach])
+        if len(near) == 0:
+            return []
+        hit = numpy.zeros(n, dtype=bool)
+        hit[near] = True
+        positions = list(zip(swarm.x[ : n][hit].tolist(), swarm.y[ : n][hit].tolist()))
+        # the remaining bullets keep their cells and order, so only their indices shift down
+        self.order = (numpy.cumsum(~hit) - 1)[self.order[~hit[self.order]]]
+        self.cells = self.cells[~hit]
+        self.index()
+        swarm.compact(~hit)
+        return positions
+
+
+def benchCollide(n, method):
+    swarm = BulletSwarm()
+    for bullet in orbits(n, random.Random(1)):
+        swarm.add(*bullet)
+    sweep = SortedSweep(swarm)
+    grid = UniformGrid(swarm)
+    BulletSwarm.COLUMN_MIN = float('inf') if method == 'every bullet' else 0
+    collide = sweep.collide if method == 'sorted sweep' else grid.collide if method == 'uniform grid' else swarm.collide
+
+    spent = 0
+    hits = 0
+    for frame in range(FRAMES):
+        swarm.advance(SCREENSIZE)
+        # the players orbit too, at 300 px
+        a = frame / 100
+        start = time.perf_counter()
+        if method == 'uniform grid':
+            grid.rebuild()
+        hits += len(collide(300 * math.cos(a), 300 * math.sin(a), PLAYERRADIUS))
+        hits += len(collide(-300 * math.cos(a), -300 * math.sin(a), PLAYERRADIUS))
+        spent += time.perf_counter() - start
+    return spent / FRAMES * 1e6, hits
+
+
+def circlesThenMask(a, b):
+    # A mask's pixels all lie within collisionRadius of the mask's middle, and collide_mask puts the mask's top left corner at the rect's top left corner
+    (aw, ah), (bw, bh) = a.spr.mask.get_size(), b.spr.mask.get_size()
+    dx = (b.spr.rect.x + (bw / 2)) - (a.spr.rect.x + (aw / 2))
+    dy = (b.spr.rect.y + (bh / 2)) - (a.spr.rect.y + (ah / 2))
+    reach = a.collisionRadius + b.collisionRadius + 1
+    if (dx * dx) + (dy * dy) > reach * reach:
+        return None
+    return pygame.sprite.collide_mask(a.spr, b.spr)
+
+
+def benchPlayers(distance):
+    a, b = client.Player(1), client.Player(2)
+    for player in (a, b):
+        player.angle = 45
+        player.updateRotatedSprite()
+    a.spr.rect.center = (0, 0)
+    b.spr.rect.center = (distance, 0)
+    start = time.perf_counter()
+    for _ in range(MASKCHECKS):
+        pygame.sprite.collide_mask(a.spr, b.spr)
+    maskonly = (time.perf_counter() - start) / MASKCHECKS * 1e6
+    start = time.perf_counter()
+    for _ in range(MASKCHECKS):
+        circlesThenMask(a, b)
+    circlesfirst = (time.perf_counter() - start) / MASKCHECKS * 1e6
+    return maskonly, circlesfirst
+
+
+columnmin = BulletSwarm.COLUMN_MIN
+methods = ('every bullet', 'column', 'sorted sweep', 'uniform grid')
+print(f'Bullets versus two players per frame, µs (BulletSwarm.COLUMN_MIN is {columnmin})')
+print(f'{"bullets":>8}' + ''.join(f' {method:>13}' for method in methods) + f' {"hits":>6}')
+for n in COUNTS:
+    results = [benchCollide(n, method) for method in methods]
+    assert len(set(hits for _, hits in results)) == 1
+    print(f'{n:>8}' + ''.join(f' {spent:>13.1f}' for spent, _ in results) + f' {results[0][1]:>6}')
+BulletSwarm.COLUMN_MIN = columnmin
+
+print()
+print('Player versus player, µs')
+print(f'{"distance":>8} {"collide_mask":>13} {"circles first":>14}')
+for distance in (600, 30, 0):
+    maskonly, circlesfirst = benchPlayers(distance)
+    print(f'{distance:>8} {maskonly:>13.2f} {circlesfirst:>14.2f}')
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# How well we see the remote player in multiplayer, for different update rates: the old way (jump to the position in every update, 60 per second)
+# versus extrapolating their flight in between updates and gliding towards corrections (Player.extrapolate and Player.applyUpdate).
+# The remote player orbits the star and thrusts now and then like a human would; updates travel LATENCY frames and LOSS of them get lost.
+# The error is the distance between where we show them and where they were LATENCY frames ago, which is the best we could know.
+# Run from anywhere: python3 bench/dead_reckoning.py
+
+import sys, os, random, collections
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))  # Player needs a display mode for its sprite
+
+import client
+import src.mplib as mplib
+import src.codec as codec
+import src.botlib as botlib
+import src.bulletsync as bulletsync
+from settings import settings
+
+FRAMES = 3600
+LATENCY = 4  # frames, one way
+LOSS = 0.05
+FPS = settings['Game.FPS'].val
+PACKETSIZE = 1 + mplib.updatestruct.size + bulletsync.headerstruct.size + 28  # an update without bullet events, plus IPv4 and UDP headers
+
+
+def newPlayer(n):
+    player = client.Player(n)
+    player.pos = pygame.math.Vector2(settings[f'Player{n}.x'].val, settings[f'Player{n}.y'].val)
+    player.speed = pygame.math.Vector2(settings[f'Player{n}.xspeed'].val, settings[f'Player{n}.yspeed'].val)
+    player.mass = settings['Player.mass'].val
+    return player
+
+
+def bench(rate, deadreckoning):
+    rng = random.Random(1)
+    encoder = codec.UpdateEncoder()
+    sender = newPlayer(1)
+    receiver = newPlayer(1)  # our copy of the sender
+    history = []
+    inflight = collections.deque()
+    credit = 1
+    packets = 0
+    errors = []
+    actions = []
+    burstuntil = 0
+    for frame in range(FRAMES):
+        # short bursts of rotating and thrusting, a bit like a human playing
+        if frame >= burstuntil:
+            actions = []
+            if rng.random() < 0.03:
+                actions = rng.choice(([botlib.Action.THRUST], [botlib.Action.ROTATE_LEFT], [botlib.Action.ROTATE_RIGHT], [botlib.Action.THRUST, botlib.Action.ROTATE_LEFT]))
+                burstuntil = frame + rng.randint(5, 20)
+        sender.perform_actions(actions)
+        sender.batterylevel = settings['Player.battSize'].val
+        sender.advance()
+        sender.wrap()
+        history.append(pygame.math.Vector2(sender.pos))
+
+        credit += rate / FPS
+        if credit >= 1:
+            credit = min(1, credit - 1)
+            packets += 1
+            if rng.random() >= LOSS:
+                # through the update packet, which rounds and clips them, and read back like Game.applyRemoteUpdate does
+                _, (_, x, y, xspeed, yspeed, _, _, _, _), _ = codec.decodeUpdate(bytes(encoder.positions(sender.updateFields(), [], [])))
+                inflight.append((frame + LATENCY, pygame.math.Vector2(x, y), pygame.math.Vector2(xspeed / 100, yspeed / 100)))
+
+        if deadreckoning:
+            receiver.extrapolate()
+        while len(inflight) > 0 and inflight[0][0] <= frame:
+            _, pos, speed = inflight.popleft()
+            if deadreckoning:
+                receiver.applyUpdate(pos, speed)
+            else:
+                receiver.pos = pos
+                receiver.speed = speed
+
+        if frame >= 2 * LATENCY:  # once updates are coming in
+            errors.append(receiver.pos.distance_to(history[frame - LATENCY]))
+
+    seconds = FRAMES / FPS
+    return packets / seconds, numpy.percentile(errors, [50, 99]), max(errors)
+
+
+print(f'{FRAMES} frames at {FPS} FPS, {LATENCY} frames latency, {LOSS * 100:g}% loss; bytes/s per player include IP and UDP headers, not bullet events')
+print(f'{"receiver":>15} {"updates/s":>10} {"bytes/s":>8} {"p50 error px":>13} {"p99 px":>7} {"max px":>7}')
+for name, rate, deadreckoning in (('jump (old)', 60, False), ('extrapolate', 60, True), ('extrapolate', 30, True), ('extrapolate', 20, True), ('extrapolate', 15, True)):
+    packetrate, (p50, p99), maxerror = bench(rate, deadreckoning)
+    print(f'{name:>15} {packetrate:>10.1f} {packetrate * PACKETSIZE:>8.0f} {p50:>13.2f} {p99:>7.2f} {maxerror:>7.2f}')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# How fast --zeroplayer fast-forward plays with the FixedTimestep main loop versus drawing after every game step, as the old loop did.
+# The game is client.Game with random pilots (as in bench/headless.py); drawing is stood in for by waiting FLIP seconds, which is what
+# pygame.display.flip() does with vsync on a 60 Hz display. Achieved is game speed relative to real time (1 = Game.FPS steps per second), for
+# a few seconds of each. With FixedTimestep it should reach the requested speed until the physics cannot keep up, regardless of FLIP.
+# Run from anywhere: python3 bench/fast_forward.py
+
+import sys, os, time, random, contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))
+
+import client
+import src.botlib as botlib
+from settings import settings
+from src.game_state import GameState
+from src.timestep import FixedTimestep
+
+client.args = {'headless': True}
+FLIP = 1 / 60
+DURATION = 3  # real seconds per measurement
+RENDERRATE = 60
+
+
+class RandomPilot:
+    # Holds some keys for a while, then others, and shoots a lot (like in bench/headless.py)
+    def __init__(self, rng):
+        self.rng = rng
+        self.actions = []
+        self.until = 0
+
+    def step(self, frame):
+        if frame >= self.until:
+            self.actions = self.rng.sample(list(botlib.Action), self.rng.randint(0, 3))
+            self.until = frame + self.rng.randint(3, 30)
+        return self.actions + ([botlib.Action.SHOOT] if self.rng.random() < 0.5 else [])
+
+
+class Match:
+    def __init__(self):
+        self.game = client.Game([client.Player(1), client.Player(2)], singleplayer=True, roundRestartTime=0)
+        self.pilots = [RandomPilot(random.Random(1)), RandomPilot(random.Random(2))]
+        self.frame = 0
+        self.newRound()
+
+    def newRound(self):
+        with contextlib.redirect_stdout(None):
+            self.game.initSinglePlayer()
+        self.game.state = GameState.PLAYERING
+
+    def tick(self):
+        with contextlib.redirect_stdout(None):
+            result = self.game.simulate([pilot.step(self.frame) for pilot in self.pilots])
+        if result is not None:
+            self.newRound()
+        self.frame += 1
+
+
+def perTick(speed):
+    # The old loop: one step, one flip, and the FPS limiter at Game.FPS / speed (the division made higher speeds slower)
+    match = Match()
+    fpslimiter = pygame.time.Clock()
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        match.tick()
+        time.sleep(FLIP)
+        if speed < float('inf'):
+            fpslimiter.tick(settings['Game.FPS'].val / speed)
+    return match.frame, match.frame / (time.perf_counter() - start) / settings['Game.FPS'].val
+
+
+def fixedTimestep(speed):
+    match = Match()
+    fpslimiter = pygame.time.Clock()
+    start = time.perf_counter()
+    timestep = FixedTimestep(settings['Game.FPS'].val * speed, RENDERRATE, start)
+    frames = 0
+    while time.perf_counter() - start < DURATION:
+        timestep.startFrame(time.perf_counter())
+        while timestep.due(time.perf_counter()):
+            match.tick()
+        time.sleep(FLIP)
+        frames += 1
+        if speed < float('inf'):
+            fpslimiter.tick(RENDERRATE)
+    return match.frame, match.frame / (time.perf_counter() - start) / settings['Game.FPS'].val, frames
+
+
+print(f'Drawing takes {FLIP * 1000:.1f} ms, {DURATION} s per row')
+print(f'{"speed":>6} {"loop":>15} {"steps":>7} {"achieved":>9} {"frames drawn":>13}')
+for speed in (1, 10, float('inf')):
+    steps, achieved = perTick(speed)
+    print(f'{speed:>6} {"step per frame":>15} {steps:>7} {achieved:>8.1f}x {steps:>13}')
+    steps, achieved, frames = fixedTimestep(speed)
+    print(f'{speed:>6} {"FixedTimestep":>15} {steps:>7} {achieved:>8.1f}x {frames:>13}')
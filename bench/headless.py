@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Simulation speed without drawing: what headless bot matches (--zeroplayer headless, --tournament) and training with VectorEnv get out of a CPU.
+# 1. client.Game.simulate with both players steered by pilots that press random things and shoot a lot, restarting the round when it ends
+# 2. the aim guide's trajectory (a Bullet advanced for Game.aim_guide_distance seconds), which the game computes every frame that it draws
+# 3. VectorEnv with random actions
+# Run from anywhere: python3 bench/headless.py
+
+import sys, os, time, random, contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))
+
+import client
+import src.botlib as botlib
+from settings import settings, prefs
+from src.bullet import Bullet
+from src.game_state import GameState
+from src.vector_env import VectorEnv
+
+client.args = {'headless': True}
+FRAMES = 20000
+AIMGUIDES = 2000
+ENVSTEPS = 2000
+REPEATS = 3  # the best of these counts, which leaves out most of what else the machine was doing
+
+
+class RandomPilot:
+    # Holds some keys for a while, then others, and shoots a lot (like in bench/lockstep.py)
+    def __init__(self, rng):
+        self.rng = rng
+        self.actions = []
+        self.until = 0
+
+    def step(self, frame):
+        if frame >= self.until:
+            self.actions = self.rng.sample(list(botlib.Action), self.rng.randint(0, 3))
+            self.until = frame + self.rng.randint(3, 30)
+        return self.actions + ([botlib.Action.SHOOT] if self.rng.random() < 0.5 else [])
+
+
+def newRound(game):
+    with contextlib.redirect_stdout(None):
+        game.initSinglePlayer()
+    game.state = GameState.PLAYERING
+
+
+def benchGame():
+    game = client.Game([client.Player(1), client.Player(2)], singleplayer=True, roundRestartTime=0)
+    newRound(game)
+    pilots = [RandomPilot(random.Random(1)), RandomPilot(random.Random(2))]
+    rounds = 0
+    start = time.process_time()
+    for frame in range(FRAMES):
+        with contextlib.redirect_stdout(None):
+            result = game.simulate([pilot.step(frame) for pilot in pilots])
+        if result is not None:
+            newRound(game)
+            rounds += 1
+    return FRAMES / (time.process_time() - start), rounds
+
+
+def benchAimGuide():
+    player = client.Player(1)
+    player.pos = pygame.math.Vector2(settings['Player1.x'].val, settings['Player1.y'].val)
+    player.speed = pygame.math.Vector2(settings['Player1.xspeed'].val, settings['Player1.yspeed'].val)
+    player.mass = settings['Player.mass'].val
+    steps = int(prefs['Game.aim_guide_distance'] * settings['Game.FPS'].val)
+    start = time.process_time()
+    for i in range(AIMGUIDES):
+        player.angle = i % 360
+        b = Bullet(player)
+        for _ in range(steps):
+            if b.advance(client.SCREENSIZE):
+                break
+    return (time.process_time() - start) / AIMGUIDES * 1e6
+
+
+def benchVectorEnv(num_matches):
+    env = VectorEnv(num_matches)
+    env.reset()
+    rng = numpy.random.default_rng(1)
+    actions = numpy.where(rng.random((ENVSTEPS, num_matches, 2)) < 0.5, 0, 1 << rng.integers(0, 7, (ENVSTEPS, num_matches, 2)))
+    start = time.process_time()
+    for i in range(ENVSTEPS):
+        env.step(actions[i])
+    return ENVSTEPS / (time.process_time() - start)
+
+
+rate, rounds = max(benchGame() for _ in range(REPEATS))
+print(f'Game.simulate: {rate:.0f} frames/s ({rounds} rounds in {FRAMES} frames)')
+print(f'Aim guide: {min(benchAimGuide() for _ in range(REPEATS)):.0f} µs per frame')
+for num_matches in (1, 64):
+    print(f'VectorEnv({num_matches}): {max(benchVectorEnv(num_matches) for _ in range(REPEATS)):.0f} steps/s')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Accuracy versus speed of the Game.integrator and Game.maxsubsteps settings, for running headless matches with a bigger Game.timeStep.
+# A BulletSwarm of bodies on eccentric orbits, some of which pass close to the gravity well, is simulated for the same amount of game time with each
+# combination. In a two-body orbit the energy (v²/2 - GM/r) never changes, so how much it drifted says how wrong the integrator got it. Bodies that
+# fell into the well (which none of them should) are counted separately. Steps/s is game steps of the whole swarm per second of CPU time.
+# Run from anywhere: python3 bench/integrator.py
+
+import sys, os, math, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+from settings import settings
+from src.setting import Setting
+from src.body import Body
+from src.bullet_swarm import BulletSwarm
+
+SCREENSIZE = (100000, 100000)  # so nothing flies out
+BODIES = 1000
+SIMULATED = 300  # seconds of game time
+GM = settings['GW.mass'].val * Body.GRAVITATIONAL_CONSTANT
+
+
+def orbits(n, rng):
+    # Starting at the far end of orbits with the closest point between CLOSEST and 300 px from the well's center
+    closest = settings['GW.radius'].val + settings['Bullet.size'].val + 15
+    for _ in range(n):
+        perihelion = rng.uniform(closest, 300)
+        eccentricity = rng.uniform(0, 0.8)
+        semimajor = perihelion / (1 - eccentricity)
+        r = semimajor * (1 + eccentricity)
+        v = math.sqrt(GM / semimajor * (1 - eccentricity) / (1 + eccentricity))
+        a = rng.uniform(0, 2 * math.pi)
+        yield (r * math.cos(a), r * math.sin(a), -v * math.sin(a), v * math.cos(a))
+
+
+def energy(swarm):
+    n = swarm.count
+    return (swarm.xspeed[ : n] ** 2 + swarm.yspeed[ : n] ** 2) / 2 - GM / numpy.hypot(swarm.x[ : n], swarm.y[ : n])
+
+
+def run(integrator, timestep, maxsubsteps):
+    settings['Game.integrator'].val = integrator
+    settings['Game.timeStep'].val = timestep
+    settings['Game.maxsubsteps'].val = maxsubsteps
+    Setting.freeze(settings)
+    swarm = BulletSwarm()
+    for body in orbits(BODIES, random.Random(1)):
+        swarm.add(*body)
+    initial = energy(swarm)
+
+    steps = int(round(SIMULATED / timestep))
+    start = time.process_time()
+    for _ in range(steps):
+        swarm.advance(SCREENSIZE)
+    cpu = time.process_time() - start
+
+    drift = numpy.abs((energy(swarm) - initial[swarm.ids[ : swarm.count]]) / initial[swarm.ids[ : swarm.count]])
+    return steps / cpu, numpy.median(drift), numpy.percentile(drift, 95), BODIES - swarm.count
+
+
+def scalar(integrator, maxsubsteps):
+    # Microseconds per Body.advance() of a player-like body on its default orbit, which is what the game does for the players and the aim guide
+    settings['Game.integrator'].val = integrator
+    settings['Game.timeStep'].val = 0.1
+    settings['Game.maxsubsteps'].val = maxsubsteps
+    Setting.freeze(settings)
+    body = Body(pygame.math.Vector2(-300, 0), pygame.math.Vector2(0, 15), 225)
+    start = time.perf_counter()
+    for _ in range(100000):
+        body.advance()
+    return (time.perf_counter() - start) / 100000 * 1e6
+
+
+print(f'{BODIES} bodies for {SIMULATED} s of game time')
+print(f'{"integrator":>10} {"timeStep":>9} {"maxsubsteps":>12} {"steps/s":>8} {"game s/s":>9} {"median |dE/E|":>14} {"p95 |dE/E|":>11} {"fell in":>8}')
+for timestep in (0.1, 0.5, 1):
+    for integrator in ('euler', 'verlet'):
+        for maxsubsteps in (1, 16):
+            rate, median, p95, fell = run(integrator, timestep, maxsubsteps)
+            print(f'{integrator:>10} {timestep:>9} {maxsubsteps:>12} {rate:>8.0f} {rate * timestep:>9.0f} {median:>14.2e} {p95:>11.2e} {fell:>8}')
+
+print()
+for integrator in ('euler', 'verlet'):
+    for maxsubsteps in (1, 16):
+        print(f'Body.advance() with {integrator}, maxsubsteps {maxsubsteps}: {scalar(integrator, maxsubsteps):.2f} µs')
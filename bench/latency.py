@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Latency measurement and the jitter buffer (src/latency.py), over a simulated Wi-Fi-like link: BASE seconds one way, plus exponentially distributed
+# jitter with a mean of JITTER, plus now and then a SPIKE, and LOSS packet loss. The other side's clock runs OFFSET seconds ahead of ours.
+# 1. The RTT and clock offset that the timestamped pings measure, versus the old ping (the time from sending b'\x02' until we got to processing the
+#    b'\x03', which includes waiting for the next frame on both sides), over the last LatencyEstimator.WINDOW pings.
+# 2. How smoothly we see the remote player move, with updates applied when they arrive versus played out by the jitter buffer. Stutter is how far
+#    their on-screen movement in a frame differs from how far they really moved in that frame; the delay is how far in the past we show them.
+# Run from anywhere: python3 bench/latency.py
+
+import sys, os, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))  # Player needs a display mode for its sprite
+
+import client
+import src.latency as latency
+import src.botlib as botlib
+from settings import settings
+
+FPS = settings['Game.FPS'].val
+FRAMES = 3600
+BASE = 0.015
+JITTER = 0.005
+SPIKE = 0.08  # extra seconds, for SPIKES of the packets
+SPIKES = 0.02
+LOSS = 0.02
+OFFSET = 0.123
+PINGS = 200
+
+
+def oneWay(rng):
+    return BASE + rng.expovariate(1 / JITTER) + (SPIKE * rng.random() if rng.random() < SPIKES else 0)
+
+
+def nextFrame(t):
+    # When a game loop running at FPS gets to a packet that arrived at t
+    return (int(t * FPS) + 1) / FPS
+
+
+def measure():
+    rng = random.Random(1)
+    estimator = latency.LatencyEstimator()
+    rtts = []
+    oldpings = []
+    for i in range(PINGS):
+        t0 = nextFrame(i * 1.003)  # we send from the game loop
+        there = oneWay(rng)
+        back = oneWay(rng)
+        rtts.append(there + back)
+        t1 = t0 + there  # their kernel timestamp
+        t2 = nextFrame(t1 + OFFSET) - OFFSET  # they answer when their game loop gets to it
+        t3 = t2 + back
+        estimator.pongReceived(latency.pong(latency.ping(t0), t1 + OFFSET, t2 + OFFSET), t3)
+        oldpings.append(nextFrame(t3) - t0)
+    rtts = rtts[-latency.LatencyEstimator.WINDOW : ]  # what the percentiles cover
+    oldpings = oldpings[-latency.LatencyEstimator.WINDOW : ]
+    print(f'True RTT: mean {numpy.mean(rtts) * 1000:.1f} ms, p50 {numpy.percentile(rtts, 50) * 1000:.1f}, p95 {numpy.percentile(rtts, 95) * 1000:.1f}. Their clock is {OFFSET * 1000:+.1f} ms ahead of ours.')
+    print(f'Old ping: mean {numpy.mean(oldpings) * 1000:.1f} ms, p50 {numpy.percentile(oldpings, 50) * 1000:.1f}, p95 {numpy.percentile(oldpings, 95) * 1000:.1f}')
+    print(f'Measured: {estimator.summary()}, clock offset {estimator.offset * 1000:+.1f} ms')
+    print()
+
+
+def newPlayer(n):
+    player = client.Player(n)
+    player.pos = pygame.math.Vector2(settings[f'Player{n}.x'].val, settings[f'Player{n}.y'].val)
+    player.speed = pygame.math.Vector2(settings[f'Player{n}.xspeed'].val, settings[f'Player{n}.yspeed'].val)
+    player.mass = settings['Player.mass'].val
+    return player
+
+
+def smoothness(rate, buffered):
+    # Like bench/dead_reckoning.py, but with packets arriving at jittery times
+    rng = random.Random(2)
+    sender = newPlayer(1)
+    receiver = newPlayer(1)
+    buffer = latency.JitterBuffer(FPS)
+    history = []
+    inflight = []
+    credit = 1
+    actions = []
+    burstuntil = 0
+    stutter = []
+    delays = []
+    for frame in range(FRAMES):
+        if frame >= burstuntil:
+            actions = []
+            if rng.random() < 0.03:
+                actions = rng.choice(([botlib.Action.THRUST], [botlib.Action.ROTATE_LEFT], [botlib.Action.ROTATE_RIGHT], [botlib.Action.THRUST, botlib.Action.ROTATE_LEFT]))
+                burstuntil = frame + rng.randint(5, 20)
+        sender.perform_actions(actions)
+        sender.batterylevel = settings['Player.battSize'].val
+        sender.advance()
+        sender.wrap()
+        history.append(pygame.math.Vector2(sender.pos))
+
+        credit += rate / FPS
+        if credit >= 1:
+            credit = min(1, credit - 1)
+            if rng.random() >= LOSS:
+                inflight.append((frame / FPS + oneWay(rng), frame, pygame.math.Vector2(round(sender.pos.x), round(sender.pos.y)), pygame.math.Vector2(round(sender.speed.x * 100) / 100, round(sender.speed.y * 100) / 100)))
+
+        now = frame / FPS
+        before = pygame.math.Vector2(receiver.pos)
+        receiver.extrapolate()
+        for packet in sorted(p for p in inflight if p[0] <= now):
+            inflight.remove(packet)
+            arrival, sentframe, pos, speed = packet
+            if buffered:
+                buffer.push(sentframe, arrival, (pos, speed))
+            else:
+                receiver.applyUpdate(pos, speed)
+        if buffered:
+            for (pos, speed), late in buffer.due(now):
+                receiver.applyUpdate(pygame.math.Vector2(pos), pygame.math.Vector2(speed), min(FPS, round(late * FPS)))
+
+        if frame >= FPS:  # once updates are coming in
+            moved = receiver.pos - before
+            if moved.length() < 50:  # not wrapping around the screen edge
+                stutter.append(moved.distance_to(history[frame] - history[frame - 1]))
+            # the delay: which recent true position we are closest to
+            delays.append(min(range(12), key=lambda back: receiver.pos.distance_to(history[frame - back])) / FPS)
+
+    return numpy.percentile(stutter, [50, 99]), numpy.mean(delays), buffer.delay, buffer.late
+
+
+measure()
+print(f'{FRAMES} frames; {BASE * 1000:g} ms + {JITTER * 1000:g} ms jitter one way, {SPIKES * 100:g}% of packets up to {SPIKE * 1000:g} ms later still, {LOSS * 100:g}% loss')
+print(f'{"updates/s":>9} {"receiver":>14} {"p50 stutter px":>15} {"p99 px":>7} {"shown ms behind":>16} {"buffer ms":>10} {"late":>5}')
+for rate in (30, 15):
+    for buffered in (False, True):
+        (p50, p99), delay, bufferdelay, late = smoothness(rate, buffered)
+        print(f'{rate:>9} {"jitter buffer" if buffered else "on arrival":>14} {p50:>15.3f} {p99:>7.3f} {delay * 1000:>16.1f} {bufferdelay * 1000 if buffered else 0:>10.1f} {late if buffered else "":>5}')
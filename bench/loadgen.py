@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# Load generator for server.py: many synthetic matches, each two clients that do the real handshake and then send each other update packets
+# (b'\x00' + updatestruct + a varying number of bulletstructs) at Game.FPS, like a playing client does. Reports relay throughput and the one-way
+# latency through the server, measured with a timestamp that every packet carries at its end (a '>d', which a real client would read as two bullets).
+#
+# Usage: python3 bench/loadgen.py [matches] [seconds] [processes] [host:port]
+# Without host:port, it starts its own server (on a free port, with MAXPLAYERS raised to fit). When testing an external server, mind its MAXPLAYERS.
+# The load is spread over `processes` generator processes (default: one per core). Both clients of a match live in the same process so that the
+# latency is measured with one clock; each match uses its own matchmaking bucket (see mplib.maxbucketsize) so the server cannot pair them up differently.
+# Keep in mind that the generator and a local server share the CPU: compare the sent rate to the target to see whether the generator kept up.
+# Run from anywhere: python3 bench/loadgen.py 1000 10
+
+import sys, os, time, socket, struct, random, selectors, multiprocessing, resource
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import server
+import src.mplib as mplib
+from settings import settings
+
+MAXBULLETS = 40  # bullets per update packet are uniformly random up to this many
+timestampstruct = struct.Struct('>d')
+
+
+def runServer(pipe, maxplayers):
+    sys.stdout = open(os.devnull, 'w')
+    server.MAXPLAYERS = maxplayers
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    pipe.send(sock.getsockname())
+    server.Server(sock).run()
+
+
+def clientSocket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(5)
+    return sock
+
+
+def expect(sock, what):
+    msg = sock.recv(mplib.maximumsize)
+    if not msg.startswith(what):
+        raise Exception(f'Expected {what} from the server, got {msg[ : 40]}')
+    return msg
+
+
+def handshake(matches, serveraddr, processnumber):
+    # Returns a list of (client one, client two) sockets that the server married to each other
+    pairs = [(clientSocket(), clientSocket()) for _ in range(matches)]
+    for pair in pairs:
+        for sock in pair:
+            sock.sendto(mplib.clienthello, serveraddr)
+    tokens = {}
+    for pair in pairs:
+        for sock in pair:
+            msg = sock.recv(mplib.maximumsize)
+            if msg == mplib.playerlimit:
+                raise Exception('The server is full, raise its MAXPLAYERS')
+            tokens[sock] = msg[len(mplib.serverhello) : ]
+
+    for matchnumber, (one, two) in enumerate(pairs):
+        bucket = struct.pack('>II', processnumber, matchnumber)
+        one.sendto(tokens[one] + bucket, serveraddr)
+        expect(one, mplib.urplayerone)
+        two.sendto(tokens[two] + bucket, serveraddr)
+        expect(two, mplib.urplayertwo)
+        expect(one, mplib.playerfound)
+        for sock in (one, two):
+            expect(sock, mplib.partnerat)  # which a real client would use to try talking directly; we keep going through the server
+
+    return pairs
+
+
+def generate(processnumber, matches, serveraddr, seconds, fps, pipe):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # two sockets per match
+
+    pairs = handshake(matches, serveraddr, processnumber)
+    clients = [sock for pair in pairs for sock in pair]
+    selector = selectors.DefaultSelector()
+    for sock in clients:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+
+    rng = random.Random(processnumber)
+    bulletblobs = [b''.join(mplib.bulletstruct.pack(rng.randint(0, 1900), rng.randint(0, 980)) for _ in range(n)) for n in range(MAXBULLETS + 1)]
+    seqnos = [0] * len(clients)
+    latencies = []
+    sent = 0
+    sentbytes = 0
+
+    def receive(timeout):
+        for key, _ in selector.select(timeout):
+            while True:
+                try:
+                    msg = key.fileobj.recv(mplib.maximumsize)
+                except BlockingIOError:
+                    break
+                latencies.append(time.perf_counter() - timestampstruct.unpack_from(msg, len(msg) - timestampstruct.size)[0])
+
+    # Every client sends once per frame; spread them evenly over the frame instead of sending in bursts
+    interval = 1 / fps / len(clients)
+    start = time.perf_counter()
+    end = start + seconds
+    nextslot = 0
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        due = int((now - start) / interval) + 1
+        while nextslot < due:
+            i = nextslot % len(clients)
+            seqnos[i] += 1
+            msg = b'\x00' + mplib.updatestruct.pack(seqnos[i], 950, 490, 0, 0, 0, 255, 255, 0) + bulletblobs[rng.randint(0, MAXBULLETS)]
+            msg += timestampstruct.pack(time.perf_counter())
+            clients[i].sendto(msg, serveraddr)
+            sent += 1
+            sentbytes += len(msg)
+            nextslot += 1
+        receive(max(0, start + nextslot * interval - time.perf_counter()))
+
+    # collect what is still underway
+    drainuntil = time.perf_counter() + 0.5
+    while time.perf_counter() < drainuntil:
+        receive(0.05)
+
+    for sock in clients:
+        sock.sendto(mplib.playerquits + b'the benchmark is over', serveraddr)
+        sock.close()
+
+    pipe.send((sent, sentbytes, numpy.array(latencies, dtype=numpy.float32)))
+
+
+def parseArgs():
+    matches = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    serveraddr = None
+    if len(sys.argv) > 4:
+        host, port = sys.argv[4].rsplit(':', 1)
+        serveraddr = (host, int(port))
+    return matches, seconds, max(1, min(processes, matches)), serveraddr
+
+
+if __name__ == '__main__':
+    matches, seconds, processes, serveraddr = parseArgs()
+    fps = settings['Game.FPS'].val
+
+    serverprocess = None
+    if serveraddr is None:
+        ours, theirs = multiprocessing.Pipe()
+        serverprocess = multiprocessing.Process(target=runServer, args=(theirs, matches * 2), daemon=True)
+        serverprocess.start()
+        serveraddr = ours.recv()
+
+    generators = []
+    for n in range(processes):
+        ours, theirs = multiprocessing.Pipe()
+        share = matches // processes + (1 if n < matches % processes else 0)
+        multiprocessing.Process(target=generate, args=(n, share, serveraddr, seconds, fps, theirs), daemon=True).start()
+        generators.append(ours)
+
+    sent = 0
+    sentbytes = 0
+    latencies = []
+    for pipe in generators:
+        s, b, l = pipe.recv()
+        sent += s
+        sentbytes += b
+        latencies.append(l)
+    latencies = numpy.concatenate(latencies) * 1000
+
+    target = matches * 2 * fps
+    print(f'{matches} matches ({matches * 2} clients) over {processes} generator process(es) for {seconds:g} s against {serveraddr[0]}:{serveraddr[1]}')
+    print(f'Sent:     {sent / seconds:>10.0f} packets/s (target {target}), {sentbytes / seconds / 1e6:.2f} MB/s')
+    print(f'Relayed:  {len(latencies) / seconds:>10.0f} packets/s, lost {100 * (1 - len(latencies) / max(1, sent)):.2f}%')
+    if len(latencies) > 0:
+        p50, p99, p999 = numpy.percentile(latencies, [50, 99, 99.9])
+        print(f'One-way latency through the server: p50 {p50:.3f} ms, p99 {p99:.3f} ms, p99.9 {p999:.3f} ms, max {latencies.max():.3f} ms')
+
+    if serverprocess is not None:
+        serverprocess.terminate()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Lockstep multiplayer (src/lockstep.py): two real Games in one process, connected through a simulated link with LATENCY frames of delay each way and
+# LOSS packet loss. Both players press random things (including a lot of shooting) until someone dies. We check that both games end the round on the
+# same frame with the same outcome and never saw a state hash mismatch, and measure the packet sizes and what the rollbacks cost.
+# Run from anywhere: python3 bench/lockstep.py
+
+import sys, os, time, random, collections
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))
+
+import client
+import src.botlib as botlib
+from settings import settings
+from src.game_state import GameState
+from src.lockstep import Lockstep
+
+client.args = {'headless': True}
+settings['Game.lockstep'].val = True
+MAXFRAMES = 3600
+LATENCY = 4  # frames, one way
+LOSS = 0.05
+FPS = settings['Game.FPS'].val
+ROUNDS = 5
+
+
+class Link:
+    # Delivers packets LATENCY frames later, losing some. Has the send() of a netio.Connection.
+    def __init__(self, rng):
+        self.rng = rng
+        self.queue = collections.deque()
+        self.frame = 0
+        self.bytes = 0
+        self.packets = 0
+
+    def send(self, msg, addr=None):
+        self.bytes += len(msg) + 28  # IPv4 and UDP headers
+        self.packets += 1
+        if self.rng.random() >= LOSS:
+            self.queue.append((self.frame + LATENCY, msg))
+
+    def receive(self):
+        while len(self.queue) > 0 and self.queue[0][0] <= self.frame:
+            yield self.queue.popleft()[1]
+
+
+def newGame(playernumber):
+    # Like Game.processIncomingPacket does once the settings are in
+    players = [client.Player(1), client.Player(2)]
+    players[0].n = playernumber
+    players[1].n = 3 - playernumber
+    game = client.Game(players, singleplayer=False, roundRestartTime=0)
+    for player in players:
+        player.pos = pygame.math.Vector2(settings[f'Player{player.n}.x'].val, settings[f'Player{player.n}.y'].val)
+        player.speed = pygame.math.Vector2(settings[f'Player{player.n}.xspeed'].val, settings[f'Player{player.n}.yspeed'].val)
+        player.mass = settings['Player.mass'].val
+        player.loadImage(player.n)
+        player.reset()
+    game.lockstep = Lockstep(players)
+    game.bulletsender = None
+    game.bulletreceiver = None
+    game.state = GameState.PLAYERING
+    return game
+
+
+class RandomPilot:
+    # Holds some keys for a while, then others, and shoots a lot
+    def __init__(self, rng):
+        self.rng = rng
+        self.actions = []
+        self.until = 0
+
+    def step(self, frame):
+        if frame >= self.until:
+            self.actions = self.rng.sample(list(botlib.Action), self.rng.randint(0, 3))
+            self.until = frame + self.rng.randint(3, 30)
+        return self.actions + ([botlib.Action.SHOOT] if self.rng.random() < 0.5 else [])
+
+
+def playRound(seed):
+    rng = random.Random(seed)
+    games = [newGame(1), newGame(2)]
+    links = [Link(rng), Link(rng)]  # links[i] carries what games[i] sends
+    for game, link in zip(games, links):
+        game.connection = link
+    pilots = [RandomPilot(random.Random(seed * 2)), RandomPilot(random.Random(seed * 2 + 1))]
+    maxbullets = 0
+    biggest = 0
+    cpu = 0
+    frame = 0
+    while frame < MAXFRAMES and any(game.state == GameState.PLAYERING for game in games):
+        for i, game in enumerate(games):
+            other = links[1 - i]
+            other.frame = frame
+            for msg in other.receive():
+                game.processIncomingPacket(msg)
+            links[i].frame = frame
+            start = time.process_time()
+            if game.state == GameState.PLAYERING:
+                game.lockstep.step(game, pilots[i].step(game.lockstep.nextinput), game.connection)
+            else:
+                game.update()
+            cpu += time.process_time() - start
+            game.framecounter += 1
+        maxbullets = max(maxbullets, len(games[0].bullets))
+        biggest = max(biggest, max(len(msg) for link in links for _, msg in link.queue) if any(link.queue for link in links) else 0)
+        frame += 1
+
+    # let the last packets arrive, so that both sides know how the round ended
+    for extra in range(LATENCY * 4):
+        for i, game in enumerate(games):
+            links[1 - i].frame = frame + extra
+            for msg in links[1 - i].receive():
+                game.processIncomingPacket(msg)
+            links[i].frame = frame + extra
+            if game.state == GameState.PLAYERING:
+                game.lockstep.step(game, [], game.connection)
+            else:
+                game.update()
+
+    if any(game.state == GameState.DEAD for game in games):
+        # the same last frame, and one won while the other lost, or both tied
+        agree = all(game.state == GameState.DEAD for game in games) and games[0].lockstep.frame == games[1].lockstep.frame and games[0].roundscore + games[1].roundscore in (2, 5)
+    else:
+        agree = True  # nobody died within MAXFRAMES, the hashes tell whether they agree
+    desynced = any(game.lockstep.desynced for game in games)
+    seconds = frame / FPS
+    return {
+        'frames': games[0].lockstep.frame,
+        'agree': agree and not desynced,
+        'bytes/s': sum(link.bytes for link in links) / 2 / seconds,
+        'packet': biggest,
+        'bullets': maxbullets,
+        'rollbacks/s': sum(game.lockstep.rollbacks for game in games) / 2 / seconds,
+        'resim/s': sum(game.lockstep.resimulated for game in games) / 2 / seconds,
+        'ms/frame': cpu / 2 / frame * 1000,
+    }
+
+
+print(f'{LATENCY} frames latency each way, {LOSS * 100:g}% loss, at most {MAXFRAMES} frames per round; bytes/s per player include IP and UDP headers')
+print(f'{"round":>5} {"frames":>6} {"same end":>9} {"max bullets":>12} {"bytes/s":>8} {"max packet":>11} {"rollbacks/s":>12} {"resimulated/s":>14} {"CPU ms/frame":>13}')
+for seed in range(1, ROUNDS + 1):
+    r = playRound(seed)
+    print(f'{seed:>5} {r["frames"]:>6} {"yes" if r["agree"] else "NO":>9} {r["bullets"]:>12} {r["bytes/s"]:>8.0f} {r["packet"]:>11} {r["rollbacks/s"]:>12.1f} {r["resim/s"]:>14.0f} {r["ms/frame"]:>13.2f}')
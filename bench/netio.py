@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Client send path: the old sender thread (list + threading.Event, as Game.sendto was) versus netio.Connection (sendto straight from the game loop).
+# - burst: CPU time per packet when sending many packets back to back
+# - game loop: FPS frames that each send one update and then do a few ms of Python work, like drawing and simulating. We measure the queueing
+#   delay: from the send call until the packet can be read at a receiver on localhost (in another process, on the same monotonic clock).
+#   With the thread, the packet waits until the sender thread gets the GIL, which the busy game loop holds.
+# Run from anywhere: python3 bench/netio.py
+
+import sys, os, time, socket, struct, threading, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+from src.netio import Connection
+
+BURST = 20000
+FPS = 60
+FRAMES = 300
+FRAMEWORK = 0.004  # seconds of Python work per frame
+timestampstruct = struct.Struct('>d')
+
+
+class ThreadSender:
+    # Game.sendto/sendtoQueued from before netio
+    def __init__(self, server):
+        self.server = server
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(0)
+        self.stopSendtoThread = False
+        self.msgQueue = []
+        self.msgQueueEvent = threading.Event()
+        self.thread = threading.Thread(target=self.sendto)
+        self.thread.start()
+
+    def sendto(self):
+        while True:
+            if len(self.msgQueue) == 0:
+                self.msgQueueEvent.clear()
+                self.msgQueueEvent.wait()
+
+            if self.stopSendtoThread:
+                return
+
+            try:
+                msg = self.msgQueue.pop(0)
+                self.sock.sendto(msg, self.server)
+            except IndexError:
+                pass
+
+    def send(self, msg):
+        self.msgQueue.append(msg)
+        self.msgQueueEvent.set()
+
+    def close(self, lastmsg=None):
+        while len(self.msgQueue) > 0:  # let it finish, so that the burst measurement includes the sending
+            time.sleep(0.001)
+        self.stopSendtoThread = True
+        self.msgQueueEvent.set()
+        self.thread.join()
+        self.sock.close()
+
+
+def receiver(pipe):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    pipe.send(sock.getsockname())
+    delays = []
+    while True:
+        msg = sock.recv(2048)
+        now = time.perf_counter()
+        if msg == b'stop':
+            break
+        delays.append(now - timestampstruct.unpack_from(msg)[0])
+    pipe.send(numpy.array(delays))
+
+
+def measure(makeSender, scenario):
+    ours, theirs = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=receiver, args=(theirs, ))
+    process.start()
+    addr = ours.recv()
+    sender = makeSender(addr)
+    padding = bytes(40)
+
+    if scenario == 'burst':
+        start = time.process_time()
+        for _ in range(BURST):
+            sender.send(timestampstruct.pack(time.perf_counter()) + padding)
+        sender.close()
+        cpu = (time.process_time() - start) / BURST
+    else:
+        start = time.process_time()
+        nextframe = time.perf_counter()
+        for _ in range(FRAMES):
+            sender.send(timestampstruct.pack(time.perf_counter()) + padding)
+            busyuntil = time.perf_counter() + FRAMEWORK
+            x = 0
+            while time.perf_counter() < busyuntil:
+                x += 1
+            nextframe += 1 / FPS
+            time.sleep(max(0, nextframe - time.perf_counter()))
+        cpu = None
+        sender.close()
+
+    stopsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    time.sleep(0.1)
+    stopsock.sendto(b'stop', addr)
+    delays = ours.recv() * 1e6
+    process.join()
+    return cpu, delays
+
+
+if __name__ == '__main__':
+    implementations = (('thread', ThreadSender), ('netio', Connection))
+
+    print(f'Burst of {BURST} packets')
+    print(f'{"sender":>8} {"CPU µs/packet":>14}')
+    for name, makeSender in implementations:
+        cpu, _ = measure(makeSender, 'burst')
+        print(f'{name:>8} {cpu * 1e6:>14.2f}')
+
+    print(f'\nGame loop: {FRAMES} frames at {FPS} FPS with {FRAMEWORK * 1000:g} ms of work each')
+    print(f'{"sender":>8} {"delay p50 µs":>13} {"p99 µs":>9} {"max µs":>9}')
+    for name, makeSender in implementations:
+        _, delays = measure(makeSender, 'game')
+        p50, p99 = numpy.percentile(delays, [50, 99])
+        print(f'{name:>8} {p50:>13.0f} {p99:>9.0f} {delays.max():>9.0f}')
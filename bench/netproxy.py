@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# A UDP proxy that makes the network worse on purpose, for testing the netcode on localhost: run server.py, run this, and point client.py at it.
+# Packets from clients to the server ("up") and back ("down") get latency, jitter, loss (optionally in bursts), reordering and duplicates, as a
+# scenario file says. Every client gets its own random numbers per direction, seeded from the scenario's seed and the order in which clients showed
+# up, so a scenario plays out the same every time for the same traffic. What happens to every packet is logged as JSON lines, and a summary per
+# direction is printed every STATSINTERVAL seconds and when you stop the proxy with Ctrl+C.
+#
+# Usage: python3 bench/netproxy.py scenario.json [listenport] [serverhost:port] [logfile]
+# Defaults: listen on 9475, server at 127.0.0.1:9473, log to netproxy.log. Then: python3 client.py 127.0.0.1:9475
+# Example scenarios are in bench/scenarios/.
+#
+# A scenario is a JSON object:
+#   "seed":   any number or string
+#   "up", "down": impairments per direction, all optional:
+#       "latency": ms, "jitter": ms (the standard deviation of extra delay, which does not reorder packets by itself),
+#       "loss": fraction of packets dropped, "burst": average number of packets lost in a row (1 for independent losses),
+#       "reorder": fraction of packets held back an extra "reorderdelay" ms so that later ones overtake them, "duplicate": fraction sent twice
+#   "phases": optional list of {"at": seconds after the first packet, "up": {...}, "down": {...}} that change some of the values from then on
+# Clients that try to talk directly (see netio.Connection) cannot reach each other through the proxy's sockets, so they stay with the server and
+# all of their traffic gets the treatment.
+# Run from anywhere: python3 bench/netproxy.py bench/scenarios/wifi.json
+
+import sys, os, json, math, time, heapq, random, socket, selectors, itertools
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.mplib as mplib
+
+STATSINTERVAL = 10  # seconds
+IDLETIMEOUT = 120  # seconds after which we forget a client that did not send anything
+DEFAULTS = {'latency': 0, 'jitter': 0, 'loss': 0, 'burst': 1, 'reorder': 0, 'reorderdelay': 0, 'duplicate': 0}
+
+
+class Flow:
+    # One direction of one client's traffic
+    def __init__(self, name, seed):
+        self.name = name
+        self.rng = random.Random(f'{seed} {name}')
+        self.params = dict(DEFAULTS)
+        self.lostinarow = 0  # packets still to lose in the current burst
+        self.lastdue = 0  # packets leave in order, unless reordered
+        self.stats = {'packets': 0, 'dropped': 0, 'duplicated': 0, 'reordered': 0}
+        self.delays = []  # ms, since the last summary
+
+    def lose(self):
+        p = self.params
+        if self.lostinarow > 0:
+            self.lostinarow -= 1
+            return True
+        if p['loss'] > 0 and self.rng.random() < p['loss'] / p['burst']:
+            if p['burst'] > 1:  # a geometric number of packets with the given average, of which this is the first
+                self.lostinarow = int(math.log(1 - self.rng.random()) / math.log(1 - 1 / p['burst']))
+            return True
+        return False
+
+    def decide(self, now):
+        # Returns (action, [seconds from now for each copy that gets delivered])
+        p = self.params
+        self.stats['packets'] += 1
+        if self.lose():
+            self.stats['dropped'] += 1
+            return 'drop', []
+
+        copies = 2 if self.rng.random() < p['duplicate'] else 1
+        action = 'duplicate' if copies == 2 else 'deliver'
+        delays = []
+        for _ in range(copies):
+            delay = max(0, p['latency'] + self.rng.gauss(0, p['jitter'])) / 1000 if p['jitter'] > 0 else p['latency'] / 1000
+            if self.rng.random() < p['reorder']:
+                delay += p['reorderdelay'] / 1000
+                action = 'reorder'
+            else:
+                delay = max(delay, self.lastdue - now)  # a link does not reorder packets just because their delays vary
+                self.lastdue = now + delay
+            delays.append(delay)
+            self.delays.append(delay * 1000)
+        if copies == 2:
+            self.stats['duplicated'] += 1
+        if action == 'reorder':
+            self.stats['reordered'] += 1
+        return action, delays
+
+    def summary(self):
+        s = self.stats
+        line = f'{self.name:>12}: {s["packets"]:>7} packets, {s["dropped"] / max(1, s["packets"]) * 100:5.1f}% dropped, {s["duplicated"]:>5} duplicated, {s["reordered"]:>5} reordered'
+        if len(self.delays) > 0:
+            ordered = sorted(self.delays)
+            line += f', delay p50 {ordered[len(ordered) // 2]:.1f} ms, p99 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]:.1f} ms'
+        self.delays = []
+        return line
+
+
+class Proxy:
+    def __init__(self, scenario, listenport, serveraddr, log):
+        self.scenario = scenario
+        self.serveraddr = serveraddr
+        self.log = log
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listener.bind(('127.0.0.1', listenport))
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.clients = {}  # client address: {'number', 'sock' (to the server), 'up', 'down' (Flows), 'lastseen'}
+        self.byupstream = {}  # socket to the server: client address
+        self.clientcount = 0  # numbers the clients in the order they showed up, which picks their random numbers
+        self.pending = []  # heap of (due, n, socket, packet, address)
+        self.counter = itertools.count()
+        self.start = None  # of the first packet; phases count from there
+        self.phase = 0  # phases that were applied
+
+    def client(self, addr, now):
+        if addr not in self.clients:
+            number = self.clientcount
+            self.clientcount += 1
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.clients[addr] = {
+                'number': number,
+                'sock': sock,
+                'up': Flow(f'client {number} up', self.scenario.get('seed', 0)),
+                'down': Flow(f'client {number} down', self.scenario.get('seed', 0)),
+                'lastseen': now,
+            }
+            self.byupstream[sock] = addr
+            self.applyParams(self.clients[addr])
+            print(f'Client {number} is {addr}, and the server sees it as {sock.getsockname()}')
+        return self.clients[addr]
+
+    def applyParams(self, client):
+        for direction in ('up', 'down'):
+            params = dict(DEFAULTS)
+            params.update(self.scenario.get(direction, {}))
+            for phase in self.scenario.get('phases', [])[ : self.phase]:
+                params.update(phase.get(direction, {}))
+            client[direction].params = params
+
+    def handle(self, client, direction, msg, sock, destination, now):
+        if self.start is None:
+            self.start = now
+        action, delays = client[direction].decide(now)
+        for delay in delays:
+            heapq.heappush(self.pending, (now + delay, next(self.counter), sock, msg, destination))
+        self.log.write(json.dumps({'t': round(now - self.start, 4), 'client': client['number'], 'dir': direction, 'size': len(msg), 'type': msg[0] if len(msg) > 0 else None,
+                                   'action': action, 'delays': [round(delay * 1000, 2) for delay in delays]}) + '\n')
+
+    def run(self):
+        phases = self.scenario.get('phases', [])
+        nextstats = time.monotonic() + STATSINTERVAL
+        while True:
+            now = time.monotonic()
+            timeout = STATSINTERVAL if len(self.pending) == 0 else max(0, self.pending[0][0] - now)
+            for key, _ in self.selector.select(min(timeout, STATSINTERVAL)):
+                while True:
+                    try:
+                        msg, addr = key.fileobj.recvfrom(mplib.maximumsize)
+                    except BlockingIOError:
+                        break
+                    except ConnectionResetError:
+                        continue
+                    now = time.monotonic()
+                    if key.fileobj is self.listener:
+                        client = self.client(addr, now)
+                        client['lastseen'] = now
+                        self.handle(client, 'up', msg, client['sock'], self.serveraddr, now)
+                    elif addr == self.serveraddr:
+                        clientaddr = self.byupstream[key.fileobj]
+                        self.handle(self.clients[clientaddr], 'down', msg, self.listener, clientaddr, now)
+                    # else: another client trying to reach this one directly, which a NAT would not let through either
+
+            now = time.monotonic()
+            while len(self.pending) > 0 and self.pending[0][0] <= now:
+                _, _, sock, msg, addr = heapq.heappop(self.pending)
+                try:
+                    sock.sendto(msg, addr)
+                except OSError:
+                    pass  # such as a socket of a client that we just forgot
+
+            if self.start is not None and self.phase < len(phases) and now - self.start >= phases[self.phase]['at']:
+                self.phase += 1
+                print(f'Phase {self.phase} at {now - self.start:.1f} s: {json.dumps({k: v for k, v in phases[self.phase - 1].items() if k != "at"})}')
+                for client in self.clients.values():
+                    self.applyParams(client)
+
+            if now >= nextstats:
+                self.expire(now)
+                self.printSummary()
+                nextstats = now + STATSINTERVAL
+
+    def expire(self, now):
+        for addr in [addr for addr, client in self.clients.items() if now - client['lastseen'] > IDLETIMEOUT]:
+            client = self.clients.pop(addr)
+            del self.byupstream[client['sock']]
+            self.selector.unregister(client['sock'])
+            client['sock'].close()
+
+    def printSummary(self):
+        for client in sorted(self.clients.values(), key=lambda client: client['number']):
+            if client['up'].stats['packets'] + client['down'].stats['packets'] > 0:
+                print(client['up'].summary())
+                print(client['down'].summary())
+        self.log.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python3 bench/netproxy.py scenario.json [listenport] [serverhost:port] [logfile]')
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        scenario = json.load(f)
+    listenport = int(sys.argv[2]) if len(sys.argv) > 2 else 9475
+    serveraddr = ('127.0.0.1', 9473)
+    if len(sys.argv) > 3:
+        host, port = sys.argv[3].rsplit(':', 1)
+        serveraddr = (socket.gethostbyname(host), int(port))
+    logfile = sys.argv[4] if len(sys.argv) > 4 else 'netproxy.log'
+
+    with open(logfile, 'w') as log:
+        proxy = Proxy(scenario, listenport, serveraddr, log)
+        print(f'Listening on 127.0.0.1:{listenport}, forwarding to {serveraddr[0]}:{serveraddr[1]}, logging to {logfile}')
+        try:
+            proxy.run()
+        except KeyboardInterrupt:
+            print()
+            proxy.printSummary()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Direct connections between players (the hole punching in netio.Connection) on localhost: server.py runs in a child process, and this process plays
+# two clients, each behind a stand-in NAT that also adds latency. The server is SERVER_LEG seconds away from either client, the clients are DIRECT
+# seconds away from each other, so the relayed path takes 2 * SERVER_LEG one way. Both clients send UPDATERATE packets per second and ping each other.
+# Scenarios:
+# - relay only: Multiplayer.direct turned off, which is how all games went before
+# - cone NATs: NATs that keep one outside port per client and let in whoever the client sent to, which hole punching gets through
+# - symmetric NAT: one of the NATs uses a new outside port for every destination, so the address that the server saw is useless to the other client
+#   and we have to stay with the relay
+# - path breaks: cone NATs, but after BREAKAT seconds the direct path stops working (say, a router reboots) and we should go back to the relay
+# We measure the RTT (with src/latency.py), how many packets went through the server, and the longest time that a client received nothing.
+# Run from anywhere: python3 bench/p2p.py
+
+import sys, os, time, heapq, socket, itertools, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+import src.mplib as mplib
+import src.latency as latency
+import src.netio as netio
+from src.netio import Connection
+
+SERVER_LEG = 0.030
+DIRECT = 0.015
+UPDATERATE = 30
+DURATION = 8  # seconds per scenario
+BREAKAT = 4
+
+
+class Nat:
+    # Stands in for the socket of a netio.Connection, as if it were behind a home router: what the client sends leaves from an outside socket of the
+    # NAT, and packets to the outside socket only get in if they come from an address that the client sent something to through it. With
+    # symmetric=True, every destination gets its own outside socket. Also delays packets by delays(addr) on the way to addr, and the same on the way
+    # from there. recvmsg() gives the time that a packet came out of the NAT as its kernel timestamp, like Connection gets it from Linux.
+    def __init__(self, delays, symmetric=False):
+        self.delays = delays
+        self.symmetric = symmetric
+        self.outside = {}  # destination (or None if not symmetric): socket
+        self.allowed = {}  # outside socket: set of addresses that may send to it
+        self.outbound = []  # heap of (due, n, socket, msg, addr)
+        self.inbound = []  # heap of (due, n, time.time() when due, msg, addr)
+        self.counter = itertools.count()
+        self.blocked = None  # an address that no packets get to or from anymore
+        self.toserver = 0  # packets that the client sent to the server
+
+    def sock(self, addr):
+        key = addr if self.symmetric else None
+        if key not in self.outside:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind(('127.0.0.1', 0))
+            self.outside[key] = sock
+            self.allowed[sock] = set()
+        return self.outside[key]
+
+    def sendto(self, msg, addr):
+        sock = self.sock(addr)
+        self.allowed[sock].add(addr)
+        if addr == serveraddr:
+            self.toserver += 1
+        heapq.heappush(self.outbound, (time.monotonic() + self.delays(addr), next(self.counter), sock, bytes(msg), addr))
+
+    def pump(self):
+        now = time.monotonic()
+        wallclock = time.time()
+        while len(self.outbound) > 0 and self.outbound[0][0] <= now:
+            _, _, sock, msg, addr = heapq.heappop(self.outbound)
+            if addr != self.blocked:
+                sock.sendto(msg, addr)
+        for sock, allowed in self.allowed.items():
+            while True:
+                try:
+                    msg, addr = sock.recvfrom(mplib.maximumsize)
+                except BlockingIOError:
+                    break
+                if addr in allowed and addr != self.blocked:
+                    heapq.heappush(self.inbound, (now + self.delays(addr), next(self.counter), wallclock + self.delays(addr), msg, addr))
+
+    def recvmsg(self, bufsize, ancbufsize=0):
+        self.pump()
+        if len(self.inbound) == 0 or self.inbound[0][0] > time.monotonic():
+            raise BlockingIOError
+        _, _, due, msg, addr = heapq.heappop(self.inbound)
+        return msg, [(socket.SOL_SOCKET, netio.SO_TIMESTAMPNS, netio.timespec.pack(int(due), int(due % 1 * 1e9)))], 0, addr
+
+    def recvfrom(self, bufsize):
+        msg, _, _, addr = self.recvmsg(bufsize)
+        return msg, addr
+
+    def outsideAddress(self):
+        return self.sock(serveraddr).getsockname()
+
+    def getsockname(self):
+        return ('127.0.0.1', 0)
+
+    def close(self):
+        for sock in self.outside.values():
+            sock.close()
+
+
+def serve(pipe):
+    sys.stdout = open(os.devnull, 'w')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    pipe.send(sock.getsockname())
+    server.Server(sock).run()
+
+
+class Client:
+    def __init__(self, direct, symmetric):
+        self.connection = Connection(serveraddr, direct=direct)
+        self.connection.sock.close()
+        self.nat = Nat(lambda addr: SERVER_LEG if addr == serveraddr else DIRECT / 2, symmetric)  # the other client's NAT adds the other half
+        self.connection.sock = self.nat
+        self.latency = latency.LatencyEstimator()
+        self.received = []  # monotonic times at which updates arrived
+
+    def waitFor(self, predicate):
+        # The next packet for which predicate(msg) is true, during the handshake
+        while True:
+            self.nat.pump()
+            for msg, _ in self.connection.receive():
+                if predicate(msg):
+                    return msg
+            time.sleep(0.001)
+
+    def handshake(self):
+        self.connection.send(mplib.clienthello)
+        token = self.waitFor(lambda msg: msg.startswith(mplib.serverhello))[len(mplib.serverhello) : ]
+        self.connection.send(token)
+
+    def step(self, frame, now):
+        self.nat.pump()
+        for msg, receivedat in self.connection.receive():
+            if msg[0] == 0:
+                self.received.append(now)
+            elif msg[0] == 2:
+                self.connection.send(latency.pong(msg, receivedat, time.time()))
+            elif msg[0] == 3:
+                self.latency.pongReceived(msg, receivedat)
+        if frame % (60 // UPDATERATE) == 0:
+            self.connection.send(b'\x00' + bytes(mplib.updatestruct.size))
+        if frame % 15 == 0:
+            self.connection.send(latency.ping(time.time()))
+
+
+def scenario(direct, symmetric, breaks):
+    a = Client(direct, False)
+    b = Client(direct, symmetric)
+    a.handshake()
+    a.waitFor(lambda msg: msg == mplib.urplayerone)
+    b.handshake()
+    b.waitFor(lambda msg: msg == mplib.urplayertwo)
+    a.waitFor(lambda msg: msg == mplib.playerfound)
+
+    start = time.monotonic()
+    directat = None
+    servercount = a.nat.toserver + b.nat.toserver
+    frame = 0
+    while time.monotonic() - start < DURATION:
+        now = time.monotonic()
+        if breaks and now - start >= BREAKAT and a.nat.blocked is None:
+            a.nat.blocked = b.nat.outsideAddress()
+            b.nat.blocked = a.nat.outsideAddress()
+        for client in (a, b):
+            client.step(frame, now)
+        if directat is None and a.connection.isDirect() and b.connection.isDirect():
+            directat = now - start
+        frame += 1
+        while time.monotonic() < start + frame / 60:
+            # the packets move while the game loops wait for their next frame
+            a.nat.pump()
+            b.nat.pump()
+            time.sleep(0.001)
+
+    gaps = [later - earlier for client in (a, b) for earlier, later in zip(client.received, client.received[1 : ])]
+    result = {
+        'direct': 'yes' if a.connection.isDirect() and b.connection.isDirect() else 'no',
+        'directat': '' if directat is None else f'{directat:.2f}',
+        'rtt': a.latency.percentile(50) * 1000,
+        'server': (a.nat.toserver + b.nat.toserver - servercount) / DURATION / 2,
+        'gap': max(gaps) * 1000,
+    }
+    for client in (a, b):
+        client.nat.close()  # the server forgets them after server.PLAYERTIMEOUT, or when we stop it
+    return result
+
+
+ours, theirs = multiprocessing.Pipe()
+process = multiprocessing.Process(target=serve, args=(theirs, ))
+process.start()
+serveraddr = ours.recv()
+try:
+    print(f'Server {SERVER_LEG * 1000:g} ms from either client, the clients {DIRECT * 1000:g} ms from each other, {UPDATERATE} updates/s and 4 pings/s per client')
+    print(f'{"scenario":>15} {"direct at end":>14} {"direct after s":>15} {"p50 RTT ms":>11} {"packets/s to server":>20} {"longest silence ms":>19}')
+    for name, direct, symmetric, breaks in (('relay only', False, False, False), ('cone NATs', True, False, False), ('symmetric NAT', True, True, False), ('path breaks', True, False, True)):
+        r = scenario(direct, symmetric, breaks)
+        print(f'{name:>15} {r["direct"]:>14} {r["directat"]:>15} {r["rtt"]:>11.1f} {r["server"]:>20.1f} {r["gap"]:>19.0f}')
+finally:
+    process.terminate()
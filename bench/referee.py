@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# The server's referee (src/referee.py, AUTHORITATIVE in server.py), with the client's side of it (referee.Refereed) sending the inputs.
+# 1. Does the server decide rounds the way the game does? We play ROUNDS rounds with two pilots that press random things and shoot a lot, once in a
+#    client.Game (which simulates both players, like in singleplayer) and once on the referee, and check that every round ends the same: who died and
+#    in which frame.
+# 2. How many matches can one server process referee? Every match gets two clients that send their inputs every Refereed.SEND_INTERVAL frames; we
+#    measure the CPU time of the referee per second of play, versus stepping a VectorEnv of one match per match (a Python loop per match).
+# Run from anywhere: python3 bench/referee.py
+
+import sys, os, time, random, contextlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the player images are loaded from res/
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy
+import pygame
+pygame.display.init()
+pygame.display.set_mode((1, 1))
+
+import client
+import src.botlib as botlib
+import src.referee as referee
+from settings import settings
+from src.game_state import GameState
+from src.metrics import Metrics
+from src.setting import Setting
+from src.vector_env import VectorEnv
+
+client.args = {'headless': True}
+# The referee gets the rules serialized, which rounds them (e.g. Game.timeStep is sent in 255ths), so the game plays with those values like it does in
+# multiplayer, where the client gets its settings back from the server
+Setting.updateSettings(settings, Setting.serializeSettings(settings))
+FPS = settings['Game.FPS'].val
+ROUNDS = 40
+MAXFRAMES = 3600
+SECONDS = 5  # of play per throughput measurement
+
+
+class Outbox:
+    # Has what Refereed.send() needs of a netio.Connection
+    def __init__(self):
+        self.server = ('127.0.0.1', 9473)
+        self.packets = []
+
+    def send(self, msg, addr=None):
+        self.packets.append(bytes(msg))
+
+
+class RandomPilot:
+    # Holds some keys for a while, then others, and shoots a lot (like in bench/lockstep.py)
+    def __init__(self, rng):
+        self.rng = rng
+        self.actions = []
+        self.until = 0
+
+    def step(self, frame):
+        if frame >= self.until:
+            self.actions = self.rng.sample(list(botlib.Action), self.rng.randint(0, 3))
+            self.until = frame + self.rng.randint(3, 30)
+        return self.actions + ([botlib.Action.SHOOT] if self.rng.random() < 0.5 else [])
+
+
+def newGame():
+    players = [client.Player(1), client.Player(2)]
+    game = client.Game(players, singleplayer=True, roundRestartTime=0)
+    with contextlib.redirect_stdout(None):
+        game.initSinglePlayer()
+    game.state = GameState.PLAYERING
+    return game
+
+
+def exchange(ref, clients, addrs):
+    # Delivers the clients' packets to the referee and its answers back
+    for refereed, outbox, addr in zip(clients, [c.outbox for c in clients], addrs):
+        for msg in outbox.packets:
+            answer = ref.receive(addr, msg)
+            if answer is not None:
+                refereed.receive(answer)
+        outbox.packets = []
+    for msg, addr in ref.tick():
+        clients[addrs.index(addr)].receive(msg)
+
+
+def newClients(n):
+    clients = []
+    for _ in range(n):
+        refereed = referee.Refereed()
+        refereed.outbox = Outbox()
+        clients.append(refereed)
+    return clients
+
+
+def agreement():
+    ref = referee.Referee(1, Metrics())
+    addrs = [('10.0.0.1', 1), ('10.0.0.2', 2)]
+    ref.addMatch(*addrs)
+    clients = newClients(2)
+    undecided = 0
+    mismatches = []
+    expected = {None: 0, 'both': referee.VERDICT_TIE, 'other': referee.VERDICT_PLAYER2, 'self': referee.VERDICT_PLAYER1}
+    frames = []
+    for roundnumber in range(ROUNDS):
+        game = newGame()
+        for refereed in clients:
+            refereed.newRound(roundnumber)
+        pilots = [RandomPilot(random.Random(roundnumber * 2)), RandomPilot(random.Random(roundnumber * 2 + 1))]
+        outcome = None
+        for frame in range(MAXFRAMES):
+            actions = [pilot.step(frame) for pilot in pilots]
+            for refereed, own in zip(clients, actions):
+                refereed.record(own)
+                if frame % referee.Refereed.SEND_INTERVAL == 0:
+                    refereed.send(refereed.outbox)
+            with contextlib.redirect_stdout(None):
+                result = game.simulate(actions)
+            exchange(ref, clients, addrs)
+            if result is not None:
+                outcome = 'both' if result.get('both') else 'other' if result.get('other') else 'self'
+                break
+        for _ in range(5):  # the rest of the inputs, like after a round on the real thing
+            for refereed in clients:
+                refereed.send(refereed.outbox)
+            exchange(ref, clients, addrs)
+
+        if outcome is None:
+            undecided += 1
+        elif clients[0].verdict == expected[outcome] and clients[0].frames == frame + 1:
+            frames.append(frame + 1)
+        else:
+            mismatches.append(f'round {roundnumber}: the game says {outcome} in frame {frame + 1}, the referee {clients[0].verdict} after {clients[0].frames} frames')
+    assert not mismatches, 'the referee decided differently from the game in ' + '; '.join(mismatches)
+    print(f'{ROUNDS} rounds, {numpy.mean(frames) / FPS if frames else 0:.1f} s on average: the referee decided all {len(frames)} the same as the game (outcome and frame); nobody died in {undecided}')
+
+
+def throughput(num_matches, perMatch):
+    rng = numpy.random.default_rng(1)
+    ref = referee.Referee(num_matches, Metrics())
+    addrs = [('10.0.0.1', port) for port in range(2 * num_matches)]
+    clients = newClients(2 * num_matches)
+    for m in range(num_matches):
+        ref.addMatch(addrs[2 * m], addrs[2 * m + 1])
+    envs = [VectorEnv(1) for _ in range(num_matches)] if perMatch else None
+    if perMatch:
+        for env in envs:
+            env.reset()
+
+    frames = SECONDS * FPS
+    inputs = numpy.where(rng.random((frames, 2 * num_matches)) < 0.5, 0, 1 << rng.integers(0, 7, (frames, 2 * num_matches))).astype(numpy.uint8)
+    cpu = 0
+    rounds = 0
+    for frame in range(frames):
+        if perMatch:
+            start = time.process_time()
+            for m, env in enumerate(envs):
+                env.step(inputs[frame, 2 * m : 2 * m + 2].reshape(1, 2))
+            cpu += time.process_time() - start
+            continue
+
+        for i, refereed in enumerate(clients):
+            if refereed.verdict != 0:
+                refereed.newRound(refereed.round + 1)  # a rematch right away
+                rounds += 1
+            refereed.inputs.append(int(inputs[frame, i]))
+            if frame % referee.Refereed.SEND_INTERVAL == 0:
+                refereed.send(refereed.outbox)
+        packets = [(msg, addrs[i]) for i, refereed in enumerate(clients) for msg in refereed.outbox.packets]
+        for refereed in clients:
+            refereed.outbox.packets = []
+
+        start = time.process_time()
+        answers = [(ref.receive(addr, msg), addr) for msg, addr in packets]
+        answers += ref.tick()
+        cpu += time.process_time() - start
+
+        for answer, addr in answers:
+            if answer is not None:
+                clients[addrs.index(addr) if num_matches < 50 else addr[1]].receive(answer)
+    return cpu / SECONDS, rounds / 2
+
+
+agreement()
+print()
+print(f'{"matches":>8} {"referee CPU ms/s":>17} {"per match":>10} {"rounds":>7} {"loop per match ms/s":>20} {"per match":>10}')
+for num_matches in (1, 10, 100, 300):
+    batched, rounds = throughput(num_matches, False)
+    looped, _ = throughput(num_matches, True)
+    print(f'{num_matches:>8} {batched * 1000:>17.1f} {batched * 1000 / num_matches:>10.2f} {rounds:>7.0f} {looped * 1000:>20.1f} {looped * 1000 / num_matches:>10.2f}')
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# Relay throughput of server.py: how many packets between married clients it forwards per second of server CPU time, for the current Server class and
+# for the same without recvmmsg/sendmmsg (as on non-Linux platforms), and for the loop as it was before the relay fast path (one blocking recvfrom, timeout handling and the full state machine for every packet).
+# The server runs in a child process on localhost and this process plays all the clients. We divide by the server's CPU time rather than wall time,
+# so the number says what one core can do, even though the load generator competes with it for the CPU.
+# Run from anywhere: python3 bench/relay.py
+
+import sys, os, time, socket, signal, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+import src.mplib as mplib
+from src.sessions import SessionTable
+from src.matchmaking import MatchQueue
+
+PAIRS = 50
+DURATION = 3  # seconds of sending per implementation
+PACKET = b'\x00' + bytes(mplib.updatestruct.size + 10 * mplib.bulletstruct.size)  # an update with 10 bullets
+
+
+def legacyLoop(sock):
+    # server.py's main loop from before the fast path, minus the printing
+    clients = SessionTable(server.PLAYERTIMEOUT)
+    waitingroom = MatchQueue()
+    nextexpiry = 0
+    sock.settimeout(server.EXPIRYINTERVAL)
+    while True:
+        try:
+            try:
+                msg, addr = sock.recvfrom(mplib.maximumsize)
+            except socket.timeout:
+                msg = None
+
+            now = time.time()
+            if now >= nextexpiry:
+                for client in clients.expire(now):
+                    waitingroom.remove(client)
+                nextexpiry = now + server.EXPIRYINTERVAL
+
+            if msg is None:
+                continue
+
+            if addr not in clients:
+                if msg != mplib.clienthello:
+                    continue
+                clients[addr] = {'token': server.genToken(), 'state': server.STATE_POLITELY_GREETED, 'lastseen': now}
+                sock.sendto(mplib.serverhello + clients[addr]['token'], addr)
+
+            else:
+                if msg.startswith(mplib.playerquits):
+                    del clients[addr]
+                    waitingroom.remove(addr)
+                    continue
+
+                clients[addr]['lastseen'] = now
+
+                if clients[addr]['state'] == server.STATE_POLITELY_GREETED:
+                    token = clients[addr]['token']
+                    if msg[ : len(token)] != token or len(msg) > len(token) + mplib.maxbucketsize:
+                        sock.sendto(mplib.protocolerr, addr)
+                    else:
+                        clients[addr]['state'] = server.STATE_SHOWN_WORTHINESS
+                        bucket = msg[len(token) : ]
+                        other_client = waitingroom.pop(bucket, now)
+                        if other_client is not None:
+                            clients[other_client]['partner'] = addr
+                            clients[other_client]['state'] = server.STATE_MARRIED_A_PLAYER
+                            clients[addr]['partner'] = other_client
+                            clients[addr]['state'] = server.STATE_MARRIED_A_PLAYER
+                            sock.sendto(mplib.urplayertwo, addr)
+                            sock.sendto(mplib.playerfound, other_client)
+                        else:
+                            waitingroom.add(addr, bucket, now)
+                            sock.sendto(mplib.urplayerone, addr)
+
+                elif clients[addr]['state'] == server.STATE_MARRIED_A_PLAYER:
+                    sock.sendto(msg, clients[addr]['partner'])
+
+        except KeyboardInterrupt:
+            break
+
+        except Exception as e:
+            server.printException(e)
+
+
+def fastLoop(sock):
+    server.Server(sock).run()
+
+
+def fastLoopWithoutMmsg(sock):
+    relay = server.Server(sock)
+    relay.batch = None  # what non-Linux platforms get
+    relay.run()
+
+
+def serve(loop, pipe):
+    sys.stdout = open(os.devnull, 'w')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    pipe.send(sock.getsockname())
+    loop(sock)
+
+
+def clientSocket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2)
+    return sock
+
+
+def handshake(sock, serveraddr):
+    sock.sendto(mplib.clienthello, serveraddr)
+    msg, _ = sock.recvfrom(mplib.maximumsize)
+    sock.sendto(msg[len(mplib.serverhello) : ], serveraddr)
+
+
+def bench(loop):
+    ours, theirs = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(loop, theirs))
+    process.start()
+    serveraddr = ours.recv()
+
+    senders = []
+    receivers = []
+    for _ in range(PAIRS):
+        a = clientSocket()
+        b = clientSocket()
+        handshake(a, serveraddr)
+        a.recvfrom(mplib.maximumsize)  # you are player one
+        handshake(b, serveraddr)
+        b.recvfrom(mplib.maximumsize)  # you are player two
+        a.recvfrom(mplib.maximumsize)  # player two found
+        b.setblocking(False)
+        senders.append(a)
+        receivers.append(b)
+
+    time.sleep(0.1)
+    for receiver in receivers:
+        while True:
+            try:
+                receiver.recv(mplib.maximumsize)  # where the partner is (mplib.partnerat), from servers that say so
+            except BlockingIOError:
+                break
+
+    cpubefore = os.times()
+    received = 0
+    sent = 0
+    end = time.time() + DURATION
+    while time.time() < end:
+        for sender in senders:
+            sender.sendto(PACKET, serveraddr)
+        sent += len(senders)
+        for receiver in receivers:
+            while True:
+                try:
+                    receiver.recv(mplib.maximumsize)
+                    received += 1
+                except BlockingIOError:
+                    break
+
+    time.sleep(0.2)  # let the server finish what is in its buffer
+    for receiver in receivers:
+        while True:
+            try:
+                receiver.recv(mplib.maximumsize)
+                received += 1
+            except BlockingIOError:
+                break
+
+    os.kill(process.pid, signal.SIGINT)
+    process.join()
+    cpuafter = os.times()
+    servercpu = (cpuafter.children_user - cpubefore.children_user) + (cpuafter.children_system - cpubefore.children_system)
+    for sock in senders + receivers:
+        sock.close()
+    return sent, received, servercpu
+
+
+print(f'{PAIRS} married pairs, {len(PACKET)}-byte packets, {DURATION} s per implementation')
+print(f'{"loop":>10} {"sent":>9} {"relayed":>9} {"server CPU s":>13} {"packets/CPU-second":>19}')
+results = {}
+for name, loop in (('legacy', legacyLoop), ('no mmsg', fastLoopWithoutMmsg), ('fast', fastLoop)):
+    sent, received, servercpu = bench(loop)
+    results[name] = received / servercpu
+    print(f'{name:>10} {sent:>9} {received:>9} {servercpu:>13.2f} {results[name]:>19.0f}')
+print(f'Speedup over legacy: {results["no mmsg"] / results["legacy"]:.2f}x without mmsg, {results["fast"] / results["legacy"]:.2f}x with')
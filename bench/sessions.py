@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Per-packet session bookkeeping cost in server.py: the old full scan for timed-out clients on every packet versus SessionTable
+# Run from anywhere: python3 bench/sessions.py
+
+import sys, os, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.sessions import SessionTable
+
+PLAYERTIMEOUT = 600
+EXPIRYINTERVAL = 1
+PACKETS = 20000
+PACKETS_PER_SECOND = 60  # per client, which is what a playing client sends
+
+
+def addresses(n):
+    return [('10.{}.{}.{}'.format(i >> 16, (i >> 8) & 255, i & 255), 9473) for i in range(n)]
+
+
+def benchScan(n):
+    clients = {}
+    now = time.time()
+    for addr in addresses(n):
+        clients[addr] = {'lastseen': now}
+    order = [random.choice(list(clients)) for _ in range(1000)]
+
+    packets = max(10, min(PACKETS, 20000000 // n))  # the scan is slow with many clients, measure fewer packets there
+    start = time.perf_counter()
+    for i in range(packets):
+        addr = order[i % len(order)]
+        timed_out = [client for client in clients if clients[client]['lastseen'] < time.time() - PLAYERTIMEOUT]
+        for client in timed_out:
+            del clients[client]
+        clients[addr]['lastseen'] = time.time()
+    return (time.perf_counter() - start) / packets
+
+
+def benchSessionTable(n):
+    clients = SessionTable(PLAYERTIMEOUT)
+    # spread the deadlines so that expire() has work to do during the measurement, as it would on a live server
+    now = time.time()
+    for addr in addresses(n):
+        clients[addr] = {'lastseen': now - PLAYERTIMEOUT + random.uniform(0, 60)}
+    order = [random.choice(list(clients)) for _ in range(1000)]
+
+    # simulated clock: with n clients at 60 packets/s each, this much time passes between packets
+    clock = now
+    tick = 1 / (n * PACKETS_PER_SECOND)
+    nextexpiry = 0
+    start = time.perf_counter()
+    for i in range(PACKETS):
+        addr = order[i % len(order)]
+        clock += tick
+        if clock >= nextexpiry:
+            clients.expire(clock)
+            nextexpiry = clock + EXPIRYINTERVAL
+        session = clients.get(addr)
+        if session is not None:
+            session['lastseen'] = clock
+        else:
+            clients[addr] = {'lastseen': clock}
+    return (time.perf_counter() - start) / PACKETS
+
+
+random.seed(1)
+print(f'{"clients":>8} {"full scan µs/packet":>20} {"SessionTable µs/packet":>23}')
+for n in (10, 100, 1000, 10000):
+    print(f'{n:>8} {benchScan(n) * 1e6:>20.2f} {benchSessionTable(n) * 1e6:>23.2f}')
+
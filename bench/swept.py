@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# What Game.sweptcollisions does at larger values of Game.timeStep.
+# 1. Bullets fired from all around at a craft orbiting the well like the players do, from 60-200 px away, with some aimed off to the side. For every
+#    timeStep, the bullets that hit are compared with what happens at the default timeStep (0.1) with swept collisions: "differ" is the number of
+#    bullets that hit at one but not the other, i.e. that would change a match. Without swept collisions, bullets fly through the craft, and they are
+#    tested against where the craft was a step ago, which is further off the larger the step.
+# 2. Bullets fired at the gravity well, which all should fall in; "through" is how many came out the other side.
+# 3. The cost: BulletSwarm.advance and collide() with both players per frame, for 1000 bullets orbiting all over the screen.
+# Run from anywhere: python3 bench/swept.py
+
+import sys, os, math, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+from settings import settings
+from src.setting import Setting
+from src.body import Body
+from src.bullet_swarm import BulletSwarm
+
+SCREENSIZE = (100000, 100000)  # so nothing flies out
+BULLETS = 2000
+SIMULATED = 10  # seconds of game time
+CRAFTRADIUS = 21.8  # about Player.collisionRadius
+TIMESTEPS = (0.1, 0.5, 1, 2)
+FRAMES = 300
+
+
+def configure(timestep, swept):
+    settings['Game.timeStep'].val = timestep
+    settings['Game.sweptcollisions'].val = swept
+    Setting.freeze(settings)
+
+
+def craft():
+    # Where player 1 starts
+    return Body(pygame.math.Vector2(settings['Player1.x'].val, settings['Player1.y'].val), pygame.math.Vector2(settings['Player1.xspeed'].val, settings['Player1.yspeed'].val), settings['Player.mass'].val)
+
+
+def shots(n, rng, target, spread):
+    # Bullets fired from `distance` away at `target`, missing it by up to `spread` px to either side
+    for _ in range(n):
+        a = rng.uniform(0, 2 * math.pi)
+        distance = rng.uniform(60, 200)
+        speed = rng.uniform(40, 80)
+        offset = rng.uniform(-spread, spread)
+        x = target[0] + distance * math.cos(a) - offset * math.sin(a)
+        y = target[1] + distance * math.sin(a) + offset * math.cos(a)
+        yield (x, y, -speed * math.cos(a), -speed * math.sin(a))
+
+
+def craftHits(timestep, swept):
+    # The ids of the bullets that hit the craft. Hits do not stop the craft, and every bullet is fired at the start, aimed at where the craft
+    # will be when the bullet gets there if it flew straight.
+    configure(timestep, swept)
+    target = craft()
+    swarm = BulletSwarm()
+    for x, y, xspeed, yspeed in shots(BULLETS, random.Random(1), (target.pos.x, target.pos.y), CRAFTRADIUS * 2):
+        swarm.add(x, y, xspeed + target.speed.x, yspeed + target.speed.y)
+    hits = set()
+    for _ in range(int(round(SIMULATED / timestep))):
+        swarm.advance(SCREENSIZE)
+        before = set(swarm.ids[ : swarm.count].tolist())
+        swarm.collide(round(target.pos.x), round(target.pos.y), CRAFTRADIUS, target.speed.x, target.speed.y)
+        hits |= before - set(swarm.ids[ : swarm.count].tolist())
+        target.advance()
+    return hits
+
+
+def wellTunnels(timestep, swept):
+    configure(timestep, swept)
+    swarm = BulletSwarm()
+    for bullet in shots(BULLETS, random.Random(2), (0, 0), settings['GW.radius'].val):
+        swarm.add(*bullet)
+    for _ in range(int(round(SIMULATED / timestep))):
+        swarm.advance(SCREENSIZE)
+    return swarm.count
+
+
+def cost(swept):
+    configure(0.1, swept)
+    rng = random.Random(3)
+    gm = settings['GW.mass'].val * Body.GRAVITATIONAL_CONSTANT
+    swarm = BulletSwarm()
+    for _ in range(1000):
+        r = rng.uniform(100, 450)
+        a = rng.uniform(0, 2 * math.pi)
+        v = math.sqrt(gm / r)
+        swarm.add(r * math.cos(a), r * math.sin(a), -v * math.sin(a), v * math.cos(a))
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        swarm.advance(SCREENSIZE)
+        a = frame / 100
+        swarm.collide(300 * math.cos(a), 300 * math.sin(a), CRAFTRADIUS, -3 * math.sin(a), 3 * math.cos(a))
+        swarm.collide(-300 * math.cos(a), -300 * math.sin(a), CRAFTRADIUS, 3 * math.sin(a), -3 * math.cos(a))
+    return (time.perf_counter() - start) / FRAMES * 1e6
+
+
+reference = craftHits(0.1, True)
+print(f'{BULLETS} bullets at a craft and at the well, {SIMULATED} s of game time ({len(reference)} hit the craft at timeStep 0.1 with swept collisions)')
+print(f'{"timeStep":>8} {"swept":>6} {"craft hits":>11} {"differ":>7} {"well: through":>14}')
+for timestep in TIMESTEPS:
+    for swept in (False, True):
+        hits = craftHits(timestep, swept)
+        print(f'{timestep:>8} {str(swept):>6} {len(hits):>11} {len(hits ^ reference):>7} {wellTunnels(timestep, swept):>14}')
+
+print()
+for swept in (False, True):
+    print(f'advance() and two collide() per frame for 1000 bullets, swept {swept}: {cost(swept):.0f} µs')
+configure(0.1, False)
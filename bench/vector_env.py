@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# Steps per second of VectorEnv with random actions, for a few batch sizes
+# Run from anywhere: python3 bench/vector_env.py
+
+import sys, os, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+from src.vector_env import VectorEnv
+
+STEPS = 1000
+
+print(f'{"matches":>8} {"env steps/s":>12} {"match steps/s":>14} {"match steps/hour":>17}')
+for num_matches in (1, 16, 256, 4096):
+    env = VectorEnv(num_matches)
+    env.reset()
+    rng = numpy.random.default_rng(1)
+    actions = numpy.where(rng.random((STEPS, num_matches, 2)) < 0.5, 0, 1 << rng.integers(0, 7, (STEPS, num_matches, 2)))
+
+    start = time.perf_counter()
+    for i in range(STEPS):
+        env.step(actions[i])
+    rate = STEPS / (time.perf_counter() - start)
+    print(f'{num_matches:>8} {rate:>12.0f} {rate * num_matches:>14.0f} {rate * num_matches * 3600:>17.2e}')
+
@@ -13,103 +13,586 @@ PORT = 9473
 BINDIP = '0.0.0.0'
 MAXPLAYERS = 100
 PLAYERTIMEOUT = 600
+# How often (seconds) to check for clients that timed out
+EXPIRYINTERVAL = 1
+# How often (seconds) to print statistics, if anything happened in the meantime
+STATSINTERVAL = 60
+# Local UDP port that answers any datagram with the server's metrics as JSON, e.g.: echo | nc -u -w1 127.0.0.1 9474
+# Set to None to disable. Not meant to be reachable from the internet, hence the separate bind address.
+STATSPORT = 9474
+STATSBINDIP = '127.0.0.1'
+# Maximum number of datagrams to read per wakeup before checking timeouts and the coordinator again
+RELAYBATCH = 256
+# Number of processes that receive and relay packets. With more than one, every worker binds PORT with SO_REUSEPORT (Linux or a BSD) so the kernel spreads
+# the clients over them, and a coordinator process does the matchmaking and keeps the player count. Use about as many as you have cores.
+WORKERS = 1
+# Have the server simulate every match from the players' inputs and decide about hits and deaths, instead of the players' games (see src/referee.py).
+# Needs numpy, and pygame and the images in res/ for the masks of the craft (see src/vector_env.py). Only matches of which both players are on the same
+# worker are refereed, so this goes best with WORKERS = 1.
+AUTHORITATIVE = False
+# Times per second that the referee simulates whatever frames it has both players' inputs for
+REFEREERATE = 60
 
-import socket, os, hashlib, time
+import socket, os, hashlib, time, selectors, multiprocessing, multiprocessing.connection
 import src.mplib as mplib
+import src.mmsg as mmsg
+from src.sessions import SessionTable
+from src.matchmaking import MatchQueue
+from src.metrics import Metrics, Reporter, merge, toJson, logLine
 
 STATE_POLITELY_GREETED = 1
 STATE_SHOWN_WORTHINESS = 2
 STATE_MARRIED_A_PLAYER = 3
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-sock.bind((BINDIP, PORT))
-print('Listening on', (BINDIP, PORT))
-
-clients = {}
 
 def genToken():
     return hashlib.sha256(os.urandom(12)).digest()[0 : 12]
 
 
-while True:
-    try:  # wrap this whole thing in a try-except so that bugs are not immediately fatal
-        msg, addr = sock.recvfrom(mplib.maximumsize)
+def printException(e):
+    print('{} in {} line {}'.format(
+            type(e).__name__,
+            __file__,
+            e.__traceback__.tb_lineno
+        )
+    )
+
+
+def bindSocket(reuseport=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((BINDIP, PORT))
+    return sock
+
+
+def bindStatsSocket():
+    if STATSPORT is None:
+        return None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((STATSBINDIP, STATSPORT))
+    sock.setblocking(False)
+    return sock
+
+
+def answerStatsQueries(statssock, report):
+    # `report` is called (without arguments) only if someone asked
+    answer = None
+    while True:
+        try:
+            _, addr = statssock.recvfrom(mplib.maximumsize)
+        except BlockingIOError:
+            break
+        if answer is None:
+            answer = toJson(report())
+        statssock.sendto(answer, addr)
+
+
+class Server:
+    # Handles the clients whose packets arrive on one socket. Normally that is everyone, but with WORKERS > 1 each worker process runs one of these.
+    # A worker only knows its own clients: it asks the coordinator (over a multiprocessing pipe) for a partner, and the coordinator tells it when one of
+    # its clients got married or should be dropped. Since all workers' sockets are bound to the same address, any worker can send to any client, so
+    # relaying never needs the coordinator, even when the partners are on different workers.
+
+    def __init__(self, sock, coordinator=None, playercount=None, authoritative=AUTHORITATIVE):
+        self.sock = sock
+        self.coordinator = coordinator
+        self.playercount = playercount  # multiprocessing.Value with the number of clients on all workers together, kept by the coordinator
+        self.clients = SessionTable(PLAYERTIMEOUT)
+        self.partners = {}  # addr: partner addr, for every married client; kept next to `clients` so that relaying a packet is a single dict lookup
+        self.rawpartners = {}  # the same in mmsg.toSockaddr() form, as (partner, addr), for relayBatchMmsg()
+        self.batch = None
+        if sock is not None and mmsg.AVAILABLE:
+            self.batch = mmsg.MessageBatch(sock, RELAYBATCH, mplib.maximumsize)
+        self.waitingroom = MatchQueue()  # only used without a coordinator
+        self.metrics = Metrics()
+        self.reporter = Reporter(time.time())
+        self.statssock = None  # with a coordinator, the coordinator answers on STATSPORT
+        self.referee = None
+        if authoritative:
+            from src.referee import Referee  # not at the top, since only the referee needs numpy
+            self.referee = Referee(MAXPLAYERS // 2 + 1, self.metrics)
+
+    def numPlayers(self):
+        if self.playercount is None:
+            return len(self.clients)
+        return max(len(self.clients), self.playercount.value)  # the coordinator might not have heard of our newest clients yet
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        self.sock.setblocking(False)
+        selector.register(self.sock, selectors.EVENT_READ)
+        if self.coordinator is not None:
+            selector.register(self.coordinator, selectors.EVENT_READ)
+        else:
+            self.statssock = bindStatsSocket()
+            if self.statssock is not None:
+                selector.register(self.statssock, selectors.EVENT_READ)
+
+        nextexpiry = 0
+        nextstats = time.time() + STATSINTERVAL
+        nexttick = 0
+        while True:
+            try:  # wrap this whole thing in a try-except so that bugs are not immediately fatal
+                timeout = EXPIRYINTERVAL  # so that timeouts are also processed while nobody is sending anything
+                if self.referee is not None:
+                    timeout = min(timeout, max(0, nexttick - time.time()))
+                events = selector.select(timeout=timeout)
+
+                now = time.time()
+                if now >= nextexpiry:
+                    self.expire(now)
+                    if self.coordinator is not None:
+                        self.coordinator.send(('metrics', self.metrics.snapshot(), self.sessionCounts()))
+                    nextexpiry = now + EXPIRYINTERVAL
+
+                if now >= nextstats and self.coordinator is None:
+                    snapshot = self.metrics.snapshot()
+                    if not self.reporter.idle(snapshot) or len(self.waitingroom) > 0:
+                        print(logLine(self.report(now)))
+                    self.reporter.mark(snapshot, now)
+                    nextstats = now + STATSINTERVAL
+
+                for key, _ in events:
+                    if key.fileobj is self.coordinator:
+                        while self.coordinator.poll():
+                            self.handleCoordinatorMessage(self.coordinator.recv())
+                        continue
+
+                    if key.fileobj is self.statssock:
+                        answerStatsQueries(self.statssock, lambda: self.report(now))
+                        continue
+
+                    start = time.perf_counter_ns()
+                    if self.batch is not None:
+                        n = self.relayBatchMmsg(now)
+                    else:
+                        n = self.relayBatch(now)
+                    if n > 0:
+                        self.metrics.packettime.add((time.perf_counter_ns() - start) // n, n)
+
+                if self.referee is not None and time.time() >= nexttick:
+                    for msg, addr in self.referee.tick():
+                        self.sendto(msg, addr)
+                    nexttick = max(nexttick + 1 / REFEREERATE, time.time())  # if we fall behind, we skip ticks rather than trying to make up for them
+
+            except KeyboardInterrupt:
+                # TODO would be cool if we could notify clients that the server is quitting
+                # though I'd currently assume that the clients also run, or coordinate with whomever is running, the server
+                break
+
+            except EOFError:
+                break  # the coordinator is gone, so are we
+
+            except Exception as e:
+                self.swallow(e)
+
+    def swallow(self, e):
+        self.metrics.exceptions += 1
+        printException(e)
+
+    def sendto(self, msg, addr):
+        try:
+            self.sock.sendto(msg, addr)
+        except BlockingIOError:
+            # The send buffer is full. That is what UDP is for: drop it, and do not make an overloaded server also print tracebacks
+            self.metrics.senddrops += 1
+            return
+        self.metrics.packetsout += 1
+        self.metrics.bytesout += len(msg)
+
+    def sessionCounts(self):
+        counts = {STATE_POLITELY_GREETED: 0, STATE_SHOWN_WORTHINESS: 0, STATE_MARRIED_A_PLAYER: 0}
+        for addr in self.clients:
+            counts[self.clients[addr]['state']] += 1
+        return {
+            'greeted': counts[STATE_POLITELY_GREETED],
+            'waiting': counts[STATE_SHOWN_WORTHINESS],
+            'married': counts[STATE_MARRIED_A_PLAYER],
+        }
+
+    def report(self, now):
+        return self.reporter.report(self.metrics.snapshot(), now, self.sessionCounts(), self.waitingroom.stats())
+
+    def relayBatch(self, now):
+        # Reads up to RELAYBATCH datagrams. Those of married clients (nearly all traffic) are forwarded right here, everything else goes to handlePacket().
+        # Python has no recvmmsg/sendmmsg, so this is still one system call per datagram each way; what we save is the interpreted work around it.
+        recvfrom = self.sock.recvfrom
+        sendto = self.sock.sendto
+        partners = self.partners
+        notrelayed = mplib.playerquits if self.referee is None else (mplib.playerquits, b'\x08')  # type 8 is for the referee
+        relayed = set()
+        received = 0
+        receivedbytes = 0
+        relayedpackets = 0
+        relayedbytes = 0
+        senddrops = 0
+
+        for _ in range(RELAYBATCH):
+            try:
+                msg, addr = recvfrom(mplib.maximumsize)
+            except BlockingIOError:
+                break
+            received += 1
+            receivedbytes += len(msg)
+
+            partner = partners.get(addr)
+            if partner is not None and not msg.startswith(notrelayed):
+                try:
+                    sendto(msg, partner)
+                    relayedpackets += 1
+                    relayedbytes += len(msg)
+                except BlockingIOError:
+                    senddrops += 1  # the send buffer is full (see sendto)
+                except OSError as e:
+                    self.swallow(e)
+                relayed.add(addr)
+                continue
+
+            try:
+                self.handlePacket(msg, addr, now)
+            except Exception as e:
+                self.swallow(e)
+
+        self.refresh(relayed, now)
+        self.countBatch(received, receivedbytes, relayedpackets, relayedbytes)
+        self.metrics.senddrops += senddrops
+        return received
+
+    def relayBatchMmsg(self, now):
+        # Same as relayBatch, but receiving and sending with one system call per batch (see src/mmsg.py)
+        batch = self.batch
+        n = batch.receive()
+        rawpartners = self.rawpartners
+        playerquits = mplib.playerquits
+        referee = self.referee
+        relayed = set()
+        otherpackets = 0
+        otherbytes = 0
+        receivedbytes = sum(batch.msglens[0 : n])
+        answered = 0
+        answeredbytes = 0
+        unsent = 0
+        unsentbytes = 0
+
+        start = 0  # packets from here on are waiting to be relayed
+        for i in range(n):
+            partner = rawpartners.get(batch.source(i))
+            if partner is not None and not batch.startswith(i, playerquits):
+                if referee is None or not batch.startswith(i, b'\x08'):
+                    batch.setDestination(i, partner[0])
+                    relayed.add(partner[1])
+                    continue
+                # Inputs for the referee are not relayed but answered, from the same spot in the batch, so that they do not break up the batch
+                msg, addr = batch.packet(i)
+                try:
+                    answer = referee.receive(partner[1], msg)
+                except Exception as e:
+                    self.swallow(e)
+                    answer = None
+                if answer is not None:
+                    batch.setPacket(i, answer)
+                    relayed.add(partner[1])
+                    answered += 1
+                    answeredbytes += len(answer)
+                    otherbytes += len(msg)
+                    continue
+
+            # Anything else (handshakes, quitting) is rare: send what we have so far to keep the order, then handle this packet the normal way
+            dropped, droppedbytes = batch.send(start, i)
+            unsent += dropped
+            unsentbytes += droppedbytes
+            start = i + 1
+            try:
+                msg, addr = batch.packet(i)
+                otherpackets += 1
+                otherbytes += len(msg)
+                self.handlePacket(msg, addr, now)
+            except Exception as e:
+                self.swallow(e)
+
+        dropped, droppedbytes = batch.send(start, n)
+        unsent += dropped
+        unsentbytes += droppedbytes
+        self.refresh(relayed, now)
+        # The packets that could not be sent are counted as relayed ones, although some of them may have been answers
+        self.countBatch(n, receivedbytes, n - otherpackets - answered - unsent, receivedbytes - otherbytes - unsentbytes)
+        self.metrics.packetsout += answered
+        self.metrics.bytesout += answeredbytes
+        self.metrics.senddrops += unsent
+        return n
+
+    def countBatch(self, received, receivedbytes, relayed, relayedbytes):
+        metrics = self.metrics
+        metrics.packetsin += received
+        metrics.bytesin += receivedbytes
+        metrics.relayed += relayed
+        metrics.packetsout += relayed
+        metrics.bytesout += relayedbytes
+
+    def refresh(self, addrs, now):
+        # 'lastseen' only matters on the scale of PLAYERTIMEOUT, so once per batch is plenty
+        clients = self.clients
+        for addr in addrs:
+            session = clients.get(addr)
+            if session is not None:
+                session['lastseen'] = now
 
-        timed_out = [client for client in clients if clients[client]['lastseen'] < time.time() - PLAYERTIMEOUT]
-        for client in timed_out:
+    def setPartner(self, addr, partner):
+        self.partners[addr] = partner
+        if self.batch is not None:
+            self.rawpartners[mmsg.toSockaddr(addr)] = (mmsg.toSockaddr(partner), addr)
+
+    def unsetPartner(self, addr):
+        if self.partners.pop(addr, None) is not None and self.batch is not None:
+            del self.rawpartners[mmsg.toSockaddr(addr)]
+
+    def expire(self, now):
+        for client in self.clients.expire(now):
+            self.unsetPartner(client)
+            if self.referee is not None:
+                self.referee.remove(client)
             # if 'partner' in clients[client]:  # honestly, the timeout is such that the 'partner' is long aware of their absence...
-            del clients[client]
-            print('a client timed out. Current player count:', len(clients))
+            if self.coordinator is None:
+                self.waitingroom.remove(client)
+            else:
+                self.coordinator.send(('left', client, None))
+            print('a client timed out. Current player count:', self.numPlayers())
+
+    def handlePacket(self, msg, addr, now):
+        clients = self.clients
 
         if addr not in clients:
             if msg != mplib.clienthello:
+                self.metrics.garbage += 1
                 print('Received garbage from', addr)
-                continue  # we are not home
+                return  # we are not home
 
-            if len(clients) >= MAXPLAYERS:
+            if self.numPlayers() >= MAXPLAYERS:
+                self.metrics.serverfull += 1
                 print('Returning "server full" to', addr)
-                sock.sendto(mplib.playerlimit, addr)
-                continue
+                self.sendto(mplib.playerlimit, addr)
+                return
 
             clients[addr] = {
                 'token': genToken(),
                 'state': STATE_POLITELY_GREETED,
-                'lastseen': time.time(),
+                'lastseen': now,
             }
-            sock.sendto(mplib.serverhello + clients[addr]['token'], addr)
+            if self.coordinator is not None:
+                self.coordinator.send(('joined', addr))
+            self.sendto(mplib.serverhello + clients[addr]['token'], addr)
 
-            print('New client from', addr, 'joined. Number of players, including them:', len(clients))
+            print('New client from', addr, 'joined. Number of players, including them:', self.numPlayers())
 
         else: # sender is known client
 
             if msg.startswith(mplib.playerquits):
-                if addr in clients:
-                    if 'partner' in clients[addr] and clients[addr]['partner'] in clients:
-                        sock.sendto(msg, clients[addr]['partner'])
-                        del clients[clients[addr]['partner']]
-                        print(addr, 'quit. We also terminated their partner at', clients[addr]['partner'], '  New player count:', len(clients) - 1)
-                    else:
-                        print(addr, 'quit. New player count:', len(clients) - 1)
-                    del clients[addr]
-                continue
+                partner = clients[addr].get('partner')
+                if partner is not None and (partner in clients or self.coordinator is not None):  # with a coordinator, the partner may be on another worker
+                    self.sendto(msg, partner)
+                    print(addr, 'quit. We also terminated their partner at', partner)
+                else:
+                    partner = None
+                    print(addr, 'quit.')
+                self.forget(addr, partner)
+                return
 
-            clients[addr]['lastseen'] = time.time()
+            clients[addr]['lastseen'] = now
 
             if clients[addr]['state'] == STATE_POLITELY_GREETED:
-                if msg != clients[addr]['token']:
+                # The token may be followed by a matchmaking bucket (see mplib.settingsbucket); older clients send just the token and all end up in the b'' bucket
+                token = clients[addr]['token']
+                if msg[ : len(token)] != token or len(msg) > len(token) + mplib.maxbucketsize:
                     # handshake failure. Send reset because we have enough bytes remaining before amplification
-                    sock.sendto(mplib.protocolerr, addr)
+                    self.metrics.handshakefailures += 1
+                    self.sendto(mplib.protocolerr, addr)
                 else:
                     clients[addr]['state'] = STATE_SHOWN_WORTHINESS
-                    found = False
-                    for other_client in clients:
-                        if clients[other_client]['state'] == STATE_SHOWN_WORTHINESS and other_client != addr:  # if there is another client waiting, match them up!
-                            found = True
-                            clients[other_client]['partner'] = addr
-                            clients[other_client]['state'] = STATE_MARRIED_A_PLAYER
-                            clients[addr]['partner'] = other_client
-                            clients[addr]['state'] = STATE_MARRIED_A_PLAYER
-                            sock.sendto(mplib.urplayertwo, addr)  # the client which just completed the handshake is player 2 because they came later than the one who was already in the clients list
-                            sock.sendto(mplib.playerfound, other_client)
-                            break
-
-                    if not found:
-                        sock.sendto(mplib.urplayerone, addr)
-
-            elif clients[addr]['state'] == STATE_MARRIED_A_PLAYER:
-                sock.sendto(msg, clients[addr]['partner'])
-
-    except KeyboardInterrupt:
-        # TODO would be cool if we could notify clients that the server is quitting
-        # though I'd currently assume that the clients also run, or coordinate with whomever is running, the server
-        break
-
-    except Exception as e:
-        print('{} in {} line {}'.format(
-                type(e).__name__,
-                __file__,
-                e.__traceback__.tb_lineno
-            )
-        )
+                    self.findPartner(addr, msg[len(token) : ], now)
+
+            elif clients[addr]['state'] == STATE_MARRIED_A_PLAYER:  # normally relayed in relayBatch() already
+                if self.referee is not None and msg.startswith(b'\x08'):
+                    answer = self.referee.receive(addr, msg)
+                    if answer is not None:
+                        self.sendto(answer, addr)
+                else:
+                    self.sendto(msg, clients[addr]['partner'])
+
+    def findPartner(self, addr, bucket, now):
+        if self.coordinator is not None:
+            self.coordinator.send(('wait', addr, bucket))  # answered with 'married' or 'queued'
+            return
+
+        other_client = self.waitingroom.pop(bucket, now)
+        if other_client is not None:  # if there is another client waiting, match them up!
+            self.marry(addr, other_client, mplib.urplayertwo)  # the client which just completed the handshake is player 2 because they came later than the one who was already waiting
+            self.marry(other_client, addr, mplib.playerfound)
+        else:
+            self.waitingroom.add(addr, bucket, now)
+            self.sendto(mplib.urplayerone, addr)
+
+    def marry(self, addr, partner, announcement):
+        if addr not in self.clients:
+            return  # left while the coordinator was looking for a partner
+
+        self.clients[addr]['partner'] = partner
+        self.clients[addr]['state'] = STATE_MARRIED_A_PLAYER
+        self.setPartner(addr, partner)
+        self.sendto(announcement, addr)
+        self.sendto(mplib.partnerat + mplib.peerstruct.pack(socket.inet_aton(partner[0]), partner[1]), addr)  # so that they can try talking directly
+        if self.referee is not None and announcement == mplib.playerfound and partner in self.clients:
+            # addr was waiting, so they are player 1. Player 2 (the partner) was married just before them, so both know who they are by now.
+            self.referee.addMatch(addr, partner)
+            self.sendto(mplib.refereed, addr)
+            self.sendto(mplib.refereed, partner)
+
+    def forget(self, addr, partner=None):
+        # Removes a client that quit and, if given, their partner
+        del self.clients[addr]
+        self.unsetPartner(addr)
+        if self.referee is not None:
+            self.referee.remove(addr)
+        if partner in self.clients:
+            del self.clients[partner]
+            self.unsetPartner(partner)
+
+        if self.coordinator is None:
+            self.waitingroom.remove(addr)
+            print('New player count:', len(self.clients))
+        else:
+            self.coordinator.send(('left', addr, partner))
+
+    def handleCoordinatorMessage(self, message):
+        kind, addr = message[0 : 2]
+        if kind == 'married':
+            self.marry(addr, message[2], message[3])
+        elif kind == 'queued':
+            if addr in self.clients:
+                self.sendto(mplib.urplayerone, addr)
+        elif kind == 'drop':
+            if addr in self.clients:
+                del self.clients[addr]
+                self.unsetPartner(addr)
+            if self.referee is not None:
+                self.referee.remove(addr)
+
+
+def runWorker(coordinator, playercount):
+    sock = bindSocket(reuseport=True)
+    Server(sock, coordinator, playercount).run()
+
+
+def coordinate(workers, playercount):
+    # Runs in the main process when WORKERS > 1. Messages from workers:
+    #   ('joined', addr)           a new client is on this worker
+    #   ('wait', addr, bucket)     the client did the handshake and wants a partner
+    #   ('left', addr, partner)    the client quit or timed out; if partner is not None, they are terminated as well
+    #   ('metrics', snapshot, sessions)   the worker's Metrics.snapshot() and Server.sessionCounts(), sent every EXPIRYINTERVAL
+    # Messages to workers:
+    #   ('married', addr, partner, announcement)   send the announcement (urplayertwo or playerfound) and start relaying to partner
+    #   ('queued', addr)           nobody to play with yet, tell the client they are player one
+    #   ('drop', addr)             forget this client, their partner quit
+
+    waitingroom = MatchQueue()
+    owners = {}  # addr: pipe to the worker that receives the client's packets
+    metrics = Metrics()  # for the coordinator's own exceptions
+    workermetrics = {}  # pipe: latest ('metrics', ...) message of that worker
+    reporter = Reporter(time.time())
+    statssock = bindStatsSocket()
+    nextstats = time.time() + STATSINTERVAL
+
+    def report(now):
+        sessions = {'greeted': 0, 'waiting': 0, 'married': 0}
+        for _, _, workersessions in workermetrics.values():
+            for state in sessions:
+                sessions[state] += workersessions[state]
+        snapshot = merge([metrics.snapshot()] + [snapshot for _, snapshot, _ in workermetrics.values()])
+        return snapshot, reporter.report(snapshot, now, sessions, waitingroom.stats())
+
+    while len(workers) > 0:
+        try:
+            for worker in multiprocessing.connection.wait(workers + ([statssock] if statssock is not None else []), timeout=EXPIRYINTERVAL):
+                if worker is statssock:
+                    answerStatsQueries(statssock, lambda: report(time.time())[1])
+                    continue
+
+                try:
+                    message = worker.recv()
+                except EOFError:
+                    print('A worker stopped')
+                    workers.remove(worker)
+                    continue
+
+                now = time.time()
+                kind, addr = message[0 : 2]
+                if kind == 'metrics':
+                    workermetrics[worker] = message
+                    continue
+
+                if kind == 'joined':
+                    owners[addr] = worker
+
+                elif kind == 'wait':
+                    other_client = waitingroom.pop(message[2], now)
+                    while other_client is not None and other_client not in owners:
+                        other_client = waitingroom.pop(message[2], now)
+
+                    if other_client is not None:
+                        worker.send(('married', addr, other_client, mplib.urplayertwo))
+                        owners[other_client].send(('married', other_client, addr, mplib.playerfound))
+                    else:
+                        waitingroom.add(addr, message[2], now)
+                        worker.send(('queued', addr))
+
+                elif kind == 'left':
+                    partner = message[2]
+                    for client in (addr, partner):
+                        if client is None:
+                            continue
+                        waitingroom.remove(client)
+                        owner = owners.pop(client, None)
+                        if client == partner and owner is not None and owner is not worker:
+                            owner.send(('drop', partner))
+                    print('New player count:', len(owners))
+
+                playercount.value = len(owners)
+
+            now = time.time()
+            if now >= nextstats:
+                snapshot, currentreport = report(now)
+                if not reporter.idle(snapshot) or len(waitingroom) > 0:
+                    print(logLine(currentreport))
+                reporter.mark(snapshot, now)
+                nextstats = now + STATSINTERVAL
+
+        except KeyboardInterrupt:
+            break
+
+        except Exception as e:
+            metrics.exceptions += 1
+            printException(e)
+
+
+if __name__ == '__main__':
+    if WORKERS <= 1:
+        sock = bindSocket()
+        print('Listening on', (BINDIP, PORT))
+        Server(sock).run()
+
+    else:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            print('WORKERS > 1 needs SO_REUSEPORT, which this platform does not have. Set WORKERS = 1.')
+            exit(1)
+
+        playercount = multiprocessing.Value('i', 0, lock=False)  # only the coordinator writes it
+        workers = []
+        for i in range(WORKERS):
+            ours, theirs = multiprocessing.Pipe()
+            multiprocessing.Process(target=runWorker, args=(theirs, playercount), daemon=True).start()
+            workers.append(ours)
 
+        print('Listening on', (BINDIP, PORT), 'with', WORKERS, 'workers')
+        coordinate(workers, playercount)
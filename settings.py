@@ -26,17 +26,31 @@ from src.setting import Setting
 prefs = {
     # Default server to connect to
     'Multiplayer.server': 'lucgommans.nl:9473',
-    # Average seconds between determining the bidirectional connection latency. The actual value is chosen in the range (pinginterval÷2, pinginterval×2).
-    # This is just an informational value that is printed to the console and includes frame time (=not very accurate).
-    'Multiplayer.pinginterval': 4,
+    # Average seconds between measuring the latency to the other player. The actual value is chosen in the range (pinginterval÷2, pinginterval×2).
+    # The round trip time, its jitter, and the difference between your clocks are printed to the console now and then and shown in the corner (see Game.show_latency).
+    'Multiplayer.pinginterval': 1,
+    # Try to send game packets straight to the other player instead of through the server, which is quicker. Falls back to the server if that does not work
+    'Multiplayer.direct': True,
+    # Only get matched with players whose game settings are the same as yours, instead of playing with the settings of whoever was waiting first
+    'Multiplayer.match_same_settings': False,
+    # Game updates sent to the other player per second, at most Game.FPS. Their game extrapolates your flight in between, so this mostly just costs bandwidth
+    'Multiplayer.updaterate': 30,
+    # When packets get lost, the update rate is halved for a while, down to this minimum. Set it to the same value as updaterate to always send at that rate
+    'Multiplayer.min_updaterate': 15,
 
     # Use simpler, faster graphics (currently does not make a big difference)
     'Game.simple_graphics': False,
     # The base image that goes behind everything else. Set to None for, well, none
     'Game.backgroundimage': 'res/Messier-101-test.jpg',
+    # Frames drawn per second, at most. Set this to your display's refresh rate. The game itself runs at Game.FPS (times --speed) regardless;
+    # things are drawn in between two game steps when the display is faster, and fast-forwarding with --speed draws only every so many steps
+    'Game.render_fps': 60,
     # Color and position of the main text messages
     'Game.text_color':      (  0, 90, 224),
     'Game.text_position':   (10, 50),
+    # Show the latency to the other player in multiplayer, and where
+    'Game.show_latency':    True,
+    'Game.latency_position': (10, 10),
 
     # Show a prediction line for bullets
     'Game.show_aim_guide':  True,
@@ -45,6 +59,9 @@ prefs = {
     # How long should the aim guide be? Measured in seconds, i.e. how far a bullet flies in 2 seconds (you might liken it to the 'light year' distance unit!)
     'Game.aim_guide_distance': 1.5,
 
+    # How far the left and right arrow keys jump while watching a replay (seconds)
+    'Game.replay_seek_seconds': 10,
+
     # Degrees you rotate per game step while holding down the left or right arrow key. Each degree requires a certain amount of energy so changing the value will not impact your energy consumption.
     'Player.rotate_speed':      5,
     # Same, but while holding Shift + arrow left or right.
@@ -93,6 +110,19 @@ settings = {
     'Game.FPS':        Setting(  60,   'H'),
     # How much time is simulated every frame
     'Game.timeStep':      Setting(   0.1, 'H', lambda n: int(round(n * 255)), lambda n: n / 255),
+    # How gravity moves things every step: 'euler' (semi-implicit Euler, the classic) or 'verlet' (velocity Verlet, which keeps orbits from slowly drifting,
+    # also with a larger Game.timeStep, at the cost of a bit more computation)
+    'Game.integrator': Setting('euler', 'B', lambda s: 1 if s == 'verlet' else 0, lambda n: 'verlet' if n == 1 else 'euler'),
+    # Up to how many smaller steps something takes per step when it passes close to the gravity well relative to its speed, where big steps are the least
+    # accurate. 1 to always take whole steps. This is meant for 'verlet': Euler does not get more accurate from smaller steps in only part of an orbit
+    'Game.maxsubsteps':Setting(   1,   'B'),
+    # Test bullet hits along the whole way that a bullet went during a step (against where the crafts went during that step, and against the gravity well)
+    # instead of only where it ended up. With a larger Game.timeStep, bullets otherwise fly straight through a craft or the well, so this is for running
+    # headless or refereed matches at a larger timeStep with about the same hits as at the default (see bench/swept.py)
+    'Game.sweptcollisions':Setting(False, 'B', lambda b: 1 if b else 0,    lambda b: True if b == 1 else False),
+    # In multiplayer, send only which keys you press and let both games simulate everything, instead of sending your position and bullets. Smaller packets
+    # (also with many bullets) and no trusting the other game about hits, but both players need the same game version. Also syncs the rotate and thrust preferences.
+    'Game.lockstep':   Setting(False,  'B', lambda b: 1 if b else 0,       lambda b: True if b == 1 else False),
 
     # How much damage a single hit incurs
     'Bullet.damage':   Setting(   0.06,'B', lambda n: int(round(n * 255)), lambda n: n / 255),
@@ -147,3 +177,5 @@ settings = {
     'GW.radius':       Setting(  30,   'B', lambda n: int(round(n * 2)), lambda n: n / 2),
 }
 
+# The simulation reads the settings from a snapshot (see Setting.freeze), of which this is the first
+Setting.freeze(settings)
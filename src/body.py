@@ -1,30 +1,132 @@
 import math
-from settings import settings
-from src.luclib import ZEROVECTOR, lengthdir_x, lengthdir_y
+import numpy
+import settings  # which makes the first Setting.frozen
+from src.setting import Setting
+from src.frozen import GRAVITATIONAL_CONSTANT
 
 class Body:
-    GRAVITATIONAL_CONSTANT = 6.6742e-11
+    GRAVITATIONAL_CONSTANT = GRAVITATIONAL_CONSTANT
+
+    # With Game.maxsubsteps above 1, a body that would move more than this fraction of its distance to the gravity well's center in one game step
+    # takes smaller steps instead. Far from the well that is never the case, so it only costs anything during close passes.
+    SUBSTEP_DISTANCE = 0.02
 
     def __init__(self, pos=None, speed=None, mass=None):
         self.pos = pos
         self.speed = speed
         self.mass = mass
 
+    def substeps(self, frozen):
+        # How many steps to split a game step into, at our current separation from the well's center and speed
+        if frozen.maxSubsteps <= 1:
+            return 1
+        distance = math.hypot(self.speed.x, self.speed.y) * frozen.timeStep
+        return max(1, min(frozen.maxSubsteps, math.ceil(distance / (Body.SUBSTEP_DISTANCE * math.hypot(self.pos.x, self.pos.y)))))
+
     def advance(self):
-        # does 2-body Newtonian gravity between itself and the GravityWell
+        # does 2-body Newtonian gravity between itself and the GravityWell, in one or more steps (see substeps) with the integrator from the Game.integrator setting
+        frozen = Setting.frozen
+        substeps = self.substeps(frozen)
+        if substeps == 1:
+            separation = self.step(frozen, frozen.timeStep, frozen.timeStepG)
+        else:
+            dt = frozen.timeStep / substeps
+            separation = min(self.step(frozen, dt, dt * Body.GRAVITATIONAL_CONSTANT) for _ in range(substeps))
+
+        # returns distance from gravity well's surface, at the closest of the steps (so a fast body cannot step over the well)
+        return separation - frozen.gwRadius  # GW assumed to be spherical
+
+    def step(self, frozen, dt, dtg):
+        # Moves dt seconds and returns the separation from the well's center from before the move. dtg is dt times the gravitational constant.
         separation_x = self.pos.x
         separation_y = self.pos.y
         separation_square = (separation_x * separation_x) + (separation_y * separation_y)
-        grav_accel = self.mass * settings['GW.mass'].val / separation_square * (settings['Game.timeStep'].val * Body.GRAVITATIONAL_CONSTANT)
         separation = math.sqrt(separation_square)
+
+        if frozen.verlet:
+            # Velocity Verlet: half a kick, the drift, and another half kick with the acceleration at the new position. It needs the acceleration
+            # twice per step, but unlike Euler it is time-reversible, so orbits do not slowly gain or lose energy.
+            half = frozen.gm / (separation_square * separation) * (dt / 2)
+            self.speed.x -= half * separation_x
+            self.speed.y -= half * separation_y
+            self.pos.x += self.speed.x * dt
+            self.pos.y += self.speed.y * dt
+            new_square = (self.pos.x * self.pos.x) + (self.pos.y * self.pos.y)
+            half = frozen.gm / (new_square * math.sqrt(new_square)) * (dt / 2)
+            self.speed.x -= half * self.pos.x
+            self.speed.y -= half * self.pos.y
+            return separation
+
+        # Semi-implicit Euler: the new speed, then the position with that speed
+        grav_accel = self.mass * frozen.gwMass / separation_square * dtg
         dir_x = separation_x / separation
         dir_y = separation_y / separation
 
         self.speed.x -= grav_accel / self.mass * dir_x
         self.speed.y -= grav_accel / self.mass * dir_y
-        self.pos.x += self.speed.x * settings['Game.timeStep'].val
-        self.pos.y += self.speed.y * settings['Game.timeStep'].val
+        self.pos.x += self.speed.x * dt
+        self.pos.y += self.speed.y * dt
+        return separation
+
+    def advanceMany(x, y, xspeed, yspeed, moving=None):
+        # The batched equivalent of advance() for bodies in numpy arrays, which are updated in place (they may be views, such as of a BulletSwarm).
+        # moving: optionally a boolean array like x, of the bodies to advance; the others stay where they are. Returns the separation from the well's
+        # center, at the closest of the steps like advance().
+        frozen = Setting.frozen
+        separation_square = (x * x) + (y * y)
+        separation = numpy.sqrt(separation_square)
+        dt = frozen.timeStep
+        gdt = frozen.gwMassTimeStepG  # G·M·dt, for Euler
+        if moving is not None:
+            dt = dt * moving
+            gdt = gdt * moving
+        if frozen.maxSubsteps <= 1:
+            Body.stepMany(frozen, x, y, xspeed, yspeed, dt, gdt, separation_square, separation)
+            return separation
+
+        substeps = numpy.clip(numpy.ceil(numpy.hypot(xspeed, yspeed) * dt / (Body.SUBSTEP_DISTANCE * separation)), 1, frozen.maxSubsteps)
+        dt = dt / substeps
+        gdt = frozen.gwMass * dt * Body.GRAVITATIONAL_CONSTANT
+        Body.stepMany(frozen, x, y, xspeed, yspeed, dt, gdt, separation_square, separation)
+        mostsubsteps = int(substeps.max())
+        if mostsubsteps == 1:
+            return separation
+
+        # Only the few that are close to the well take the further steps, so we work on copies of just those
+        close = numpy.flatnonzero(substeps > 1)
+        flat = [arr.reshape(-1) for arr in (x, y, xspeed, yspeed)]
+        cx, cy, cxspeed, cyspeed = [arr[close] for arr in flat]
+        cdt = dt.reshape(-1)[close]
+        csubsteps = substeps.reshape(-1)[close]
+        closest = separation.reshape(-1)[close]
+        for k in range(1, mostsubsteps):
+            stepping = cdt * (csubsteps > k)
+            square = (cx * cx) + (cy * cy)
+            distance = numpy.sqrt(square)
+            numpy.minimum(closest, numpy.where(stepping > 0, distance, closest), out=closest)
+            Body.stepMany(frozen, cx, cy, cxspeed, cyspeed, stepping, frozen.gwMass * stepping * Body.GRAVITATIONAL_CONSTANT, square, distance)
+        for arr, c in zip(flat, (cx, cy, cxspeed, cyspeed)):
+            arr[close] = c
+        separation.reshape(-1)[close] = closest
+        return separation
 
-        # returns distance from gravity well's surface
-        return separation - settings['GW.radius'].val  # GW assumed to be spherical
+    def stepMany(frozen, x, y, xspeed, yspeed, dt, gdt, separation_square, separation):
+        # One step of Body.step for arrays, in place, given the current separation. gdt is G·M·dt.
+        if frozen.verlet:
+            half = frozen.gm * (dt / 2) / (separation_square * separation)
+            xspeed -= half * x
+            yspeed -= half * y
+            x += xspeed * dt
+            y += yspeed * dt
+            new_square = (x * x) + (y * y)
+            half = frozen.gm * (dt / 2) / (new_square * numpy.sqrt(new_square))
+            xspeed -= half * x
+            yspeed -= half * y
+            return
 
+        # Body.step computes mass * GW.mass / r² * dt * G and then divides by the mass again; the mass cancels out. The extra /r normalizes the direction vector.
+        grav_accel = gdt / (separation_square * separation)
+        xspeed -= grav_accel * x
+        yspeed -= grav_accel * y
+        x += xspeed * dt
+        y += yspeed * dt
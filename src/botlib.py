@@ -16,6 +16,16 @@ class Result(Enum):
     TIE = 0
     WON = 1
 
+def toBitmask(actions):
+    # Packs a list of Action values into an int with one bit per action (SHOOT is bit 0, THRUST_FINE bit 6), so that it fits in a byte
+    mask = 0
+    for action in actions:
+        mask |= 1 << (action.value - Action.SHOOT.value)
+    return mask
+
+def fromBitmask(mask):
+    return [action for action in Action if mask & (1 << (action.value - Action.SHOOT.value))]
+
 def get_storage_directory():
     # the zeroth frame record is this function; the next frame on the stack is the one where we are being called from
     caller_frame = inspect.stack()[1]
@@ -1,46 +1,54 @@
 import pygame
-from settings import settings
 from src.body import Body
-from src.luclib import ZEROVECTOR, lengthdir_x, lengthdir_y, roundi
+from src.setting import Setting
+from src.bullet_swarm import BulletSwarm
+from src.luclib import lengthdir_x, lengthdir_y
 
-class Bullet(pygame.sprite.Sprite, Body):
-    # note: Bullet objects are always about locally-simulated bullets. The ones from a remote player (in online multiplayer) are in game.remotebullets.
+class Bullet(Body):
+    # note: Bullet objects are only used for a single trajectory, such as for a freshly fired shot or for drawing the aim guide.
+    # The bullets that are actually flying around are simulated in bulk by a BulletSwarm (game.bullets). The ones from a remote player (in online multiplayer) are in game.remotebullets.
 
-    # multiplied with the screen width/height -- set relatively low because players might otherwise wonder why bullets are coming out of nowhere when the shot was just below escape velocity
-    MAX_OUT_OF_SCREEN = 0.25
+    MAX_OUT_OF_SCREEN = BulletSwarm.MAX_OUT_OF_SCREEN
 
-    def __init__(self, playerobj, virtual=False):
-        # 'virtual' bullets are used for simulating where a bullet *would* go, e.g. to draw an aim guide / expected trajectory line.
+    def __init__(self, playerobj):
         # We do not store who the bullet belonged to because it does not matter: whoever collides with it gets damaged. The playerobj parameter is just for initial position and vector.
 
-        pygame.sprite.Sprite.__init__(self)
-
+        frozen = Setting.frozen
         x = playerobj.pos.x + lengthdir_x(playerobj.rotatedMaxSize, playerobj.angle)
         y = playerobj.pos.y + lengthdir_y(playerobj.rotatedMaxSize, playerobj.angle)
-        if settings['Bullet.relspeed'].val:
+        if frozen.bulletRelspeed:
             speed = pygame.math.Vector2(playerobj.speed)
         else:
-            speed = ZEROVECTOR
-        Body.__init__(self, pos=pygame.math.Vector2(x, y), speed=speed, mass=settings['Bullet.mass'].val)
-
-        self.speed.x += lengthdir_x(settings['Bullet.speed'].val, playerobj.angle)
-        self.speed.y += lengthdir_y(settings['Bullet.speed'].val, playerobj.angle)
-        self.virtual = virtual
+            speed = pygame.math.Vector2(0, 0)
+        Body.__init__(self, pos=pygame.math.Vector2(x, y), speed=speed, mass=frozen.bulletMass)
 
-        if not self.virtual:
-            # self.rect is only used in drawing code
-            self.rect = pygame.rect.Rect(0, 0, settings['Bullet.size'].val, settings['Bullet.size'].val)
+        self.speed.x += lengthdir_x(frozen.bulletSpeed, playerobj.angle)
+        self.speed.y += lengthdir_y(frozen.bulletSpeed, playerobj.angle)
 
     def advance(self, screensize):
         # Returns whether it should be removed (out of screen, fell into gravity well; no health-bearing-object collisions)
 
+        frozen = Setting.frozen
+        if frozen.swept:
+            fromx = self.pos.x
+            fromy = self.pos.y
+
         separation = super().advance()
 
-        if separation < settings['Bullet.size'].val:
+        if separation < frozen.bulletSize:
             return True
 
-        if not self.virtual:
-            self.rect.center = (roundi(self.pos.x), roundi(self.pos.y))
+        if frozen.swept:
+            # Like BulletSwarm.advance: the closest point of the way from where we were also counts for falling into the well
+            dx = self.pos.x - fromx
+            dy = self.pos.y - fromy
+            length = (dx * dx) + (dy * dy)
+            t = 0 if length == 0 else max(0, min(1, -((fromx * dx) + (fromy * dy)) / length))
+            closestx = fromx + (t * dx)
+            closesty = fromy + (t * dy)
+            reach = frozen.gwRadius + frozen.bulletSize
+            if (closestx * closestx) + (closesty * closesty) < reach * reach:
+                return True
 
         if self.pos.x < -(screensize[0] / 2) - ((screensize[0] / 2) * Bullet.MAX_OUT_OF_SCREEN) or self.pos.x > (screensize[0] / 2) + (screensize[0] / 2 * Bullet.MAX_OUT_OF_SCREEN) \
         or self.pos.y < -(screensize[1] / 2) - ((screensize[1] / 2) * Bullet.MAX_OUT_OF_SCREEN) or self.pos.y > (screensize[1] / 2) + (screensize[1] / 2 * Bullet.MAX_OUT_OF_SCREEN):
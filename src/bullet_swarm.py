@@ -0,0 +1,254 @@
+import numpy
+from src.body import Body
+from src.setting import Setting
+
+class BulletSwarm:
+    # All locally-simulated bullets, stored as a struct of arrays so that a frame is a handful of numpy operations rather than one Python call per bullet.
+    # Only the first `count` entries of each array are live; the rest is spare capacity so that shooting does not allocate.
+    # A swarm can hold the bullets of several independent matches (see VectorEnv); `match` says which one each bullet belongs to. The game itself only uses match 0.
+    # Every bullet has an id, e.g. for referring to it in network packets (see src/bulletsync.py).
+    # With Game.sweptcollisions, advance() keeps where the bullets were before the step in prevx and prevy, and hits are tested along the way from there.
+
+    # multiplied with the screen width/height -- set relatively low because players might otherwise wonder why bullets are coming out of nowhere when the shot was just below escape velocity
+    MAX_OUT_OF_SCREEN = 0.25
+
+    INITIAL_CAPACITY = 64
+
+    # From this many bullets on, collide() first picks out the bullets in the circle's column (see there); below it, testing every bullet is quicker (see bench/collisions.py)
+    COLUMN_MIN = 10000
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.count = 0
+        self.x = numpy.empty(capacity)
+        self.y = numpy.empty(capacity)
+        self.xspeed = numpy.empty(capacity)
+        self.yspeed = numpy.empty(capacity)
+        self.prevx = numpy.empty(capacity)
+        self.prevy = numpy.empty(capacity)
+        self.match = numpy.zeros(capacity, dtype=numpy.intp)
+        self.ids = numpy.zeros(capacity, dtype=numpy.int64)
+        self.nextid = 0
+        self.removed = None  # set this to a list to have the ids of removed bullets appended to it
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def grow(self, capacity):
+        for name in ('x', 'y', 'xspeed', 'yspeed', 'prevx', 'prevy', 'match', 'ids'):
+            old = getattr(self, name)
+            new = numpy.empty(capacity, dtype=old.dtype)
+            new[ : self.count] = old[ : self.count]
+            setattr(self, name, new)
+
+    def add(self, x, y, xspeed, yspeed, match=0, bulletid=None):
+        # Returns the bullet's id, which is the next free one unless specified
+        if self.count == len(self.x):
+            self.grow(len(self.x) * 2)
+
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.xspeed[i] = xspeed
+        self.yspeed[i] = yspeed
+        self.prevx[i] = x
+        self.prevy[i] = y
+        self.match[i] = match
+        if bulletid is None:
+            bulletid = self.nextid
+            self.nextid += 1
+        self.ids[i] = bulletid
+        self.count += 1
+        return bulletid
+
+    def addMany(self, x, y, xspeed, yspeed, match):
+        # Like add(), but all arguments are equally long arrays
+        n = len(x)
+        if n == 0:
+            return
+
+        if self.count + n > len(self.x):
+            self.grow(max(len(self.x) * 2, self.count + n))
+
+        end = self.count + n
+        self.x[self.count : end] = x
+        self.y[self.count : end] = y
+        self.xspeed[self.count : end] = xspeed
+        self.yspeed[self.count : end] = yspeed
+        self.prevx[self.count : end] = x
+        self.prevy[self.count : end] = y
+        self.match[self.count : end] = match
+        self.ids[self.count : end] = numpy.arange(self.nextid, self.nextid + n)
+        self.nextid += n
+        self.count = end
+
+    def compact(self, keep):
+        # Removes every bullet for which `keep` (a boolean array of length `count`) is False, preserving the order of the others
+        n = self.count
+        remaining = int(numpy.count_nonzero(keep))
+        if remaining == n:
+            return
+
+        if self.removed is not None:
+            self.removed.extend(self.ids[ : n][~keep].tolist())
+
+        for arr in (self.x, self.y, self.xspeed, self.yspeed, self.prevx, self.prevy, self.match, self.ids):
+            arr[ : remaining] = arr[ : n][keep]
+        self.count = remaining
+
+    def advance(self, screensize, active=None):
+        # The batched equivalent of calling Bullet.advance() on every bullet: Body.advance's gravity step(s), then removal of whatever fell into the gravity well or went too far out of screen
+        # active: optionally a boolean array indexed by match number, to only advance the bullets of those matches (see VectorEnv.step)
+
+        n = self.count
+        if n == 0:
+            return
+
+        x = self.x[ : n]
+        y = self.y[ : n]
+        xspeed = self.xspeed[ : n]
+        yspeed = self.yspeed[ : n]
+        frozen = Setting.frozen
+        moving = None
+        if active is not None:
+            moving = active[self.match[ : n]]
+        if frozen.swept:
+            self.prevx[ : n] = x
+            self.prevy[ : n] = y
+
+        separation = Body.advanceMany(x, y, xspeed, yspeed, moving)
+
+        # like in Body.advance, the separation from before the move (or the closest of the substeps) is what counts for falling into the well
+        died = separation - frozen.gwRadius < frozen.bulletSize
+        if frozen.swept:
+            # and also the closest point of the way from there, so that a bullet cannot step over the well
+            reach = frozen.gwRadius + frozen.bulletSize
+            died |= BulletSwarm.closestSquare(self.prevx[ : n], self.prevy[ : n], x, y) < reach * reach
+
+        maxx = (screensize[0] / 2) + (screensize[0] / 2 * BulletSwarm.MAX_OUT_OF_SCREEN)
+        maxy = (screensize[1] / 2) + (screensize[1] / 2 * BulletSwarm.MAX_OUT_OF_SCREEN)
+        died |= (numpy.abs(x) > maxx) | (numpy.abs(y) > maxy)
+        if moving is not None:
+            died &= moving
+
+        if died.any():
+            self.compact(~died)
+
+    def closestSquare(x0, y0, x1, y1):
+        # The squared distance from (0, 0) to the closest point of the line segments from (x0, y0) to (x1, y1), for arrays of segments. For a segment of
+        # length 0, that is the distance to (x0, y0).
+        dx = x1 - x0
+        dy = y1 - y0
+        # how far along the segment the closest point is, from 0 to 1 (a length of 0 has 0 on top, so the maximum only keeps it from dividing by zero)
+        t = numpy.clip(-((x0 * dx) + (y0 * dy)) / numpy.maximum((dx * dx) + (dy * dy), 1e-12), 0, 1)
+        closestx = x0 + (t * dx)
+        closesty = y0 + (t * dy)
+        return (closestx * closestx) + (closesty * closesty)
+
+    def collide(self, x, y, radius, xspeed=0, yspeed=0):
+        # Removes the bullets that overlap a circle at (x, y) with the given radius and returns their positions as a list of (x, y) tuples.
+        # The bullet's own radius is that of the circle around its square (like pygame.sprite.collide_circle computes for a sprite without a radius attribute).
+        # With Game.sweptcollisions, what counts instead is whether the bullet came that close at any point during the step, where the circle moves at
+        # xspeed, yspeed during that same step. (Otherwise, bullets that were just moved are compared with where the players were before they move, which
+        # is a step behind.)
+
+        n = self.count
+        if n == 0:
+            return []
+
+        frozen = Setting.frozen
+        reach = radius + frozen.bulletReach
+        if frozen.swept:
+            # the bullet's way relative to the circle, from where both were to where both will be. It can cross the circle's column without either end
+            # being in it, so there is no column to pick out first here
+            fromx = self.prevx[ : n] - x
+            fromy = self.prevy[ : n] - y
+            tox = self.x[ : n] - (x + (xspeed * frozen.timeStep))
+            toy = self.y[ : n] - (y + (yspeed * frozen.timeStep))
+            hit = BulletSwarm.closestSquare(fromx, fromy, tox, toy) <= reach * reach
+            if not hit.any():
+                return []
+        elif n < BulletSwarm.COLUMN_MIN:
+            dx = self.x[ : n] - x
+            dy = self.y[ : n] - y
+            hit = (dx * dx) + (dy * dy) <= reach * reach
+            if not hit.any():
+                return []
+        else:
+            # Broad phase: the circle spans only a narrow column of the screen, and one subtraction and comparison per bullet rules out all the others, so
+            # the exact test (the same as above) only runs for the few bullets in that column. 1 px to spare so that rounding cannot leave out a bullet that it would hit
+            near = numpy.flatnonzero(numpy.abs(self.x[ : n] - x) <= reach + 1)
+            dx = self.x[near] - x
+            dy = self.y[near] - y
+            near = near[(dx * dx) + (dy * dy) <= reach * reach]
+            if len(near) == 0:
+                return []
+            hit = numpy.zeros(n, dtype=bool)
+            hit[near] = True
+
+        positions = list(zip(self.x[ : n][hit].tolist(), self.y[ : n][hit].tolist()))
+        self.compact(~hit)
+        return positions
+
+    def collideMatches(self, x, y, radius, active=None, xspeed=None, yspeed=None):
+        # Like collide(), but for one circle per match: x and y are arrays indexed by match number, as is `active` to only check some matches, and so
+        # are xspeed and yspeed (which are needed with Game.sweptcollisions).
+        # Returns the match number of every bullet that hit, so a match hit by two bullets appears twice.
+
+        n = self.count
+        if n == 0:
+            return numpy.empty(0, dtype=numpy.intp)
+
+        frozen = Setting.frozen
+        reach = radius + frozen.bulletReach
+        match = self.match[ : n]
+        dx = self.x[ : n] - x[match]
+        dy = self.y[ : n] - y[match]
+        if frozen.swept:
+            hit = BulletSwarm.closestSquare(self.prevx[ : n] - x[match], self.prevy[ : n] - y[match], dx - (xspeed[match] * frozen.timeStep), dy - (yspeed[match] * frozen.timeStep)) <= reach * reach
+        else:
+            hit = (dx * dx) + (dy * dy) <= reach * reach
+        if active is not None:
+            hit &= active[match]
+        if not hit.any():
+            return numpy.empty(0, dtype=numpy.intp)
+
+        hitmatches = match[hit]
+        self.compact(~hit)
+        return hitmatches
+
+    def removeMatches(self, matches):
+        # Removes all bullets belonging to the given match numbers
+        if self.count > 0:
+            self.compact(~numpy.isin(self.match[ : self.count], matches))
+
+    def removeIds(self, ids):
+        if self.count > 0:
+            self.compact(~numpy.isin(self.ids[ : self.count], ids))
+
+    def indexOfId(self, bulletid):
+        # Where the bullet with this id is in the arrays, or None if there is no such bullet
+        found = numpy.flatnonzero(self.ids[ : self.count] == bulletid)
+        return int(found[0]) if len(found) > 0 else None
+
+    def getState(self):
+        # A copy of the bullets of match 0 as an (N, 4) array of x, y, xspeed, yspeed, e.g. for saving and restoring the game state
+        n = self.count
+        return numpy.column_stack((self.x[ : n], self.y[ : n], self.xspeed[ : n], self.yspeed[ : n]))
+
+    def setState(self, state):
+        self.clear()
+        self.addMany(state[:, 0], state[:, 1], state[:, 2], state[:, 3], 0)
+
+    def positions(self, behind=0):
+        # Iterates (x, y) tuples rounded to integer pixels, e.g. for drawing or network packets. With `behind`, where they were that many seconds of game time ago, going by their speed.
+        n = self.count
+        x = self.x[ : n]
+        y = self.y[ : n]
+        if behind != 0:
+            x = x - (self.xspeed[ : n] * behind)
+            y = y - (self.yspeed[ : n] * behind)
+        return zip(numpy.rint(x).astype(int).tolist(), numpy.rint(y).astype(int).tolist())
+
@@ -0,0 +1,173 @@
+import struct, collections, itertools
+import numpy
+import src.mplib as mplib
+from src.setting import Setting
+from src.bullet_swarm import BulletSwarm
+
+'''
+Bullets in multiplayer. Rather than sending the position of every bullet in every update packet, the shooter sends events and the other side
+simulates the bullets itself: a bullet's path follows from its launch state, and both sides run the same BulletSwarm code.
+
+A type 4 update packet (see Game.sendUpdatePacket) contains, after the updatestruct:
+- headerstruct:
+  - uint   ack: the last event seqno that we applied from the other side, so they can stop sending those
+  - uint   frame: the sender's Game.framecounter
+  - ubyte  number of events
+  - ubyte  number of corrections
+- if there are events, the seqno of the first one (seqnostruct)
+- the events, with consecutive seqnos, each starting with a type byte:
+  - EVENT_SPAWN (spawnstruct): bullet id, the frame it was fired in, and its launch state (before that frame's movement) as doubles
+  - EVENT_DESPAWN (despawnstruct): bullet id of a bullet that hit something or died otherwise
+- the corrections (correctionstruct): bullet id and current position, for a few bullets per packet in turn, in case a copy ever drifts off
+
+Events are sent in every packet until they are acked. Bullet ids are 16 bits on the wire and wrap around, which is fine with less than 65536 bullets alive.
+As long as the other side never acked anything, only the last MAX_UNACKED_EVENTS are kept (a game that does not understand type 4 never will, see
+mplib.updatestruct), and the receiver starts at whichever event it gets first.
+'''
+
+headerstruct = struct.Struct('>IIBB')
+seqnostruct = struct.Struct('>I')
+
+EVENT_SPAWN = 1
+EVENT_DESPAWN = 2
+''' type, bullet id, frame, x, y, xspeed, yspeed '''
+spawnstruct = struct.Struct('>BHIdddd')
+''' type, bullet id '''
+despawnstruct = struct.Struct('>BH')
+''' bullet id, x, y '''
+correctionstruct = struct.Struct('>Hhh')
+
+MAX_EVENTS_PER_PACKET = 24  # 24 spawns are ~950 bytes, leaving room below mplib.maximumsize for the rest
+CORRECTIONS_PER_PACKET = 2
+CORRECTION_TOLERANCE = 2  # pixels, on top of one frame's movement (the two sides' frames are not exactly aligned)
+MAX_CATCHUP = 600  # frames to simulate a newly received bullet forward at most, in case the frame numbers are way off
+MAX_UNACKED_EVENTS = 512
+
+
+class BulletSender:
+    # Our side of the protocol for our own bullets, which live in `swarm`
+
+    def __init__(self, swarm):
+        self.swarm = swarm
+        swarm.removed = []
+        self.pending = collections.deque()  # (seqno, packed event) not yet acked by the other side
+        self.nextseqno = 1
+        self.cursor = 0  # where the corrections continue
+        self.everacked = False
+
+    def spawned(self, bulletid, frame, x, y, xspeed, yspeed):
+        self.queue(spawnstruct.pack(EVENT_SPAWN, bulletid & 0xFFFF, frame, x, y, xspeed, yspeed))
+
+    def queue(self, event):
+        if not self.everacked and len(self.pending) >= MAX_UNACKED_EVENTS:
+            self.pending.popleft()
+        self.pending.append((self.nextseqno, event))
+        self.nextseqno += 1
+
+    def acked(self, ack):
+        if ack > 0:
+            self.everacked = True
+        while len(self.pending) > 0 and self.pending[0][0] <= ack:
+            self.pending.popleft()
+
+    def pack(self, ack, frame):
+        buffer = bytearray(mplib.maximumsize)
+        return bytes(buffer[ : self.packInto(buffer, 0, ack, frame)])
+
+    def packInto(self, buffer, offset, ack, frame):
+        # Writes the bullet part of a type 4 packet into buffer at offset (see codec.UpdateEncoder), returns where it ends
+        for bulletid in self.swarm.removed:
+            self.queue(despawnstruct.pack(EVENT_DESPAWN, bulletid & 0xFFFF))
+        self.swarm.removed.clear()
+
+        events = list(itertools.islice(self.pending, MAX_EVENTS_PER_PACKET))
+        n = self.swarm.count
+        numcorrections = min(CORRECTIONS_PER_PACKET, n)
+        headerstruct.pack_into(buffer, offset, ack, frame, len(events), numcorrections)
+        offset += headerstruct.size
+        if len(events) > 0:
+            seqnostruct.pack_into(buffer, offset, events[0][0])
+            offset += seqnostruct.size
+            for _, event in events:
+                buffer[offset : offset + len(event)] = event
+                offset += len(event)
+        if numcorrections > 0:
+            indices = (self.cursor + numpy.arange(numcorrections)) % n
+            self.cursor = (self.cursor + numcorrections) % n
+            xs = numpy.clip(numpy.rint(self.swarm.x[indices]), -32768, 32767).astype(int).tolist()
+            ys = numpy.clip(numpy.rint(self.swarm.y[indices]), -32768, 32767).astype(int).tolist()
+            for bulletid, x, y in zip(self.swarm.ids[indices].tolist(), xs, ys):
+                correctionstruct.pack_into(buffer, offset, bulletid & 0xFFFF, x, y)
+                offset += correctionstruct.size
+        return offset
+
+
+class BulletReceiver:
+    # The other side's bullets, simulated here from their events
+
+    def __init__(self):
+        self.swarm = BulletSwarm()
+        self.lastseqno = 0  # of the events applied so far, which is what we ack
+        self.lastframe = -1  # the newest frame number of the other side that we saw
+
+    def advance(self, screensize):
+        self.swarm.advance(screensize)
+
+    def receive(self, data, screensize):
+        # Applies the bullet part of a type 4 packet (everything after the updatestruct). Returns the other side's ack of our events.
+        ack, frame, numevents, numcorrections = headerstruct.unpack_from(data)
+        offset = headerstruct.size
+        if numevents > 0:
+            seqno, = seqnostruct.unpack_from(data, offset)
+            offset += seqnostruct.size
+
+        for _ in range(numevents):
+            # anything else we applied before, or (should not happen) comes after a gap. Until we applied any, the oldest ones may have been dropped.
+            apply = seqno == self.lastseqno + 1 or self.lastseqno == 0
+            if data[offset] == EVENT_SPAWN:
+                _, bulletid, spawnframe, x, y, xspeed, yspeed = spawnstruct.unpack_from(data, offset)
+                offset += spawnstruct.size
+                if apply:
+                    self.spawn(bulletid, frame - spawnframe + 1, x, y, xspeed, yspeed, screensize)
+            elif data[offset] == EVENT_DESPAWN:
+                _, bulletid = despawnstruct.unpack_from(data, offset)
+                offset += despawnstruct.size
+                if apply:
+                    self.swarm.removeIds([bulletid])
+            else:
+                raise ValueError(f'Unknown bullet event type {data[offset]}')
+
+            if apply:
+                self.lastseqno = seqno
+            seqno += 1
+
+        if frame > self.lastframe:  # a reordered, older packet's corrections would make things worse
+            self.lastframe = frame
+            for _ in range(numcorrections):
+                bulletid, x, y = correctionstruct.unpack_from(data, offset)
+                offset += correctionstruct.size
+                self.correct(bulletid, x, y)
+
+        return ack
+
+    def spawn(self, bulletid, steps, x, y, xspeed, yspeed, screensize):
+        # Adds a bullet fired `steps` frames before the packet was sent, simulated up to that packet's frame
+        bullet = BulletSwarm(1)
+        bullet.add(x, y, xspeed, yspeed)
+        for _ in range(max(0, min(steps, MAX_CATCHUP))):
+            bullet.advance(screensize)
+            if len(bullet) == 0:
+                return  # it already died
+        self.swarm.add(bullet.x[0], bullet.y[0], bullet.xspeed[0], bullet.yspeed[0], bulletid=bulletid)
+
+    def correct(self, bulletid, x, y):
+        i = self.swarm.indexOfId(bulletid)
+        if i is None:
+            return
+
+        dx = self.swarm.x[i] - x
+        dy = self.swarm.y[i] - y
+        onestep = float(numpy.hypot(self.swarm.xspeed[i], self.swarm.yspeed[i])) * Setting.frozen.timeStep
+        if dx * dx + dy * dy > (CORRECTION_TOLERANCE + onestep) ** 2:
+            self.swarm.x[i] = x
+            self.swarm.y[i] = y
@@ -0,0 +1,67 @@
+import numpy
+import src.mplib as mplib
+
+'''
+Update packets (see mplib.updatestruct), without copying the packet around for every part of it. The first byte is the packet type, which doubles
+as the version of the update format:
+- UPDATE_POSITIONS (type 0, older clients): the updatestruct followed by a bulletstruct for every bullet of the sender
+- UPDATE_EVENTS (type 4): the updatestruct followed by bullet events (see src/bulletsync.py)
+
+Encoding writes into one buffer that is reused for every packet, and returns a memoryview of the part that was written, which is only valid until
+the next packet gets encoded: send it right away (netio.Connection copies it if it has to wait). Decoding hands out memoryviews of the received packet.
+'''
+
+UPDATE_POSITIONS = 0
+UPDATE_EVENTS = 4
+VERSIONS = (UPDATE_POSITIONS, UPDATE_EVENTS)
+
+headersize = 1 + mplib.updatestruct.size
+bulletdtype = numpy.dtype('>i2')  # mplib.bulletstruct is two of these
+
+
+class UpdateEncoder:
+    def __init__(self):
+        self.buffer = bytearray(mplib.maximumsize)
+        self.view = memoryview(self.buffer)
+        self.bullets = numpy.frombuffer(self.buffer, dtype=bulletdtype, count=(mplib.maximumsize - headersize) // 2, offset=headersize)  # the same memory
+        self.scratch = numpy.empty(len(self.bullets))  # x, y, x, y, ... as floats, for rounding and clipping without allocating arrays
+
+    def header(self, version, fields):
+        # fields: the values for mplib.updatestruct
+        self.buffer[0] = version
+        mplib.updatestruct.pack_into(self.buffer, 1, *fields)
+
+    def positions(self, fields, x, y):
+        # A type 0 packet with bullets at x and y (sequences or arrays of the same length). Positions are rounded and clipped to what fits.
+        n = len(x)
+        if headersize + n * mplib.bulletstruct.size > mplib.maximumsize:
+            raise ValueError(f'{n} bullets do not fit in an update packet')
+        self.header(UPDATE_POSITIONS, fields)
+        if n > 0:
+            positions = self.scratch[ : 2 * n]
+            positions[0 : : 2] = x
+            positions[1 : : 2] = y
+            numpy.rint(positions, out=positions)
+            numpy.minimum(positions, 32767, out=positions)
+            numpy.maximum(positions, -32768, out=positions)
+            self.bullets[ : 2 * n] = positions
+        return self.view[ : headersize + n * mplib.bulletstruct.size]
+
+    def events(self, fields, bulletsender, ack, frame):
+        # A type 4 packet with the pending bullet events of a bulletsync.BulletSender
+        self.header(UPDATE_EVENTS, fields)
+        return self.view[ : bulletsender.packInto(self.buffer, headersize, ack, frame)]
+
+
+def decodeUpdate(msg):
+    # Returns the version (packet type), the updatestruct fields, and a memoryview of the rest of the packet
+    view = memoryview(msg)
+    if view[0] not in VERSIONS:
+        raise ValueError(f'Unknown update packet type {view[0]}')
+    return view[0], mplib.updatestruct.unpack_from(view, 1), view[headersize : ]
+
+
+def decodePositions(payload):
+    # The bullets of a type 0 packet, from the payload that decodeUpdate returned, as a list of (x, y) tuples. A partial bullet at the end is ignored.
+    # (numpy.frombuffer would be faster still, but then turning the array into Python numbers for drawing takes longer than this.)
+    return list(mplib.bulletstruct.iter_unpack(payload[ : len(payload) - len(payload) % mplib.bulletstruct.size]))
@@ -0,0 +1,59 @@
+import math
+
+GRAVITATIONAL_CONSTANT = 6.6742e-11  # Body.GRAVITATIONAL_CONSTANT. It is defined here because src.body needs this module, not the other way around
+
+class Frozen:
+    # An immutable snapshot of the game settings, with what the simulation derives from them worked out once, for the code that runs for every body in
+    # every frame. settings['Game.timeStep'].val is two dict lookups and an attribute lookup every time, and then G·M·dt gets multiplied out again; here
+    # it is one attribute. Setting.freeze() makes a new snapshot (Setting.frozen) whenever the settings change, such as when the other player's
+    # settings come in, so read Setting.frozen again rather than keeping one around.
+    # The products are multiplied in the same order as the code did before there was a snapshot, so that the results are exactly the same.
+
+    __slots__ = (
+        'fps', 'timeStep', 'verlet', 'maxSubsteps', 'swept',
+        'gwMass', 'gwRadius', 'gwRadiation', 'gm', 'timeStepG', 'gwMassTimeStepG',
+        'bulletDamage', 'bulletMass', 'bulletSpeed', 'bulletRelspeed', 'bulletSize', 'bulletReach',
+        'playerMass', 'battSize', 'thrust', 'thrustDv', 'thrustEnergy', 'rotPerKj', 'kjPerShot', 'reloadFrames', 'minReloadFrames', 'visiblepx',
+    )
+
+    def __init__(self, settings):
+        values = {
+            'fps': settings['Game.FPS'].val,
+            'timeStep': settings['Game.timeStep'].val,
+            'verlet': settings['Game.integrator'].val == 'verlet',
+            'maxSubsteps': settings['Game.maxsubsteps'].val,
+            'swept': settings['Game.sweptcollisions'].val,
+
+            'gwMass': settings['GW.mass'].val,
+            'gwRadius': settings['GW.radius'].val,
+            'gwRadiation': settings['GW.radiation'].val,
+            'gm': settings['GW.mass'].val * GRAVITATIONAL_CONSTANT,
+            'timeStepG': settings['Game.timeStep'].val * GRAVITATIONAL_CONSTANT,
+            'gwMassTimeStepG': settings['GW.mass'].val * settings['Game.timeStep'].val * GRAVITATIONAL_CONSTANT,
+
+            'bulletDamage': settings['Bullet.damage'].val,
+            'bulletMass': settings['Bullet.mass'].val,
+            'bulletSpeed': settings['Bullet.speed'].val,
+            'bulletRelspeed': settings['Bullet.relspeed'].val,
+            'bulletSize': settings['Bullet.size'].val,
+            'bulletReach': 0.5 * math.sqrt(2) * settings['Bullet.size'].val,  # the radius of the circle around a bullet's square
+
+            'playerMass': settings['Player.mass'].val,
+            'battSize': settings['Player.battSize'].val,
+            'thrust': settings['Player.thrust'].val,
+            'thrustDv': settings['Player.thrust'].val * settings['Game.timeStep'].val,  # divide by the mass for the change in speed
+            'thrustEnergy': settings['Player.thrust'].val / settings['Player.thrust/kJ'].val,  # kJ per step of full thrust
+            'rotPerKj': settings['Player.rot/kJ'].val,
+            'kjPerShot': settings['Player.kJ/shot'].val,
+            'reloadFrames': settings['Game.FPS'].val * settings['Player.reload'].val,
+            'minReloadFrames': settings['Game.FPS'].val * settings['Player.reload'].val * settings['Player.minreload'].val,
+            'visiblepx': settings['Player.visiblepx'].val,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'the settings snapshot cannot be changed (tried to set {name}); change `settings` and call Setting.freeze(settings)')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'the settings snapshot cannot be changed (tried to delete {name})')
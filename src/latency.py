@@ -0,0 +1,131 @@
+import struct, heapq, collections
+
+'''
+Latency between the two players, and smoothing out the jitter in the other player's updates.
+
+Ping packets carry timestamps (time.time(), in seconds), the way NTP does it:
+- type 2, ping: pingstruct with t0, when we sent it
+- type 3, pong: pongstruct with t0 copied from the ping, t1 when the other side received the ping, and t2 when they sent this answer; we receive it at t3
+The round trip time is then (t3 - t0) - (t2 - t1), which leaves out however long the ping sat waiting for the other side's next frame, and the other side's
+clock is ((t1 - t0) + (t2 - t3)) / 2 seconds ahead of ours, if the way there took as long as the way back. Receive times come from the kernel where
+possible (see netio.Connection.receive), so our own frame time is left out as well.
+Older clients send a bare b'\x02' and expect a bare b'\x03', which gives no sample.
+'''
+pingstruct = struct.Struct('>d')
+pongstruct = struct.Struct('>ddd')
+
+
+def ping(now):
+    return b'\x02' + pingstruct.pack(now)
+
+
+def pong(msg, receivedat, now):
+    # The answer to a ping that we received at `receivedat`
+    if len(msg) < 1 + pingstruct.size:
+        return b'\x03'
+    return b'\x03' + pongstruct.pack(pingstruct.unpack_from(msg, 1)[0], receivedat, now)
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of a few dozen values, which is quicker than getting numpy involved
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class LatencyEstimator:
+    WINDOW = 32  # samples kept for the percentiles and the clock offset
+
+    def __init__(self):
+        self.rtt = None  # seconds, moving average with a gain of 1/8 like TCP's smoothed RTT (RFC 6298)
+        self.jitter = 0  # seconds, moving average of how far samples are from self.rtt, with a gain of 1/4 like TCP's RTTVAR
+        self.offset = None  # seconds that the other side's clock is ahead of ours
+        self.samples = collections.deque(maxlen=LatencyEstimator.WINDOW)  # (rtt, offset)
+
+    def pongReceived(self, msg, receivedat):
+        # Returns whether the pong gave us a sample
+        if len(msg) < 1 + pongstruct.size:
+            return False
+        t0, t1, t2 = pongstruct.unpack_from(msg, 1)
+        rtt = (receivedat - t0) - (t2 - t1)
+        if not 0 <= rtt < 10:
+            return False  # not an answer to any ping of ours that we still care about
+        self.samples.append((rtt, ((t1 - t0) + (t2 - receivedat)) / 2))
+
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.jitter += (abs(rtt - self.rtt) - self.jitter) / 4
+            self.rtt += (rtt - self.rtt) / 8
+        # Of the recent samples, the fastest round trip had the least time to be delayed more on one way than on the other, so trust its offset most (NTP's clock filter)
+        self.offset = min(self.samples)[1]
+        return True
+
+    def percentile(self, p):
+        # Of the recent round trip times, in seconds
+        return percentile([rtt for rtt, _ in self.samples], p)
+
+    def summary(self):
+        if self.rtt is None:
+            return 'RTT unknown'
+        return f'RTT {self.rtt * 1000:.0f} ms (p50 {self.percentile(50) * 1000:.0f}, p95 {self.percentile(95) * 1000:.0f}), jitter {self.jitter * 1000:.1f} ms'
+
+
+class JitterBuffer:
+    # Holds the other player's updates until a steady delay after they were sent, so that updates that happen to arrive quickly do not get applied earlier
+    # than the others, which makes their motion stutter. The delay adapts to how much the transit times vary. An update that arrives after its turn anyway
+    # gets played right away, and the caller moves it forward by how late it is (see Player.applyUpdate).
+    #
+    # Updates are timed by the sender's frame number: they send one every so many frames, so when they sent it is some unknown moment plus frame times
+    # the length of their frames. Their game loop does not run at exactly Game.FPS (pygame's Clock.tick(60) gives about 61.4 frames per second), so we
+    # fit a line through recent (frame, receive time) pairs, which gives the length of their frames and the quickest transit time at once. The jitter
+    # is how far receive times are from that line.
+    WINDOW = 64  # updates kept to estimate the jitter from: about two seconds at the default update rate
+    PERCENTILE = 95  # of transit times that should arrive in time
+    MAX_DELAY = 0.1  # seconds. More jitter than this is better handled by extrapolating than by showing the other player even further in the past
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.received = collections.deque(maxlen=JitterBuffer.WINDOW)  # (frame, receive time)
+        self.frametime = 1 / fps  # seconds per frame of the sender
+        self.base = (0, 0)  # (frame, receive time) of an update that came as quickly as any: the line that we play updates out along
+        self.delay = 0  # seconds that updates are held on top of the quickest transit time
+        self.pending = []  # heap of (frame, update)
+        self.late = 0  # updates that arrived after their turn
+
+    def push(self, frame, receivedat, update):
+        self.received.append((frame, receivedat))
+        self.fit()
+        heapq.heappush(self.pending, (frame, update))
+
+    def fit(self):
+        # Least squares, relative to the first sample because receive times are large numbers
+        firstframe, firsttime = self.received[0]
+        n = len(self.received)
+        if n >= 8:
+            meanframe = sum(frame - firstframe for frame, _ in self.received) / n
+            meantime = sum(t - firsttime for _, t in self.received) / n
+            covariance = sum((frame - firstframe - meanframe) * (t - firsttime - meantime) for frame, t in self.received)
+            variance = sum((frame - firstframe - meanframe) ** 2 for frame, _ in self.received)
+            if variance > 0:
+                self.frametime = min(2 / self.fps, max(0.5 / self.fps, covariance / variance))
+        transits = [(t - (frame - firstframe) * self.frametime, frame, t) for frame, t in self.received]
+        quickest = min(transits)
+        self.base = quickest[1 : ]
+        self.delay = min(JitterBuffer.MAX_DELAY, percentile([transit for transit, _, _ in transits], JitterBuffer.PERCENTILE) - quickest[0])
+
+    def playAt(self, frame):
+        # The receive time at which to apply the update of `frame`
+        baseframe, basetime = self.base
+        return basetime + (frame - baseframe) * self.frametime + self.delay
+
+    def due(self, now):
+        # Yields (update, seconds late) for the updates whose turn has come, oldest first
+        while len(self.pending) > 0:
+            frame, update = self.pending[0]
+            playat = self.playAt(frame)
+            if playat > now:
+                return
+            heapq.heappop(self.pending)
+            if now - playat > self.frametime:
+                self.late += 1
+            yield update, now - playat
@@ -0,0 +1,170 @@
+import struct, zlib
+import src.botlib as botlib
+from settings import prefs
+from src.replay import playerstruct
+from src.game_state import GameState
+
+'''
+Lockstep multiplayer (the Game.lockstep setting). Rather than sending our position and bullets, we only send what we pressed in every frame, and both games
+simulate both players with the same code and settings. The packets stay a few bytes no matter how many bullets fly around, and neither side has to believe
+the other about hits.
+
+We do not wait for the other side's input before simulating a frame: we guess that they keep doing what they did last, and when their actual input turns
+out to be different, we roll back to a snapshot from before that frame and simulate again up to where we were. Only when we are more than MAX_ROLLBACK
+frames ahead of their input do we wait for them. A round only ends on a frame for which we know both inputs, so we never show a death that then gets undone.
+
+Every HASH_INTERVAL frames, both sides hash the game state and compare, so that if the simulations ever diverge (a bug, different game versions), we notice.
+
+A type 5 packet contains:
+- inputstruct:
+  - ubyte round number (mod 256), since a rematch starts counting frames from 0 again (see mplib.rematchstruct)
+  - uint  ack: the number of frames for which we have all of the other side's inputs, so they can stop sending those
+  - uint  frame number of a state hash, or NOHASH
+  - uint  the state hash (see stateHash)
+  - uint  frame number of the first input in this packet
+  - ubyte number of inputs
+- the inputs: one botlib.toBitmask() byte per frame, for consecutive frames
+'''
+inputstruct = struct.Struct('>BIIIIB')
+NOHASH = 0xFFFFFFFF
+
+''' Player.rotate_speed, Player.rotate_speed_fine, Player.thrust_factor_fine: preferences that influence the physics, so both sides must use the same ones '''
+prefsstruct = struct.Struct('>ddd')
+PHYSICS_PREFS = ('Player.rotate_speed', 'Player.rotate_speed_fine', 'Player.thrust_factor_fine')
+
+MAX_ROLLBACK = 20  # frames that we may run ahead of the other side's inputs
+MAX_INPUTS_PER_PACKET = 64
+HASH_INTERVAL = 30  # frames
+
+
+def physicsPrefs():
+    # Sent along with the settings by whoever sends those, see applyPhysicsPrefs
+    return prefsstruct.pack(*(prefs[key] for key in PHYSICS_PREFS))
+
+
+def applyPhysicsPrefs(data):
+    prefs.update(zip(PHYSICS_PREFS, prefsstruct.unpack(data)))
+
+
+class Lockstep:
+    def __init__(self, players, roundnumber=0):
+        self.round = roundnumber % 256
+        self.localfirst = players[0].n < players[1].n  # the game has the local player first, but hashes go in player number order
+        self.frame = 0  # the next frame to simulate, counting from the start of the round
+        self.nextinput = 0  # the next frame to take our own input for. Only ahead of self.frame when we are waiting to see if someone really died
+        self.localinputs = {}  # frame: our bitmask, kept until the other side has it and the frame can no longer be rolled back
+        self.remoteinputs = {}  # frame: their bitmask
+        self.predicted = {}  # frame: the bitmask that we guessed for them when simulating it
+        self.confirmed = -1  # we have all of their inputs up to and including this frame
+        self.theirack = 0  # they have all of our inputs before this frame
+        self.unanswered = False  # whether we received inputs since we last sent, which we should ack
+        self.rollbackfrom = None  # the first frame that we simulated with a wrong guess
+        self.snapshots = {}  # frame: game.snapshot() from right before simulating that frame
+        self.nexthashframe = 0
+        self.lasthash = (NOHASH, 0)  # our newest (frame, hash), sent in every packet
+        self.hashes = {}  # (frame, theirs): hash, for the frames where we only have one side's hash so far
+        self.desynced = False
+        self.rollbacks = 0
+        self.resimulated = 0  # frames
+
+    def step(self, game, actions, connection):
+        # Call once per frame while PLAYERING, with our own actions. Rolls back if we guessed the other side's inputs wrong, and simulates as far as we can.
+        if self.rollbackfrom is not None:
+            if self.rollbackfrom < self.frame:
+                self.rollbacks += 1
+                self.resimulated += self.frame - self.rollbackfrom
+                self.restore(game, self.rollbackfrom)
+            self.rollbackfrom = None
+
+        self.catchUp(game)
+        if self.frame == self.nextinput and game.state == GameState.PLAYERING and self.nextinput <= self.confirmed + MAX_ROLLBACK:
+            self.localinputs[self.nextinput] = botlib.toBitmask(actions)
+            self.nextinput += 1
+            self.catchUp(game)
+        self.send(connection)
+
+        while self.nexthashframe <= self.confirmed + 1 and self.nexthashframe < self.frame:
+            # the state at the start of this frame no longer depends on guesses
+            self.lasthash = (self.nexthashframe, self.stateHash(self.snapshots[self.nexthashframe]))
+            self.compareHash(*self.lasthash)
+            self.nexthashframe += HASH_INTERVAL
+
+        for frames, first in ((self.localinputs, min(self.theirack, self.confirmed + 1)), (self.remoteinputs, self.confirmed), (self.predicted, self.confirmed + 1), (self.snapshots, self.confirmed + 1)):
+            for frame in [frame for frame in frames if frame < first]:
+                del frames[frame]
+
+    def catchUp(self, game):
+        # Simulates up to the newest input we have: after a rollback, when waiting to see if someone really died, or the frame we just got input for
+        while self.frame < self.nextinput:
+            frame = self.frame
+            remote = self.remoteinputs.get(frame, self.remoteinputs.get(self.confirmed, 0))
+            self.predicted[frame] = remote
+            self.snapshots[frame] = game.snapshot()
+            died = game.simulate([botlib.fromBitmask(self.localinputs[frame]), botlib.fromBitmask(remote)])
+            if died is not None:
+                if frame > self.confirmed:
+                    self.restore(game, frame)  # maybe they did something else in this frame; wait until we know
+                    return
+                self.frame += 1
+                game.playerDied(sendpacket=False, **died)
+                return
+            self.frame += 1
+
+    def restore(self, game, frame):
+        # The state from right before `frame`, but without undoing things that are not part of the simulation
+        framecounter = game.framecounter
+        sparks = game.sparks
+        game.restore(self.snapshots[frame])
+        game.framecounter = framecounter
+        game.sparks = sparks
+        self.frame = frame
+
+    def send(self, connection):
+        first = self.theirack
+        inputs = bytes(self.localinputs[frame] for frame in range(first, min(self.nextinput, first + MAX_INPUTS_PER_PACKET)))
+        connection.send(b'\x05' + inputstruct.pack(self.round, self.confirmed + 1, *self.lasthash, first, len(inputs)) + inputs)
+        self.unanswered = False
+
+    def flush(self, connection):
+        # Call every frame between rounds: the other side may still be waiting for our last inputs to see how the round ended, or for our ack
+        if self.theirack < self.nextinput or self.unanswered:
+            self.send(connection)
+
+    def receive(self, msg):
+        roundnumber, ack, hashframe, statehash, first, count = inputstruct.unpack_from(msg, 1)
+        if roundnumber != self.round:
+            return  # from the round before a rematch, or they already started the next one
+        self.theirack = max(self.theirack, ack)
+        self.unanswered = self.unanswered or count > 0
+
+        for i, mask in enumerate(msg[1 + inputstruct.size : 1 + inputstruct.size + count]):
+            frame = first + i
+            if frame <= self.confirmed or frame in self.remoteinputs:
+                continue
+            self.remoteinputs[frame] = mask
+            if frame < self.frame and self.predicted[frame] != mask:
+                self.rollbackfrom = frame if self.rollbackfrom is None else min(self.rollbackfrom, frame)
+        while self.confirmed + 1 in self.remoteinputs:
+            self.confirmed += 1
+
+        if hashframe != NOHASH:
+            self.compareHash(hashframe, statehash, theirs=True)
+
+    def compareHash(self, frame, statehash, theirs=False):
+        key = (frame, not theirs)  # the other one's
+        if key in self.hashes:
+            if self.hashes.pop(key) != statehash:
+                self.desynced = True
+        elif theirs and frame < self.nexthashframe:
+            pass  # an old one repeated, which we compared already
+        else:
+            self.hashes[(frame, theirs)] = statehash
+            if len(self.hashes) > 20:  # the other side only sends their newest hash, so with packet loss some of ours never get a partner
+                del self.hashes[min(self.hashes)]
+
+    def stateHash(self, snapshot):
+        # Of everything that both games should agree on: not the frame counter or score, which are our own
+        _, _, players, bullets = snapshot
+        if not self.localfirst:
+            players = players[ : : -1]
+        return zlib.crc32(b''.join(playerstruct.pack(*player) for player in players) + bullets.astype('>f8').tobytes())
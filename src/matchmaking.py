@@ -0,0 +1,63 @@
+import collections
+
+class MatchQueue:
+    # Clients waiting for an opponent. First come, first served within a bucket; clients only get matched with others in the same bucket (such as a hash of their settings).
+    # Clients that stop waiting (e.g. they quit or time out) are removed from `waiting` right away and skipped once they reach the front of their bucket, so every operation is O(1) amortized.
+
+    def __init__(self):
+        self.buckets = {}  # bucket: deque of entries
+        self.waiting = {}  # addr: its current entry, a (bucket, addr, since) tuple
+
+        # counters for keeping an eye on matchmaking
+        self.matches = 0
+        self.totalwait = 0
+        self.maxwait = 0
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __contains__(self, addr):
+        return addr in self.waiting
+
+    def add(self, addr, bucket, now):
+        entry = (bucket, addr, now)
+        self.waiting[addr] = entry
+        if bucket not in self.buckets:
+            self.buckets[bucket] = collections.deque()
+        self.buckets[bucket].append(entry)
+
+    def remove(self, addr):
+        self.waiting.pop(addr, None)
+
+    def pop(self, bucket, now):
+        # Returns the address that has been waiting the longest in this bucket (and removes it from the queue), or None if nobody is waiting there
+        queue = self.buckets.get(bucket)
+        while queue:
+            entry = queue.popleft()
+            _, addr, since = entry
+            if self.waiting.get(addr) is not entry:
+                continue  # stale: this client stopped waiting, or re-queued and has a newer entry
+
+            del self.waiting[addr]
+            if len(queue) == 0:
+                del self.buckets[bucket]
+
+            waited = now - since
+            self.matches += 1
+            self.totalwait += waited
+            self.maxwait = max(self.maxwait, waited)
+            return addr
+
+        if queue is not None:
+            del self.buckets[bucket]
+        return None
+
+    def stats(self):
+        return {
+            'waiting': len(self.waiting),
+            'buckets': len(self.buckets),
+            'matches': self.matches,
+            'averagewait': self.totalwait / self.matches if self.matches > 0 else 0,
+            'maxwait': self.maxwait,
+        }
+
@@ -0,0 +1,128 @@
+import json
+
+'''
+Counters and histograms for the server. Counters are plain attributes so that bumping one costs no more than `+= 1`;
+the server adds per batch of packets where it can, not per packet.
+A snapshot() is a plain dict, so that worker processes can send theirs to the coordinator, which merge()s them.
+'''
+
+COUNTERS = (
+    'packetsin',
+    'bytesin',
+    'packetsout',
+    'bytesout',
+    'relayed',            # packets forwarded between married clients (also counted in packetsin/out)
+    'handshakefailures',  # wrong token
+    'serverfull',         # hellos answered with mplib.playerlimit
+    'garbage',            # packets from unknown addresses that were not a hello
+    'exceptions',         # swallowed by the main loop's try/except
+    'senddrops',          # packets that could not be sent, nearly always because the socket's send buffer was full, i.e. the server or its network is overloaded
+    'refereedframes',     # frames of matches that the server simulated (see AUTHORITATIVE in server.py)
+    'verdicts',           # rounds that the server decided
+)
+
+
+class Histogram:
+    # Counts values in power-of-two buckets: bucket i holds values v with 2**(i-1) <= v < 2**i, bucket 0 holds zero.
+    # Percentiles are therefore only accurate to a factor two, but adding is one bit_length() and a list increment.
+
+    def __init__(self, counts=None, buckets=48):
+        self.counts = list(counts) if counts is not None else [0] * buckets
+        self.lastbucket = len(self.counts) - 1
+
+    def add(self, value, count=1):
+        # value must be an int
+        i = value.bit_length()
+        if i >= self.lastbucket:
+            i = self.lastbucket
+        self.counts[i] += count
+
+    def total(self):
+        return sum(self.counts)
+
+    def percentile(self, p):
+        # Upper bound of the bucket that contains the p-th percentile (p from 0 to 100), or 0 if empty
+        rank = self.total() * p / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= rank:
+                return 2 ** i - 1 if i > 0 else 0
+        return 0
+
+
+class Metrics:
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.packettime = Histogram()  # nanoseconds of processing per received packet
+
+    def snapshot(self):
+        return {
+            'counters': {name: getattr(self, name) for name in COUNTERS},
+            'packettime': list(self.packettime.counts),
+        }
+
+
+def merge(snapshots):
+    counters = {name: 0 for name in COUNTERS}
+    packettime = Histogram()
+    for snapshot in snapshots:
+        for name in COUNTERS:
+            counters[name] += snapshot['counters'][name]
+        for i, count in enumerate(snapshot['packettime']):
+            packettime.counts[i] += count
+    return {'counters': counters, 'packettime': packettime.counts}
+
+
+class Reporter:
+    # Turns snapshots into reports with per-second rates. The rates are averages since the last call to mark(), which the server does every STATSINTERVAL.
+
+    def __init__(self, now):
+        self.marktime = now
+        self.markcounters = {name: 0 for name in COUNTERS}
+
+    def report(self, snapshot, now, sessions, matchmaking):
+        counters = snapshot['counters']
+        elapsed = max(now - self.marktime, 1e-9)
+        packettime = Histogram(snapshot['packettime'])
+        return {
+            'time': now,
+            'totals': counters,
+            'persecond': {name: (counters[name] - self.markcounters[name]) / elapsed for name in COUNTERS},
+            'sessions': sessions,
+            'matchmaking': matchmaking,
+            'packettime_ns': {
+                'p50': packettime.percentile(50),
+                'p99': packettime.percentile(99),
+                'p999': packettime.percentile(99.9),
+                'count': packettime.total(),
+            },
+        }
+
+    def mark(self, snapshot, now):
+        self.marktime = now
+        self.markcounters = dict(snapshot['counters'])
+
+    def idle(self, snapshot):
+        # Whether nothing was received since the last mark
+        return snapshot['counters']['packetsin'] == self.markcounters['packetsin']
+
+
+def toJson(report):
+    return json.dumps(report).encode()
+
+
+def logLine(report):
+    persecond = report['persecond']
+    totals = report['totals']
+    return ('Stats: in {:.0f} packets/s ({:.1f} kB/s), out {:.0f} packets/s ({:.1f} kB/s); '
+            'sessions: {greeted} greeted, {waiting} waiting, {married} married; '
+            'matchmaking: {mm[waiting]} waiting in {mm[buckets]} bucket(s), {mm[matches]} matches so far, time to match: average {mm[averagewait]:.1f} s, max {mm[maxwait]:.1f} s; '
+            '{} handshake failures, {} server full, {} garbage, {} exceptions, {} send drops so far; '
+            'processing time per packet: p50 {:.1f} µs, p99 {:.1f} µs').format(
+        persecond['packetsin'], persecond['bytesin'] / 1000, persecond['packetsout'], persecond['bytesout'] / 1000,
+        totals['handshakefailures'], totals['serverfull'], totals['garbage'], totals['exceptions'], totals['senddrops'],
+        report['packettime_ns']['p50'] / 1000, report['packettime_ns']['p99'] / 1000,
+        mm=report['matchmaking'], **report['sessions'],
+    )
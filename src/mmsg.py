@@ -0,0 +1,143 @@
+import sys, socket, ctypes, ctypes.util
+
+'''
+recvmmsg()/sendmmsg() for the server's relay path, through ctypes because Python's socket module does not have them.
+These are Linux system calls; elsewhere AVAILABLE is False and the server uses plain recvfrom/sendto.
+
+A MessageBatch owns `size` receive buffers. receive() fills some of them with one system call; the caller then decides per packet where it goes
+(setDestination overwrites the sender's address in place, so a relayed packet is never copied) and send() hands a range of them back to the kernel,
+again with one system call. Only IPv4, like the rest of the server.
+'''
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.recvmmsg
+    libc.sendmmsg
+    AVAILABLE = sys.platform.startswith('linux')
+except (OSError, AttributeError, TypeError):
+    AVAILABLE = False
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+SOCKADDRSIZE = 16  # struct sockaddr_in
+EAGAIN = (11, 35)  # Linux, BSD
+
+
+def toSockaddr(addr):
+    # (ip, port) -> struct sockaddr_in bytes. receive() gives us senders in this form too, so these work as dict keys for both.
+    return socket.AF_INET.to_bytes(2, sys.byteorder) + addr[1].to_bytes(2, 'big') + socket.inet_aton(addr[0]) + bytes(8)
+
+
+def fromSockaddr(sockaddr):
+    return (socket.inet_ntoa(sockaddr[4 : 8]), int.from_bytes(sockaddr[2 : 4], 'big'))
+
+
+class MessageBatch:
+    def __init__(self, sock, size, maxpacketsize):
+        self.fd = sock.fileno()
+        self.size = size
+        self.maxpacketsize = maxpacketsize
+
+        self.buffers = ctypes.create_string_buffer(size * maxpacketsize)
+        self.names = ctypes.create_string_buffer(size * SOCKADDRSIZE)
+        self.iovecs = (iovec * size)()
+        self.msgs = (mmsghdr * size)()
+        for i in range(size):
+            self.iovecs[i].iov_base = ctypes.addressof(self.buffers) + i * maxpacketsize
+            self.iovecs[i].iov_len = maxpacketsize
+            # msg_namelen is overwritten by the kernel with the sender's address length, which is always SOCKADDRSIZE for IPv4, so this need not be reset
+            self.msgs[i].msg_hdr.msg_name = ctypes.addressof(self.names) + i * SOCKADDRSIZE
+            self.msgs[i].msg_hdr.msg_namelen = SOCKADDRSIZE
+            self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+        # Flat views on the C structures, so that the per-packet work is memoryview indexing rather than ctypes attribute access
+        self.bufferview = memoryview(self.buffers).cast('B')
+        self.nameview = memoryview(self.names).cast('B')
+        uint = ctypes.sizeof(ctypes.c_uint)
+        self.msglens = memoryview(self.msgs).cast('B').cast('I')[mmsghdr.msg_len.offset // uint : : ctypes.sizeof(mmsghdr) // uint]
+        sizet = ctypes.sizeof(ctypes.c_size_t)
+        self.iovlens = memoryview(self.iovecs).cast('B').cast('N')[iovec.iov_len.offset // sizet : : ctypes.sizeof(iovec) // sizet]
+
+    def receive(self):
+        # Returns how many packets were received (0 if none were waiting); they are available as index 0 up to that number
+        n = libc.recvmmsg(self.fd, self.msgs, self.size, socket.MSG_DONTWAIT, None)
+        if n < 0:
+            errno = ctypes.get_errno()
+            if errno in EAGAIN:
+                return 0
+            raise OSError(errno, 'recvmmsg failed')
+        return n
+
+    def source(self, i):
+        # The sender of packet i, as sockaddr bytes (see toSockaddr)
+        return self.nameview[i * SOCKADDRSIZE : (i + 1) * SOCKADDRSIZE].tobytes()
+
+    def startswith(self, i, prefix):
+        if self.msglens[i] < len(prefix):
+            return False
+        offset = i * self.maxpacketsize
+        return self.bufferview[offset] == prefix[0] and self.bufferview[offset : offset + len(prefix)] == prefix
+
+    def packet(self, i):
+        # Packet i as (bytes, (ip, port)), like socket.recvfrom() returns
+        offset = i * self.maxpacketsize
+        return self.bufferview[offset : offset + self.msglens[i]].tobytes(), fromSockaddr(self.source(i))
+
+    def setDestination(self, i, sockaddr):
+        self.nameview[i * SOCKADDRSIZE : (i + 1) * SOCKADDRSIZE] = sockaddr
+
+    def setPacket(self, i, data):
+        # Replaces the contents of packet i, such as with an answer to send back to where it came from
+        offset = i * self.maxpacketsize
+        self.bufferview[offset : offset + len(data)] = data
+        self.msglens[i] = len(data)
+
+    def send(self, start, end):
+        # Sends packets start up to (excluding) end to wherever their address now points, and returns how many packets and bytes of them were not sent.
+        # A packet that cannot be sent (mostly because the socket's send buffer is full) is skipped, as the exception from sendto() would have skipped it.
+        if start >= end:
+            return 0, 0
+
+        msglens = self.msglens
+        iovlens = self.iovlens
+        for i in range(start, end):
+            iovlens[i] = msglens[i]
+
+        unsent = 0
+        unsentbytes = 0
+        i = start
+        while i < end:
+            n = libc.sendmmsg(self.fd, ctypes.byref(self.msgs, i * ctypes.sizeof(mmsghdr)), end - i, 0)
+            if n > 0:
+                i += n
+            else:
+                unsent += 1
+                unsentbytes += msglens[i]
+                i += 1
+
+        for i in range(start, end):
+            iovlens[i] = self.maxpacketsize
+        return unsent, unsentbytes
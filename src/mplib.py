@@ -1,5 +1,5 @@
 
-import struct
+import struct, hashlib
 
 maximumsize = 1400
 clienthello = b'Many greetings oh glorious serverlord. I can haz token from your most gracious serveriness?'
@@ -12,21 +12,42 @@ playerquits = b'I take my leave since '
 restartpl0x = b'I would like to play another round on this server!'
 playerlimit = b'FULL'
 settingsmsg = b'The config do be like this:'
+partnerat   = b'Your partner is at '  # followed by a peerstruct, see netio.Connection
+refereed    = b'The server shall be the judge of that'  # sent after matching, if the server referees the match (see src/referee.py)
+maxbucketsize = 32  # the token may be followed by up to this many bytes to only get matched with clients that sent the same bytes
+
+''' IPv4 address, port '''
+peerstruct = struct.Struct('>4sH')
+
+def settingsbucket(serializedSettings):
+    # Matchmaking bucket for only playing against people with the same game settings (see the Multiplayer.match_same_settings preference)
+    return hashlib.sha256(serializedSettings).digest()[0 : 8]
 
 '''
 - uint   sequence number
 - short player x
 - short player y
-- short player xspeed in hundredths  TODO is x/yspeed still needed?
+- short player xspeed in hundredths (the receiver extrapolates with it between updates, see Player.extrapolate)
 - short player yspeed in hundredths
 - ubyte player angle/1.5
 - ubyte player battery level where 255 is max capacity
 - ubyte player health times 255
 - ubyte hits taken from the remote player's bullets
 optionally followed by one or more bulletstructs
+
+That is for packet type 0, which games before bullet events sent. Type 4 has the same updatestruct, followed by bullet events instead (see src/bulletsync.py).
+Those older games do not understand type 4 (nor the settings of newer ones), so both players need the same version of the game.
 '''
 updatestruct = struct.Struct('>IhhhhBBBB')
 
 ''' x, y '''
 bulletstruct = struct.Struct('>hh')
 
+
+'''
+Packet type 6, rematch: another round with the same partner, token and settings, without going through the server's handshake and matchmaking again
+(see Game.requestRematch). Sent until the other side also wants it, and in answer to a request for the round that we already started.
+- uint round number that we want to play, counting from 0 for the first round after being matched
+- uint the sequence number of our first update packet in that round, so that the other side can tell our updates from the last round apart
+'''
+rematchstruct = struct.Struct('>II')
@@ -0,0 +1,186 @@
+import sys, time, socket, struct, collections
+import src.mplib as mplib
+
+SO_TIMESTAMPNS = 35  # Linux's socket option for kernel receive timestamps, which Python does not define
+timespec = struct.Struct('@ll')
+
+'''
+Packet type 7, hole punching, directly between the two clients (or relayed by the server, for the keepalive). The second byte is one of these:
+'''
+PUNCH_PROBE = 0  # please answer, so that I know that my packets reach you
+PUNCH_ANSWER = 1
+PUNCH_KEEPALIVE = 2  # sent to the server while we talk directly, so that it does not forget our session. The other side ignores it.
+
+class Connection:
+    # The client's UDP socket, driven from the game loop: no threads, no locks.
+    #
+    # send() calls sendto() right away on a non-blocking socket, which for UDP practically always succeeds immediately. Only if the kernel's send
+    # buffer is full do packets wait in a bounded deque, which is flushed at the next send() or receive(). When that backlog is full, the oldest
+    # packet is dropped: a stale game update is worth less than a fresh one and the protocol already copes with loss.
+    #
+    # receive() also says when each packet arrived. On Linux that is the kernel's timestamp, so it does not include the time the packet spent waiting for
+    # our next frame; elsewhere it is when we read it.
+    #
+    # Packets go through the server, which relays them to the other player, unless a direct path works. After matchmaking, the server tells both of us
+    # the other's address as it sees it (mplib.partnerat). We then both send probes there: the first ones open a hole in our own NAT (if any) for the
+    # other's packets, and once an answer comes back, send() goes straight to the other player. If nothing comes back for PUNCH_TIMEOUT seconds (such
+    # as with a NAT that uses a different port for every destination), we stay with the server. If the direct path stops working, we go back to the
+    # server after DIRECT_TIMEOUT seconds and try again. This all happens in receive(), so it needs to be called regularly.
+    #
+    # close() sends a last packet (typically mplib.playerquits) and closes the socket; there is nothing left running that could hang.
+
+    PUNCH_INTERVAL = 0.1  # seconds between probes while we try to get a direct path
+    PUNCH_TIMEOUT = 3  # seconds
+    PEER_KEEPALIVE = 0.5  # seconds without sending anything directly after which we send a probe, which keeps the NATs' holes open both ways
+    DIRECT_TIMEOUT = 1  # seconds without hearing from the other player directly: at least one game packet or keepalive should have come in
+    SERVER_KEEPALIVE = 30  # seconds; the server forgets sessions that it did not hear from in a while
+
+    def __init__(self, server, maxbacklog=64, maxreceive=15, direct=True):
+        self.server = server
+        self.maxreceive = maxreceive  # per receive() call, so a flood of packets cannot stall a frame; the rest is read next frame
+        self.backlog = collections.deque(maxlen=maxbacklog)
+        self.dropped = 0
+        self.direct = direct  # whether to try a direct path to the other player
+        self.peer = None  # the other player's address as the server sees it
+        self.destination = server  # of send() without an address: the server, or the peer if the direct path works
+        self.punchuntil = 0
+        self.nextprobe = 0
+        self.lastdirectsend = 0
+        self.lastdirectreceive = 0
+        self.lastserversend = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.bind(('0.0.0.0', 0))  # an explicit bind, so that receive() works before the first send() (on Windows, recvfrom() fails on an unbound socket)
+        self.kerneltimestamps = False
+        if sys.platform.startswith('linux'):
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+                self.kerneltimestamps = True
+            except OSError:
+                pass
+
+    def isDirect(self):
+        return self.peer is not None and self.destination == self.peer
+
+    def send(self, msg, addr=None):
+        if len(self.backlog) > 0 and not self.flush():
+            self.queue(msg, addr)
+            return
+
+        try:
+            self.sendto(msg, self.destination if addr is None else addr)
+        except BlockingIOError:
+            self.queue(msg, addr)
+
+    def sendto(self, msg, addr):
+        self.sock.sendto(msg, addr)
+        if addr == self.peer:
+            self.lastdirectsend = time.monotonic()
+        elif addr == self.server:
+            self.lastserversend = time.monotonic()
+
+    def queue(self, msg, addr):
+        if len(self.backlog) == self.backlog.maxlen:
+            self.dropped += 1
+        self.backlog.append((bytes(msg), addr))  # msg may be a view of a buffer that the caller reuses (see codec.UpdateEncoder)
+
+    def flush(self):
+        # Returns whether the backlog is empty now
+        while len(self.backlog) > 0:
+            msg, addr = self.backlog[0]
+            try:
+                self.sendto(msg, self.destination if addr is None else addr)
+            except BlockingIOError:
+                return False
+            self.backlog.popleft()
+        return True
+
+    def receive(self):
+        # Yields (packet, time.time() when it arrived) for up to maxreceive packets that are waiting. Other than for hole punching, we ignore who sent them, like before.
+        if len(self.backlog) > 0:
+            self.flush()
+        if self.peer is not None:
+            self.maintainPath(time.monotonic())
+
+        for _ in range(self.maxreceive):
+            if self.sock is None:
+                return  # closed while the caller was processing a packet
+            try:
+                if self.kerneltimestamps:
+                    msg, ancdata, _, addr = self.sock.recvmsg(mplib.maximumsize, socket.CMSG_SPACE(timespec.size))
+                else:
+                    msg, addr = self.sock.recvfrom(mplib.maximumsize)
+                    ancdata = ()
+            except BlockingIOError:
+                return
+            except ConnectionResetError:
+                continue  # Windows reports an ICMP port unreachable for an earlier sendto() this way; nothing we can do about it here
+            receivedat = time.time()
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= timespec.size:
+                    seconds, nanoseconds = timespec.unpack_from(data)
+                    receivedat = seconds + nanoseconds / 1e9
+
+            if addr == self.server and msg.startswith(mplib.partnerat):
+                self.punch(msg)
+                continue
+            if len(msg) == 2 and msg[0] == 7:
+                self.punched(msg[1], addr)
+                continue
+            if addr == self.peer:
+                self.lastdirectreceive = time.monotonic()
+            yield msg, receivedat
+
+    def punch(self, msg):
+        # The server told us where the other player is
+        ip, port = mplib.peerstruct.unpack_from(msg, len(mplib.partnerat))
+        self.peer = (socket.inet_ntoa(ip), port)
+        if self.direct:
+            self.punchuntil = time.monotonic() + Connection.PUNCH_TIMEOUT
+
+    def punched(self, kind, addr):
+        if addr != self.peer or not self.direct:
+            return  # such as their keepalive, relayed by the server
+        self.lastdirectreceive = time.monotonic()
+        if kind == PUNCH_PROBE:
+            self.sendPunch(PUNCH_ANSWER, self.peer)
+        elif kind == PUNCH_ANSWER and not self.isDirect():
+            self.destination = self.peer
+            self.punchuntil = 0
+            print('Talking to the other player directly now, rather than through the server')
+
+    def maintainPath(self, now):
+        if self.isDirect():
+            if now - self.lastdirectreceive > Connection.DIRECT_TIMEOUT:
+                print('The direct path to the other player stopped working, going through the server again')
+                self.destination = self.server
+                self.punchuntil = now + Connection.PUNCH_TIMEOUT
+            elif now - self.lastdirectsend > Connection.PEER_KEEPALIVE:
+                self.sendPunch(PUNCH_PROBE, self.peer)
+            if now - self.lastserversend > Connection.SERVER_KEEPALIVE:
+                self.sendPunch(PUNCH_KEEPALIVE, self.server)
+        elif now < self.punchuntil and now >= self.nextprobe:
+            self.sendPunch(PUNCH_PROBE, self.peer)
+            self.nextprobe = now + Connection.PUNCH_INTERVAL
+
+    def sendPunch(self, kind, addr):
+        try:
+            self.sendto(bytes((7, kind)), addr)
+        except BlockingIOError:
+            pass  # there will be another one
+
+    def localPort(self):
+        return self.sock.getsockname()[1]
+
+    def close(self, lastmsg=None):
+        if self.sock is None:
+            return
+
+        if lastmsg is not None:
+            self.flush()
+            try:
+                self.sock.sendto(lastmsg, self.server)
+            except OSError:
+                pass  # we are leaving anyway
+        self.sock.close()
+        self.sock = None
@@ -0,0 +1,313 @@
+import struct
+import numpy
+import src.botlib as botlib
+from settings import settings
+from src.setting import Setting
+from src.lockstep import prefsstruct, physicsPrefs
+from src.vector_env import VectorEnv
+
+'''
+Server-authoritative matches (AUTHORITATIVE in server.py). Normally, each game decides about hits on its own player, and believes the other game about the
+hits that its bullets dealt (Player.hitsdealt in the update packets). With a referee, both games also send the server what they pressed in every frame, the
+server simulates the match from those inputs, and what the server says about health and deaths goes. The server simulates all of its matches at once
+with VectorEnv, so that it is a few numpy operations per frame whether it referees one match or hundreds.
+
+The server announces this with mplib.refereed right after matching two players. Inputs go to the server itself, also when the players talk to each other
+directly. From then on, a game ignores the hits that the other game says it dealt, unless the server answers with VERDICT_UNREFEREED (so a game cannot
+get its hits believed by not sending inputs). Lockstep games (the Game.lockstep setting) do not need a referee: both games already simulate everything
+from the same inputs.
+The server's rules are VectorEnv's, which are the game's down to the pixel masks of the craft when they run into each other, so the server decides
+rounds the same way as the games do (bench/referee.py checks this).
+
+Packet type 8, inputs, from a client to the server:
+- inputsstruct:
+  - ubyte round number (mod 256), see mplib.rematchstruct
+  - uint  frame number of the first input in this packet, counting from the start of the round
+  - ubyte number of inputs
+- if the first input is for frame 0: the serialized settings and our lockstep.prefsstruct, so that the server knows the rules (we keep sending frame 0 until
+  the server has it)
+- the inputs: one botlib.toBitmask() byte per frame, for consecutive frames
+
+Packet type 9, status, from the server to a client, in answer to every type 8 packet and when the round is decided:
+- statusstruct:
+  - ubyte round number (mod 256)
+  - uint  ack: the number of frames for which the server has your inputs
+  - uint  the number of frames that the server simulated
+  - ubyte health of player 1 times 255
+  - ubyte health of player 2 times 255
+  - ubyte verdict: 0 while the round goes on, else who died: VERDICT_PLAYER1, VERDICT_PLAYER2 or VERDICT_TIE (both, also when they ran into each other),
+    or VERDICT_UNREFEREED if the server cannot referee this match (the players' rules differ, or it has no room), in which case the rest is meaningless
+'''
+inputsstruct = struct.Struct('>BIB')
+statusstruct = struct.Struct('>BIIBBB')
+VERDICT_PLAYER1 = 1
+VERDICT_PLAYER2 = 2
+VERDICT_TIE = 3
+VERDICT_UNREFEREED = 255
+
+MAX_INPUTS_PER_PACKET = 64
+
+
+def rulesSize():
+    # Of the serialized settings in a type 8 packet
+    return struct.calcsize(Setting.getStructFormat(settings))
+
+
+class Refereed:
+    # The client's side: keeps our inputs of this round until the server has them, and keeps what the server said about the round
+    SEND_INTERVAL = 2  # frames. Every other frame is plenty, the server only needs them before the other player's inputs for the same frame
+    MAX_WAIT = 600  # frames of doing nothing that we send after the round ended for us, see waitForVerdict
+
+    def __init__(self):
+        # Whether the server said that it does not referee us. Until it does, what the other game says about hits does not count, also when the
+        # server did not simulate anything yet: otherwise a game could turn the referee off by not sending its inputs.
+        self.declined = False
+        self.newRound(0)
+
+    def newRound(self, roundnumber):
+        self.round = roundnumber % 256
+        self.inputs = bytearray()  # our bitmask for every frame of the round so far
+        self.ack = 0  # the server has our inputs before this frame
+        self.frames = 0  # that the server simulated
+        self.health = (1, 1)  # of player 1 and 2, according to the server
+        self.verdict = 0
+        self.judged = False  # whether the game applied the verdict (see Game.applyStatus)
+        self.waited = 0  # frames since the round ended for us
+
+    def active(self):
+        # The server only simulates when it has both players' inputs. Until it does, we still judge the hits on ourselves, but see `declined`.
+        return self.frames > 0
+
+    def record(self, actions):
+        self.inputs.append(botlib.toBitmask(actions))
+
+    def send(self, connection):
+        first = self.ack
+        count = min(len(self.inputs) - first, MAX_INPUTS_PER_PACKET)
+        packet = b'\x08' + inputsstruct.pack(self.round, first, count)
+        if first == 0:
+            packet += Setting.serializeSettings(settings) + physicsPrefs()
+        connection.send(packet + self.inputs[first : first + count], connection.server)
+
+    def waitForVerdict(self, connection, framecounter):
+        # Call every frame after the round ended for us, until the server decided. Our game may be some frames behind the other player's (we started
+        # later, or the death that ended the round was theirs), and the server can only get to the frame in which they died with inputs from us for
+        # it, so we keep sending that we do nothing.
+        if self.waited >= Refereed.MAX_WAIT:
+            return  # the server must see the round differently; our own verdict stands
+        self.waited += 1
+        self.inputs.append(0)
+        if framecounter % Refereed.SEND_INTERVAL == 0:
+            self.send(connection)
+
+    def receive(self, msg):
+        # A status from the server. Returns whether it is about this round.
+        roundnumber, ack, frames, health1, health2, verdict = statusstruct.unpack_from(msg, 1)
+        if verdict == VERDICT_UNREFEREED:
+            self.declined = True
+            return False
+        if roundnumber != self.round:
+            return False
+        self.ack = max(self.ack, ack)
+        if frames >= self.frames:
+            self.frames = frames
+            self.health = (health1 / 255, health2 / 255)
+            self.verdict = verdict
+        return True
+
+
+class Match:
+    def __init__(self, players):
+        self.players = players  # addresses of player 1 and 2
+        self.round = 0
+        self.group = None  # the MatchGroup, once we know the rules
+        self.slot = None  # in the group's VectorEnv
+        self.verdict = 0
+        self.final = None  # (frames, health 1, health 2) when the round was decided, since VectorEnv restarts the match right after
+        self.unfit = False  # the players sent different rules, so there is nothing to referee
+
+
+class MatchGroup:
+    # The matches that are played by the same rules, in one VectorEnv. All per-match state is in arrays indexed by slot, so that a frame of all of them is
+    # one env.step() no matter how many are ready.
+
+    RING = 1024  # frames of inputs kept per player, so how far one player may get ahead of the other before we stop taking their inputs (they will resend)
+
+    def __init__(self, rules, capacity):
+        self.rules = rules
+        Setting.updateSettings(settings, rules)  # VectorEnv reads the player size from the settings
+        self.env = VectorEnv(capacity, max_frames=2 ** 62)  # rounds have no time limit
+        self.inputs = numpy.zeros((capacity, 2, MatchGroup.RING), dtype=numpy.uint8)
+        self.received = numpy.zeros((capacity, 2), dtype=numpy.int64)  # frames of the round for which we have each player's inputs
+        self.playing = numpy.zeros(capacity, dtype=bool)  # slots with a round that is not decided yet
+        self.slots = numpy.arange(capacity)
+        self.matches = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def allocate(self, match):
+        # Returns the slot, or None if the group is full
+        if len(self.free) == 0:
+            return None
+        slot = self.free.pop()
+        self.matches[slot] = match
+        return slot
+
+    def release(self, slot):
+        self.matches[slot] = None
+        self.playing[slot] = False
+        self.free.append(slot)
+
+
+class Referee:
+    # The server's side. Call receive() with every type 8 packet, which returns the status to answer with, and tick() regularly: it simulates every frame
+    # for which both players' inputs came in. The status in an answer is as of the last tick(), which is close enough for showing health.
+
+    MAX_FRAMES_PER_TICK = 60  # per match, so that a player who sends a burst of inputs cannot keep the server busy; the rest waits for the next tick
+
+    def __init__(self, capacity, metrics):
+        self.capacity = capacity  # matches per group
+        self.metrics = metrics
+        self.groups = {}  # rules: MatchGroup
+        self.matches = {}  # address of either player: Match
+        self.loaded = None  # the rules that `settings` currently has
+        self.decided = []  # matches whose round was decided since the last tick()
+
+    def addMatch(self, player1, player2):
+        match = Match((player1, player2))
+        self.matches[player1] = match
+        self.matches[player2] = match
+
+    def remove(self, addr):
+        match = self.matches.pop(addr, None)
+        if match is None:
+            return
+        for player in match.players:
+            self.matches.pop(player, None)
+        if match.group is not None:
+            match.group.release(match.slot)
+            if len(match.group.free) == self.capacity:
+                del self.groups[match.group.rules]
+                if self.loaded == match.group.rules:
+                    self.loaded = None
+        if match in self.decided:
+            self.decided.remove(match)
+
+    def load(self, group):
+        if self.loaded != group.rules:
+            Setting.updateSettings(settings, group.rules)
+            self.loaded = group.rules
+
+    def receive(self, addr, msg):
+        # Returns the status packet to send back, or None
+        match = self.matches.get(addr)
+        if match is None or len(msg) < 1 + inputsstruct.size:
+            return None
+        if match.unfit:
+            return Referee.declined()
+        p = match.players.index(addr)
+        roundnumber, first, count = inputsstruct.unpack_from(msg, 1)
+        offset = 1 + inputsstruct.size
+        if roundnumber != match.round:
+            if not 0 < (roundnumber - match.round) % 256 < 128:
+                return None  # from before a rematch
+            self.newRound(match, roundnumber)
+
+        if first == 0:
+            rules = msg[offset : offset + rulesSize()]
+            offset += len(rules)
+            physics = msg[offset : offset + prefsstruct.size]
+            offset += prefsstruct.size
+            if len(physics) < prefsstruct.size:
+                return None
+            if not self.setRules(match, p, rules, physics):
+                return Referee.declined()
+        if match.group is None:
+            return None  # we missed their first packet; they resend frame 0 until we ack it
+
+        group = match.group
+        slot = match.slot
+        have = int(group.received[slot, p])
+        end = min(first + count, int(group.env.frame[slot]) + MatchGroup.RING, first + len(msg) - offset)
+        if first <= have < end:
+            group.inputs[slot, p, numpy.arange(have, end) % MatchGroup.RING] = numpy.frombuffer(msg, numpy.uint8, end - have, offset + have - first)
+            group.received[slot, p] = end
+        return self.status(match, p)
+
+    def declined():
+        # The status that tells a player that we do not referee their match, so that their game goes by what the other game says about hits
+        return b'\x09' + statusstruct.pack(0, 0, 0, 255, 255, VERDICT_UNREFEREED)
+
+    def setRules(self, match, p, rules, physics):
+        # Returns whether this player plays by the rules of the match
+        if match.group is None:
+            group = self.groups.get(rules)
+            if group is None:
+                try:
+                    group = MatchGroup(rules, self.capacity)
+                except struct.error:
+                    match.unfit = True  # a game version with other settings than ours
+                    return False
+                self.loaded = rules
+                self.groups[rules] = group
+            slot = group.allocate(match)
+            if slot is None:
+                match.unfit = True
+                return False
+            match.group = group
+            match.slot = slot
+            self.newRound(match, match.round)
+        elif rules != match.group.rules:
+            match.unfit = True
+            return False
+
+        env = match.group.env
+        env.rotatespeed[match.slot, p], env.rotatespeedfine[match.slot, p], env.thrustfine[match.slot, p] = prefsstruct.unpack(physics)
+        return True
+
+    def newRound(self, match, roundnumber):
+        match.round = roundnumber
+        match.verdict = 0
+        match.final = None
+        if match.group is not None:
+            group = match.group
+            self.load(group)
+            group.env.reset([match.slot])
+            group.received[match.slot] = 0
+            group.playing[match.slot] = True
+
+    def status(self, match, p):
+        if match.final is not None:
+            frames, health1, health2 = match.final
+        else:
+            env = match.group.env
+            frames = int(env.frame[match.slot])
+            health1, health2 = env.health[match.slot].tolist()
+        ack = int(match.group.received[match.slot, p])
+        return b'\x09' + statusstruct.pack(match.round, ack, frames, round(health1 * 255), round(health2 * 255), match.verdict)
+
+    def tick(self):
+        # Simulates what we can and returns the verdicts to send right away, as (packet, address)
+        for group in self.groups.values():
+            self.simulate(group)
+
+        verdicts = [(self.status(match, p), match.players[p]) for match in self.decided for p in (0, 1)]
+        self.decided = []
+        return verdicts
+
+    def simulate(self, group):
+        env = group.env
+        for _ in range(Referee.MAX_FRAMES_PER_TICK):
+            ready = group.playing & (env.frame < group.received.min(axis=1))
+            if not ready.any():
+                return
+            self.load(group)
+            actions = group.inputs[group.slots, :, env.frame % MatchGroup.RING]
+            _, rewards, done = env.step(actions, ready)
+            self.metrics.refereedframes += int(numpy.count_nonzero(ready))
+            for slot in numpy.flatnonzero(done).tolist():
+                match = group.matches[slot]
+                match.verdict = VERDICT_TIE if rewards[slot, 0] == 0 else VERDICT_PLAYER1 if rewards[slot, 0] < 0 else VERDICT_PLAYER2
+                match.final = (int(env.frame[slot]), *env.health[slot].tolist())
+                group.playing[slot] = False
+                self.decided.append(match)
+                self.metrics.verdicts += 1
@@ -0,0 +1,173 @@
+import gzip, zlib, struct, bisect
+import numpy
+import src.botlib as botlib
+from settings import Setting, settings, prefs
+
+'''
+A replay is a gzipped stream of:
+- header: MAGIC, headerstruct, the serialized settings (Setting.serializeSettings)
+- records, each starting with a type byte:
+  - RECORD_FRAME: one botlib.toBitmask() byte per player with what they did this frame (2 bytes)
+  - RECORD_KEYFRAME: the full game state (keyframestruct, playerstruct per player, then the bullets as big-endian doubles x, y, xspeed, yspeed)
+    from right before the next frame is simulated. Written at the start of every round and every keyframe_interval frames.
+
+Frame numbers in a replay count simulated frames only, so they keep counting across rounds and do not include the time between rounds.
+'''
+
+MAGIC = b'PSpaceDuel replay'
+VERSION = 1
+
+RECORD_FRAME = 0
+RECORD_KEYFRAME = 1
+
+'''
+- ubyte  version
+- ushort keyframe interval
+- double Player.rotate_speed, Player.rotate_speed_fine, Player.thrust_factor_fine (preferences that influence the physics)
+- ushort length of the serialized settings that follow
+'''
+headerstruct = struct.Struct('>BHdddH')
+
+''' framecounter, score, number of bullets '''
+keyframestruct = struct.Struct('>IiI')
+
+''' x, y, xspeed, yspeed, angle, battery level, health, reload state '''
+playerstruct = struct.Struct('>8d')
+
+
+class ReplayWriter:
+    def __init__(self, filename, keyframe_interval=600):
+        self.file = gzip.open(filename, 'wb')
+        self.keyframe_interval = keyframe_interval
+        self.frame = 0
+        self.lastkeyframe = None
+        self.roundstarted = True
+
+        serializedSettings = Setting.serializeSettings(settings)
+        self.file.write(MAGIC + headerstruct.pack(
+            VERSION,
+            keyframe_interval,
+            prefs['Player.rotate_speed'],
+            prefs['Player.rotate_speed_fine'],
+            prefs['Player.thrust_factor_fine'],
+            len(serializedSettings),
+        ) + serializedSettings)
+
+    def recordFrame(self, game, actions):
+        # Call right before simulating a frame, with the list of actions for every player
+
+        if self.roundstarted or self.frame - self.lastkeyframe >= self.keyframe_interval:
+            self.file.flush()  # so that a replay of a game that was killed (e.g. Ctrl+C on a headless game) is readable up to here
+            self.file.write(bytes((RECORD_KEYFRAME, )) + packState(game.snapshot()))
+            self.lastkeyframe = self.frame
+            self.roundstarted = False
+
+        self.file.write(bytes((RECORD_FRAME, botlib.toBitmask(actions[0]), botlib.toBitmask(actions[1]))))
+        self.frame += 1
+
+    def newRound(self):
+        self.roundstarted = True
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayReader:
+    def __init__(self, filename):
+        # Replays are small enough to keep in memory, which also makes seeking cheap.
+        # Not using gzip.open() for reading because it refuses files that were not closed properly, and we want to play those up to where they end.
+        with open(filename, 'rb') as f:
+            data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(f.read())
+
+        if not data.startswith(MAGIC):
+            raise ValueError(f'{filename} is not a replay file')
+        offset = len(MAGIC)
+        version, self.keyframe_interval, rotate_speed, rotate_speed_fine, thrust_factor_fine, settingslength = headerstruct.unpack_from(data, offset)
+        if version != VERSION:
+            raise ValueError(f'{filename} is a version {version} replay, we can only read version {VERSION}')
+        offset += headerstruct.size
+
+        self.serializedSettings = data[offset : offset + settingslength]
+        self.prefs = {
+            'Player.rotate_speed': rotate_speed,
+            'Player.rotate_speed_fine': rotate_speed_fine,
+            'Player.thrust_factor_fine': thrust_factor_fine,
+        }
+        offset += settingslength
+
+        self.actions = []  # per frame: (bitmask player 1, bitmask player 2)
+        self.keyframes = {}  # frame number: state as returned by unpackState
+        while offset < len(data):
+            recordtype = data[offset]
+            offset += 1
+            try:
+                if recordtype == RECORD_FRAME:
+                    self.actions.append((data[offset], data[offset + 1]))
+                    offset += 2
+                elif recordtype == RECORD_KEYFRAME:
+                    state, offset = unpackState(data, offset)
+                    self.keyframes[len(self.actions)] = state
+                else:
+                    raise ValueError(f'Unknown record type {recordtype} at byte {offset - 1} of {filename}')
+            except (IndexError, struct.error):
+                print('Note: the replay ends abruptly, probably the game was not closed normally. Playing what we have.')
+                break
+
+        self.keyframeFrames = sorted(self.keyframes)
+        self.frame = 0
+
+    def applySettings(self):
+        # Makes the game run with the settings and preferences that the replay was recorded with
+        Setting.updateSettings(settings, self.serializedSettings)
+        prefs.update(self.prefs)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def next(self, game):
+        # Returns the actions of every player for the next frame, restoring the game state first if there is a keyframe, or None if the replay is over
+        if self.frame >= len(self.actions):
+            return None
+
+        if self.frame in self.keyframes:
+            game.restore(self.keyframes[self.frame])
+
+        a1, a2 = self.actions[self.frame]
+        self.frame += 1
+        return [botlib.fromBitmask(a1), botlib.fromBitmask(a2)]
+
+    def atKeyframe(self):
+        # Whether the next frame starts from a keyframe, e.g. the start of a new round
+        return self.frame in self.keyframes
+
+    def seek(self, game, frame):
+        # Restores the nearest keyframe before `frame` and simulates forward until the next call to next() would return that frame
+        frame = max(0, min(frame, len(self.actions) - 1))
+        self.frame = self.keyframeFrames[bisect.bisect_right(self.keyframeFrames, frame) - 1]
+        game.restore(self.keyframes[self.frame])
+        while self.frame < frame:
+            game.simulate(self.next(game))
+
+
+def packState(state):
+    framecounter, score, players, bullets = state
+    msg = keyframestruct.pack(framecounter, score, len(bullets))
+    for player in players:
+        msg += playerstruct.pack(*player)
+    return msg + bullets.astype('>f8').tobytes()
+
+
+def unpackState(data, offset):
+    # Returns the state and the offset right after it
+    framecounter, score, numbullets = keyframestruct.unpack_from(data, offset)
+    offset += keyframestruct.size
+    players = []
+    for _ in range(2):
+        players.append(playerstruct.unpack_from(data, offset))
+        offset += playerstruct.size
+    if len(data) < offset + (numbullets * 4 * 8):
+        raise IndexError('keyframe is cut off')
+    bullets = numpy.frombuffer(data, dtype='>f8', count=numbullets * 4, offset=offset).astype(float).reshape((numbullets, 4))
+    offset += numbullets * 4 * 8
+    return (framecounter, score, players, bullets), offset
+
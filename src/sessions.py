@@ -0,0 +1,54 @@
+import heapq, itertools
+
+class SessionTable:
+    # The server's clients, by address. Works like a dict of session dicts that each have a 'lastseen' key, plus expire() to drop the ones that have been quiet for too long.
+    #
+    # Expiry uses a heap of deadlines instead of looking at every session. Refreshing 'lastseen' is just a dict write; the heap is not touched then.
+    # When an entry reaches the top of the heap, we check the session's actual lastseen and either expire it or push it back with its new deadline.
+    # Each session therefore has one heap entry at a time, and expire() only costs something for sessions whose (old) deadline has passed.
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.sessions = {}
+        self.deadlines = []  # heap of (deadline, tiebreaker, addr, session)
+        self.counter = itertools.count()  # so that the heap never has to compare addresses or sessions
+
+    def __contains__(self, addr):
+        return addr in self.sessions
+
+    def __getitem__(self, addr):
+        return self.sessions[addr]
+
+    def __setitem__(self, addr, session):
+        self.sessions[addr] = session
+        heapq.heappush(self.deadlines, (session['lastseen'] + self.timeout, next(self.counter), addr, session))
+
+    def __delitem__(self, addr):
+        # The heap entry stays until its deadline, at which point expire() sees that it belongs to a session that is gone
+        del self.sessions[addr]
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def get(self, addr, default=None):
+        return self.sessions.get(addr, default)
+
+    def expire(self, now):
+        # Removes sessions whose lastseen is more than `timeout` seconds before `now` and returns their addresses
+        expired = []
+        while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+            deadline, _, addr, session = heapq.heappop(self.deadlines)
+            if self.sessions.get(addr) is not session:
+                continue  # removed (and maybe re-added as a new session) since this entry was pushed
+
+            if session['lastseen'] + self.timeout <= now:
+                del self.sessions[addr]
+                expired.append(addr)
+            else:
+                heapq.heappush(self.deadlines, (session['lastseen'] + self.timeout, next(self.counter), addr, session))
+
+        return expired
+
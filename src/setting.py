@@ -1,4 +1,5 @@
 import struct
+from src.frozen import Frozen
 
 class Setting:
     def getStructFormat(settings):
@@ -23,6 +24,14 @@ class Setting:
         rawvalues = struct.unpack(Setting.getStructFormat(settings), serializedSettings)
         for i, key in enumerate(sorted(settings.keys())):
             settings[key].val = settings[key].deserialize(rawvalues[i])
+        Setting.freeze(settings)
+
+
+    frozen = None  # a src.frozen.Frozen of the settings as of the last freeze(), which is what the simulation reads
+
+    def freeze(settings):
+        # Call this after changing any setting's .val yourself; updateSettings() already does. settings.py calls it once at startup.
+        Setting.frozen = Frozen(settings)
 
 
     def __init__(self, value, structtype, serialize=None, deserialize=None):
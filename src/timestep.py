@@ -0,0 +1,52 @@
+'''
+The main loop's clock: the simulation advances in ticks of Game.timeStep at a fixed rate of real time (Game.FPS times the playback speed), and
+drawing happens as often as the display allows, independently of that. This is the accumulator from "Fix Your Timestep!" (Glenn Fiedler): real
+time that passed is added up, and every tick takes Game.FPS-th of a second out of it. What remains is how far we are into the next tick, which
+the drawing code uses to show things in between two ticks (see alpha()).
+
+Because of this, a slow frame (a stall in pygame.display.flip(), a big blit) makes the next frame run more ticks instead of slowing the game down,
+and fast-forwarding draws only every so many ticks, so it costs what the physics cost and not what drawing costs.
+'''
+
+class FixedTimestep:
+    MAX_BEHIND = 0.25  # seconds. After a longer stall (such as dragging the window), we do not try to catch up but carry on from there, slower than real time
+
+    def __init__(self, tickrate, renderrate, now):
+        # tickrate: ticks per second, or float('inf') to run ticks for the whole frame (until it is time to draw). renderrate: frames drawn per second, at most.
+        self.setTickrate(tickrate)
+        self.renderinterval = 1 / renderrate
+        self.accumulator = 0  # seconds of real time that ticks have yet to simulate
+        self.last = now
+        self.framestart = now
+        self.ticks = 0  # in the current frame
+
+    def setTickrate(self, tickrate):
+        self.tickinterval = 0 if tickrate == float('inf') else 1 / tickrate
+
+    def startFrame(self, now):
+        # Clamped here as well as in due(): after a stall, due() would otherwise run every tick of it before its check of the time comes into play
+        self.accumulator += min(now - self.last, FixedTimestep.MAX_BEHIND)
+        self.last = now
+        self.framestart = now
+        self.ticks = 0
+
+    def due(self, now):
+        # Whether to run another tick before drawing this frame. Call until it returns False.
+        if now - self.framestart >= self.renderinterval and self.ticks > 0:
+            # The ticks took the whole frame: draw now, and drop what we cannot catch up on
+            self.accumulator = min(self.accumulator, FixedTimestep.MAX_BEHIND)
+            return False
+        if self.tickinterval == 0:
+            self.ticks += 1
+            return True
+        if self.accumulator < self.tickinterval:
+            return False
+        self.accumulator -= self.tickinterval
+        self.ticks += 1
+        return True
+
+    def alpha(self):
+        # How far (0-1) real time is between the last tick and the next one; draw things that far along to move smoothly at any frame rate
+        if self.tickinterval == 0:
+            return 1
+        return min(1, self.accumulator / self.tickinterval)
@@ -0,0 +1,254 @@
+import os, math
+import numpy
+import pygame
+import src.botlib as botlib
+from settings import settings, prefs
+from src.body import Body
+from src.setting import Setting
+from src.bullet_swarm import BulletSwarm
+
+class VectorEnv:
+    """
+    K independent bot-versus-bot matches that are advanced with one vectorized call, for training bots without a screen or a Python loop per match.
+
+    Player state lives in (K, 2) arrays (x, y, xspeed, yspeed, angle, battery, health, reload) where [:, 0] is player 1 and [:, 1] is player 2.
+    The bullets of all matches share one BulletSwarm, tagged with their match number.
+
+    Usage:
+        env = VectorEnv(64)
+        obs = env.reset()
+        while True:
+            obs, rewards, done = env.step(actions)  # actions: (K, 2) ints made with botlib.toBitmask()
+
+    The rules are those of client.py, except that both dying in the same frame is always a tie. Running into each other is pixel-exact like there, with
+    masks of the craft that are made with pygame at the start (see shipMasks).
+    A match that ends (or runs for more than max_frames) is reported in `done` once, with its final observation, and restarts on the next step. That step
+    ignores the match's actions, since they were decided from the final observation of the match that ended, so the observation it returns for the
+    match is the start of the new one, and the actions after that are its first frame.
+    step() can leave some matches as they are, for when not all matches are ready for their next frame (see src/referee.py).
+    The preferences that influence the physics (like Player.rotate_speed) are taken from prefs at the start, but can be set per match and player in rotatespeed, rotatespeedfine and thrustfine.
+    """
+
+    # Per player: x, y, xspeed, yspeed, angle, battery level (0-1), health (0-1), reload state. Observations contain these for the player itself followed by the opponent.
+    OBSERVATION_FIELDS = 8
+
+    def __init__(self, num_matches, screensize=(1900, 980), max_frames=18000):
+        self.num_matches = num_matches
+        self.screensize = screensize
+        self.max_frames = max_frames
+
+        shape = (num_matches, 2)
+        self.x = numpy.zeros(shape)
+        self.y = numpy.zeros(shape)
+        self.xspeed = numpy.zeros(shape)
+        self.yspeed = numpy.zeros(shape)
+        self.angle = numpy.zeros(shape)
+        self.battery = numpy.zeros(shape)
+        self.health = numpy.zeros(shape)
+        self.reload = numpy.zeros(shape)
+        self.rectx = numpy.zeros(shape)  # the center of the sprite's rect in the game, which stays put when the craft dies
+        self.recty = numpy.zeros(shape)
+        self.frame = numpy.zeros(num_matches, dtype=numpy.int64)
+        self.needsreset = numpy.zeros(num_matches, dtype=bool)
+        self.bullets = BulletSwarm()
+        self.rotatespeed = numpy.full(shape, float(prefs['Player.rotate_speed']))
+        self.rotatespeedfine = numpy.full(shape, float(prefs['Player.rotate_speed_fine']))
+        self.thrustfine = numpy.full(shape, float(prefs['Player.thrust_factor_fine']))
+
+        # Same derivation as Player.__init__ does from the sprite
+        width = numpy.zeros(2, dtype=int)
+        height = numpy.zeros(2, dtype=int)
+        self.masks = []
+        for p in range(2):
+            masks = VectorEnv.shipMasks(p + 1)
+            height[p], width[p] = masks[0].shape
+            self.masks.append(masks[1 : ])
+        self.rotatedMaxSize = numpy.maximum(width, height)
+        self.collisionRadius = 0.5 * numpy.sqrt(width * width + height * height)
+        self.wellRadius = ((width / 2) + (height / 2)) / 2
+        # Where the middle of each rotated mask is relative to the center of the sprite's rect, which has the size of the unrotated image (the game
+        # puts a mask's top left corner at the rect's, and pygame's rect.center works out the top left corner by rounding half the size down)
+        self.maskmiddlex = numpy.array([[(mask.shape[1] / 2) - (width[p] // 2) for mask in self.masks[p]] for p in range(2)])
+        self.maskmiddley = numpy.array([[(mask.shape[0] / 2) - (height[p] // 2) for mask in self.masks[p]] for p in range(2)])
+        self.halfwidth = width // 2
+        self.halfheight = height // 2
+
+    def shipMasks(n):
+        # The mask of player n's craft unrotated, followed by the masks of the craft rotated by every whole degree (like Player.updateRotatedSprite
+        # caches them), as boolean arrays indexed [y, x]. Only loading, scaling and rotating images, which pygame can do without a screen.
+        img = pygame.image.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'res', f'player{n}.png'))
+        rect = img.get_rect()
+        img = pygame.transform.scale(img, (int(round(rect.width * settings['Player.scale'].val)), int(round(rect.height * settings['Player.scale'].val))))
+        masks = [numpy.ones(img.get_size()[ : : -1], dtype=bool)]
+        for angle in range(360):
+            # pygame.mask.from_surface sets the pixels that are more than half opaque
+            masks.append(pygame.surfarray.array_alpha(pygame.transform.rotate(img, angle)).T > 127)
+        return masks
+
+    def collidedMatches(self, active):
+        # Like collide_mask between the two players in the game, for every match: which ones the craft overlap in. Only the matches where the circles
+        # around the two masks overlap get the pixel test, since a mask's pixels all lie within collisionRadius of the mask's middle.
+        angles = self.angle.astype(numpy.intp)
+        middlex = [self.rectx[:, p] + self.maskmiddlex[p][angles[:, p]] for p in range(2)]
+        middley = [self.recty[:, p] + self.maskmiddley[p][angles[:, p]] for p in range(2)]
+        dx = middlex[1] - middlex[0]
+        dy = middley[1] - middley[0]
+        reach = self.collisionRadius[0] + self.collisionRadius[1] + 1  # +1 for rounding
+        collided = numpy.zeros(self.num_matches, dtype=bool)
+        for m in numpy.flatnonzero(active & ((dx * dx) + (dy * dy) <= reach * reach)).tolist():
+            a = self.masks[0][angles[m, 0]]
+            b = self.masks[1][angles[m, 1]]
+            # b's top left corner relative to a's
+            ox = int((self.rectx[m, 1] - self.halfwidth[1]) - (self.rectx[m, 0] - self.halfwidth[0]))
+            oy = int((self.recty[m, 1] - self.halfheight[1]) - (self.recty[m, 0] - self.halfheight[0]))
+            top, bottom = max(0, oy), min(a.shape[0], oy + b.shape[0])
+            left, right = max(0, ox), min(a.shape[1], ox + b.shape[1])
+            if top < bottom and left < right:
+                collided[m] = (a[top : bottom, left : right] & b[top - oy : bottom - oy, left - ox : right - ox]).any()
+        return collided
+
+    def reset(self, matches=None):
+        # Restarts the given match numbers (default: all) and returns the observations of all matches
+        if matches is None:
+            matches = numpy.arange(self.num_matches)
+
+        for p in range(2):
+            self.x[matches, p] = settings[f'Player{p + 1}.x'].val
+            self.y[matches, p] = settings[f'Player{p + 1}.y'].val
+            self.xspeed[matches, p] = settings[f'Player{p + 1}.xspeed'].val
+            self.yspeed[matches, p] = settings[f'Player{p + 1}.yspeed'].val
+        self.rectx[matches] = numpy.rint(self.x[matches])
+        self.recty[matches] = numpy.rint(self.y[matches])
+        self.angle[matches] = 0
+        self.battery[matches] = settings['Player.battSize'].val
+        self.health[matches] = 1
+        self.reload[matches] = 0
+        self.frame[matches] = 0
+        self.needsreset[matches] = False
+        self.bullets.removeMatches(matches)
+
+        return self.observe()
+
+    def observe(self):
+        own = numpy.stack((
+            self.x,
+            self.y,
+            self.xspeed,
+            self.yspeed,
+            self.angle,
+            self.battery / Setting.frozen.battSize,
+            self.health,
+            self.reload,
+        ), axis=2)
+        return numpy.concatenate((own, own[:, ::-1]), axis=2)
+
+    def step(self, actions, active=None):
+        # actions: (K, 2) array of botlib.toBitmask() values. Returns (observations, rewards, done) with shapes (K, 2, 16), (K, 2) and (K,).
+        # active: optionally a (K,) boolean array of the matches to advance; the others stay as they are and are never done.
+
+        actions = numpy.asarray(actions)
+        if active is None:
+            active = numpy.ones(self.num_matches, dtype=bool)
+        else:
+            active = numpy.asarray(active, dtype=bool)
+
+        if self.needsreset.any():
+            # these only restart in this step (see the class comment)
+            active = active & ~self.needsreset
+            self.reset(numpy.flatnonzero(self.needsreset))
+
+        if not active.all():
+            actions = numpy.where(active[:, None], actions, 0)  # so an inactive match does not thrust, shoot or rotate; the rest of the step leaves it alone too
+        bit = lambda action: (actions & (1 << (action.value - botlib.Action.SHOOT.value))) != 0
+
+        frozen = Setting.frozen
+
+        # Player.perform_actions: thrust, then shoot, then rotate
+        finefactor = numpy.where(bit(botlib.Action.THRUST), 1, numpy.where(bit(botlib.Action.THRUST_FINE), self.thrustfine, 0))
+        energyNeeded = frozen.thrustEnergy * finefactor
+        thrusting = (finefactor > 0) & (self.battery > energyNeeded)
+        dv = numpy.where(thrusting, frozen.thrustDv / frozen.playerMass * finefactor, 0)
+        self.xspeed += dv * numpy.cos((self.angle + 90) / 180 * math.pi)
+        self.yspeed += dv * numpy.sin((self.angle - 90) / 180 * math.pi)
+        self.battery -= numpy.where(thrusting, energyNeeded, 0)
+
+        shooting = bit(botlib.Action.SHOOT) & (self.reload <= 0) & (self.battery > frozen.kjPerShot)
+        self.reload += numpy.where(shooting, frozen.reloadFrames, 0)
+        self.battery -= numpy.where(shooting, frozen.kjPerShot, 0)
+        for p in range(2):
+            shooters = numpy.flatnonzero(shooting[:, p])
+            if len(shooters) == 0:
+                continue
+            angle = self.angle[shooters, p]
+            dirx = numpy.cos((angle + 90) / 180 * math.pi)
+            diry = numpy.sin((angle - 90) / 180 * math.pi)
+            if frozen.bulletRelspeed:
+                xspeed = self.xspeed[shooters, p] + frozen.bulletSpeed * dirx
+                yspeed = self.yspeed[shooters, p] + frozen.bulletSpeed * diry
+            else:
+                xspeed = frozen.bulletSpeed * dirx
+                yspeed = frozen.bulletSpeed * diry
+            self.bullets.addMany(self.x[shooters, p] + self.rotatedMaxSize[p] * dirx, self.y[shooters, p] + self.rotatedMaxSize[p] * diry, xspeed, yspeed, shooters)
+
+        coarse = self.rotatespeed
+        fine = self.rotatespeedfine
+        rotation = numpy.where(bit(botlib.Action.ROTATE_LEFT_FINE), fine,
+                   numpy.where(bit(botlib.Action.ROTATE_RIGHT_FINE), -fine,
+                   numpy.where(bit(botlib.Action.ROTATE_RIGHT), -coarse,
+                   numpy.where(bit(botlib.Action.ROTATE_LEFT), coarse, 0))))
+        rotating = (rotation != 0) & (self.battery > numpy.abs(rotation) / frozen.rotPerKj)
+        self.battery -= numpy.where(rotating, numpy.abs(rotation) / frozen.rotPerKj, 0)
+        self.angle = numpy.where(rotating, (self.angle + rotation) % 360, self.angle)
+
+        # Game.simulate: bullets, then hits (against the rounded sprite position), then Player.update
+        self.bullets.advance(self.screensize, active)
+        for p in range(2):
+            hitmatches = self.bullets.collideMatches(numpy.rint(self.x[:, p]), numpy.rint(self.y[:, p]), self.collisionRadius[p], active, self.xspeed[:, p], self.yspeed[:, p])
+            if len(hitmatches) > 0:
+                numpy.subtract.at(self.health[:, p], hitmatches, frozen.bulletDamage)
+                numpy.maximum(self.health[:, p], 0, out=self.health[:, p])
+
+        died = (self.health <= 0) & active[:, None]
+        alive = ~died & active[:, None]
+
+        self.reload -= numpy.where(alive & (self.reload > frozen.minReloadFrames), 1, 0)
+
+        # Body.advance
+        separation = Body.advanceMany(self.x, self.y, self.xspeed, self.yspeed, alive)
+        separation -= frozen.gwRadius
+
+        fell = alive & (separation < self.wellRadius)
+        died |= fell
+        moving = alive & ~fell
+
+        edge = frozen.visiblepx
+        halfw = self.screensize[0] / 2
+        halfh = self.screensize[1] / 2
+        wrap = moving & ((self.x < edge - halfw) | (self.x > halfw - edge))
+        self.x = numpy.where(wrap, numpy.where(self.x < 0, halfw - edge, edge - halfw), self.x)
+        self.y = numpy.where(wrap, -self.y, self.y)
+        wrap = moving & ((self.y < edge - halfh) | (self.y > halfh - edge))
+        self.y = numpy.where(wrap, numpy.where(self.y < 0, halfh - edge, edge - halfh), self.y)
+        self.x = numpy.where(wrap, -self.x, self.x)
+
+        self.rectx = numpy.where(moving, numpy.rint(self.x), self.rectx)
+        self.recty = numpy.where(moving, numpy.rint(self.y), self.recty)
+
+        radiative_power = frozen.gwRadiation / (separation * separation) * 1000
+        self.battery = numpy.where(moving, numpy.minimum(frozen.battSize, self.battery + radiative_power), self.battery)
+
+        collided = self.collidedMatches(active)
+
+        self.frame += active
+        timeout = active & (self.frame >= self.max_frames)
+
+        # Like in the game, running into each other is a tie. Unlike the game, which reports whichever death it processed last, both dying in the same frame is a tie as well.
+        tie = collided | timeout | (died[:, 0] & died[:, 1])
+        rewards = numpy.zeros((self.num_matches, 2))
+        rewards[:, 0] = numpy.where(tie, 0, numpy.where(died[:, 1], 1, numpy.where(died[:, 0], -1, 0)))
+        rewards[:, 1] = -rewards[:, 0]
+        done = tie | died[:, 0] | died[:, 1]
+        self.needsreset = done
+
+        return self.observe(), rewards, done
+